@@ -0,0 +1,69 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Benchmark persistent pooled HTTP sessions in the API bindings
+
+Compare the number of `node.get` requests per second with the shared
+connection pool against creating a new session for every request, which is
+what the bindings used to do.  The pooled session is then measured again
+with the request metrics enabled.
+"""
+
+import argparse
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+import kernelci.api
+import kernelci.config.api
+
+from .standin import StandInServer
+
+
+def _one_shot_get(api, path):
+    """Reproduce the previous behaviour with a new session per request"""
+    adapter = HTTPAdapter(max_retries=Retry(total=5, backoff_factor=1))
+    session = requests.Session()
+    session.mount('http://', adapter)
+    resp = session.get(api.make_url(path), timeout=api.data.timeout)
+    resp.raise_for_status()
+    return resp
+
+
+def _run(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    """Run the benchmark and print the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--count', type=int, default=2000,
+                        help="Number of requests for each run")
+    args = parser.parse_args()
+
+    server = StandInServer().start()
+    try:
+        config = kernelci.config.api.API('standin', server.url)
+        api = kernelci.api.get_api(config)
+        node = api.node.add({'name': 'checkout'})
+        path = f"node/{node['id']}"
+        one_shot = _run(lambda: _one_shot_get(api, path), args.count)
+        pooled = _run(lambda: api.node.get(node['id']), args.count)
+        api.enable_metrics()
+        metrics = _run(lambda: api.node.get(node['id']), args.count)
+        api.close()
+    finally:
+        server.stop()
+
+    print(f"new session per request: {one_shot:9.1f} req/s")
+    print(f"pooled session:          {pooled:9.1f} req/s")
+    print(f"speedup:                 {pooled / one_shot:9.2f}x")
+    print(f"pooled with metrics:     {metrics:9.1f} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Replay recorded node events through the pipeline scheduler logic
+
+Feed a JSONL recording of node events, with one node per line as received by
+the pipeline scheduler, through Scheduler.get_schedule(),
+APIHelper.should_create_node() and APIHelper.create_job_node() with the API
+replaced by an in-memory stand-in.  All the recorded nodes are loaded in the
+stand-in first so their ancestors can be looked up.  Runtimes are replaced
+with stand-ins too, and default platforms are added for any platform names
+used by the scheduler entries but not defined in the configs.
+
+A synthetic recording can be generated from the scheduler entries when no
+real one is available, for example:
+
+  python3 -m benchmarks.replay -g 1000 events.jsonl
+  python3 -m benchmarks.replay --scale 10 --profile events.jsonl
+
+The sample configuration in benchmarks/pipeline.yaml is used by default.
+"""
+
+import argparse
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import random
+import time
+
+import kernelci.api.helper
+import kernelci.config
+import kernelci.scheduler
+from kernelci.config.platform import Platform
+
+from .standin import MemoryAPI
+
+TREES = [
+    ('mainline', 'master', (6, 15)),
+    ('next', 'master', (6, 16)),
+    ('stable', 'linux-6.6.y', (6, 6)),
+    ('stable', 'linux-5.15.y', (5, 15)),
+]
+
+ARCHS = ['arm', 'arm64', 'riscv', 'x86_64']
+
+DEFCONFIGS = ['defconfig', 'allnoconfig', 'multi_v7_defconfig']
+
+
+class ReplayRuntime:
+    """Runtime stand-in with only a configuration"""
+
+    def __init__(self, config):
+        self._config = config
+
+    @property
+    def config(self):
+        """Runtime configuration object"""
+        return self._config
+
+    def get_load(self):
+        """Runtimes stand-ins don't report any load"""
+        return None
+
+
+def _load_configs(path):
+    configs = kernelci.config.load(path)
+    for key in ('jobs', 'platforms', 'runtimes'):
+        configs.setdefault(key, {})
+    configs.setdefault('scheduler', [])
+    names = {runtime.lab_type for runtime in configs['runtimes'].values()}
+    for entry in configs['scheduler']:
+        names.update(entry.platforms)
+    for name in names - set(configs['platforms']):
+        configs['platforms'][name] = Platform(name)
+    return configs
+
+
+def _make_checkout(node_id, treeid, tree, branch, version):
+    return {
+        'id': node_id,
+        'kind': 'checkout',
+        'name': 'checkout',
+        'path': ['checkout'],
+        'group': None,
+        'parent': None,
+        'treeid': treeid,
+        'state': 'available',
+        'result': None,
+        'data': {
+            'kernel_revision': {
+                'tree': tree,
+                'branch': branch,
+                'version': {'version': version[0], 'patchlevel': version[1]},
+            },
+        },
+    }
+
+
+def _make_node(rand, node_id, criteria, checkouts):
+    if criteria.get('kind') == 'checkout':
+        checkout = _make_checkout(node_id, f'{node_id:0>32}',
+                                  *rand.choice(TREES))
+        checkouts.append(checkout)
+        return checkout
+    # Pick one of the most recent checkouts, as a pipeline would
+    checkout = rand.choice(checkouts[-len(TREES):])
+    name = criteria.get('name', 'kbuild')
+    return {
+        'id': node_id,
+        'kind': criteria.get('kind', 'kbuild'),
+        'name': name,
+        'path': checkout['path'] + [name],
+        'group': name,
+        'parent': checkout['id'],
+        'treeid': checkout['treeid'],
+        'state': criteria.get('state', 'done'),
+        'result': criteria.get('result', 'pass'),
+        'data': {
+            'kernel_revision': checkout['data']['kernel_revision'],
+            'arch': rand.choice(ARCHS),
+            'defconfig': rand.choice(DEFCONFIGS),
+            'fragments': rand.sample(['lab-setup', 'kselftest', 'debug'], 2),
+        },
+    }
+
+
+def _generate(configs, count, seed):
+    """Generate node events matching the scheduler entries criteria"""
+    rand = random.Random(seed)
+    checkouts = [
+        _make_checkout(f'c{idx:023x}', f'{idx:032x}', *tree)
+        for idx, tree in enumerate(TREES)
+    ]
+    criteria = [entry.event for entry in configs['scheduler']] or [{}]
+    yield from checkouts
+    for idx in range(count):
+        yield _make_node(rand, f'{idx:024x}', rand.choice(criteria),
+                         checkouts)
+
+
+def _replay(scheduler, helper, events, index):
+    """Run all the events and return the number of decisions made"""
+    decisions = created = 0
+    for node in events:
+        candidates = helper.get_index_candidates(node)
+        for job, runtime, platform, rules in scheduler.get_schedule(
+                node, node=node if index else None):
+            decisions += 1
+            if not helper.should_create_node(rules, node):
+                continue
+            if helper.create_job_node(job, node, runtime, platform,
+                                      candidates=candidates):
+                scheduler.job_created(runtime)
+                created += 1
+    return decisions, created
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('recording', help="Path to the JSONL events file")
+    parser.add_argument('-c', '--yaml-config',
+                        default='benchmarks/pipeline.yaml',
+                        help="Path to the YAML pipeline configuration")
+    parser.add_argument('--scale', type=int, default=1,
+                        help="Repeat the scheduler entries SCALE times")
+    parser.add_argument('-g', '--generate', type=int, metavar='COUNT',
+                        help="Write a synthetic recording with COUNT events")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Random seed for the synthetic recording")
+    parser.add_argument('--no-index', action='store_true',
+                        help="Don't pre-filter jobs with the scheduler index")
+    parser.add_argument('--profile', action='store_true',
+                        help="Print a profile of the replay")
+    parser.add_argument('--top', type=int, default=25,
+                        help="Number of functions to show in the profile")
+    return parser.parse_args()
+
+
+def _setup(configs, events):
+    """Get the Scheduler and APIHelper objects with all the stand-ins"""
+    api = MemoryAPI()
+    for node in events:
+        api.node.add(node)
+    runtimes = {
+        name: ReplayRuntime(config)
+        for name, config in configs['runtimes'].items()
+    }
+    scheduler = kernelci.scheduler.Scheduler(configs, runtimes)
+    return scheduler, kernelci.api.helper.APIHelper(api)
+
+
+def main():
+    """Run the replay and print the results"""
+    args = _parse_args()
+    configs = _load_configs(args.yaml_config)
+    configs['scheduler'] = configs['scheduler'] * args.scale
+    if args.generate:
+        with open(args.recording, 'w', encoding='utf-8') as recording:
+            for node in _generate(configs, args.generate, args.seed):
+                recording.write(json.dumps(node) + '\n')
+
+    with open(args.recording, encoding='utf-8') as recording:
+        events = [json.loads(line) for line in recording if line.strip()]
+    scheduler, helper = _setup(configs, events)
+
+    profile = cProfile.Profile() if args.profile else None
+    # Rules print a message for each rejected node
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        if profile:
+            profile.enable()
+        start = time.perf_counter()
+        decisions, created = _replay(scheduler, helper, events,
+                                     not args.no_index)
+        duration = time.perf_counter() - start
+        if profile:
+            profile.disable()
+
+    print(f"scheduler entries: {len(configs['scheduler']):9d}")
+    print(f"events:            {len(events):9d}")
+    print(f"events/s:          {len(events) / duration:9.1f}")
+    print(f"decisions/event:   {decisions / len(events):9.2f}")
+    print(f"created/event:     {created / len(events):9.2f}")
+    if profile:
+        print()
+        pstats.Stats(profile).sort_stats('cumulative').print_stats(args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Benchmark the submission of a large hierarchy of test results
+
+Submit a synthetic hierarchy of results, such as the ones sent by LTP or
+kselftest jobs with thousands of test cases, to the stand-in API first as a
+single request with APIHelper.submit_results() and then in chunks with
+APIHelper.submit_results_chunked().  The total time, the number of requests
+and the size of the largest one are reported for each method, along with the
+peak memory allocated on the client side with --memory.
+"""
+
+import argparse
+import copy
+import time
+import tracemalloc
+
+import kernelci.api
+import kernelci.api.helper
+import kernelci.config.api
+
+from .standin import StandInServer
+
+
+def _make_results(suites, tests):
+    return {
+        'node': {'name': 'ltp', 'result': 'pass', 'artifacts': {}},
+        'child_nodes': [
+            {
+                'node': {'name': f'suite-{suite}', 'result': 'pass'},
+                'child_nodes': [
+                    {
+                        'node': {
+                            'name': f'test-{test}',
+                            'result': 'pass',
+                            'data': {'log_line': test},
+                        },
+                        'child_nodes': [],
+                    }
+                    for test in range(tests)
+                ],
+            }
+            for suite in range(suites)
+        ],
+    }
+
+
+def _run(server, func, results, root, memory):
+    results, root = copy.deepcopy(results), copy.deepcopy(root)
+    server.requests = server.largest_request = 0
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    func(results, root)
+    duration = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if memory else 0
+    tracemalloc.stop()
+    return duration, server.requests, server.largest_request, peak
+
+
+def main():
+    """Run the benchmark and print the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--suites', type=int, default=50,
+                        help="Number of test suites")
+    parser.add_argument('--tests', type=int, default=1000,
+                        help="Number of tests in each suite")
+    parser.add_argument('--max-nodes', type=int, default=1000,
+                        help="Maximum number of nodes in each chunk")
+    parser.add_argument('--memory', action='store_true',
+                        help="Trace the peak memory, which is much slower")
+    args = parser.parse_args()
+
+    server = StandInServer().start()
+    try:
+        config = kernelci.config.api.API('standin', server.url, timeout=600)
+        api = kernelci.api.get_api(config)
+        helper = kernelci.api.helper.APIHelper(api)
+        root = api.node.add({
+            'name': 'ltp', 'kind': 'job', 'path': ['checkout', 'ltp'],
+            'parent': None, 'data': {},
+        })
+        results = _make_results(args.suites, args.tests)
+        single = _run(server, helper.submit_results, results, root,
+                      args.memory)
+        chunked = _run(server, lambda results, root: (
+            helper.submit_results_chunked(
+                results, root, max_nodes=args.max_nodes
+            )
+        ), results, root, args.memory)
+        api.close()
+    finally:
+        server.stop()
+
+    print(f"tests:               {args.suites * args.tests:9d}")
+    for name, (duration, count, largest, peak) in [
+            ("single request:", single), ("chunked:", chunked)]:
+        print(f"{name:20} {duration:9.2f} s, {count:5d} requests, "
+              f"largest {largest / 1024:9.1f} KiB", end='')
+        print(f", peak memory {peak / 1024 / 1024:7.1f} MiB"
+              if args.memory else '')
+
+
+if __name__ == '__main__':
+    main()
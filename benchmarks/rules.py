@@ -0,0 +1,81 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Benchmark node creation rules evaluation
+
+Evaluate all the rules found in the job, platform, runtime and scheduler
+configs with APIHelper.should_create_node(), first with the rules
+dictionaries parsed on each call and then with the RuleSet objects compiled
+when loading the configs.  The path to a real pipeline YAML configuration
+such as config/pipeline.yaml from kernelci-pipeline needs to be provided,
+so the results reflect the actual number and kind of rules.
+"""
+
+import argparse
+import contextlib
+import os
+import time
+
+import kernelci.api
+import kernelci.api.helper
+import kernelci.config
+import kernelci.config.api
+
+NODE = {
+    'id': '6332d92f1a45d41c279e7a06',
+    'parent': None,
+    'data': {
+        'kernel_revision': {
+            'tree': 'mainline',
+            'branch': 'master',
+            'version': {'version': 6, 'patchlevel': 15},
+        },
+        'arch': 'arm64',
+        'defconfig': 'defconfig',
+        'fragments': ['kselftest', 'lab-setup'],
+    },
+}
+
+
+def _get_rules(configs):
+    objs = list(configs.get('jobs', {}).values())
+    objs.extend(configs.get('platforms', {}).values())
+    objs.extend(configs.get('runtimes', {}).values())
+    objs.extend(configs.get('scheduler', []))
+    return [(obj.rules, obj.ruleset) for obj in objs if obj.rules]
+
+
+def _run(helper, rules, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        for item in rules:
+            helper.should_create_node(item, NODE)
+    return count * len(rules) / (time.perf_counter() - start)
+
+
+def main():
+    """Run the benchmark and print the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-c', '--yaml-config', required=True,
+                        help="Path to the YAML pipeline configuration")
+    parser.add_argument('-n', '--count', type=int, default=2000,
+                        help="Number of times to evaluate each rule")
+    args = parser.parse_args()
+
+    rules = _get_rules(kernelci.config.load(args.yaml_config))
+    if not rules:
+        parser.error(f"No rules found in {args.yaml_config}")
+    api = kernelci.api.get_api(kernelci.config.api.API('bench', 'http://.'))
+    helper = kernelci.api.helper.APIHelper(api)
+    # Rules print a message for each rejected node
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        parsed = _run(helper, [item for item, _ in rules], args.count)
+        compiled = _run(helper, [item for _, item in rules], args.count)
+    print(f"rules:             {len(rules):9d}")
+    print(f"parsed each time:  {parsed:9.1f} evaluations/s")
+    print(f"compiled RuleSet:  {compiled:9.1f} evaluations/s")
+    print(f"speedup:           {compiled / parsed:9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Minimal local stand-ins for the KernelCI API used by benchmarks
+
+StandInServer only implements the few endpoints needed to exercise the
+client-side bindings in `kernelci.api` with real HTTP traffic over the
+loopback interface.  MemoryAPI replaces the API object altogether to measure
+the client-side logic alone.  Nodes are kept in memory and never persisted.
+"""
+
+import json
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """HTTP request handler for the API stand-in"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    @property
+    def store(self):
+        """Shared in-memory node store"""
+        return self.server.store
+
+    def _send_json(self, data, status=200):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.server.requests += 1
+        self.server.largest_request = max(self.server.largest_request, length)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _split(self):
+        url = urllib.parse.urlsplit(self.path)
+        parts = url.path.strip('/').split('/')[1:]  # drop the API version
+        query = dict(urllib.parse.parse_qsl(url.query))
+        return parts, query
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle GET requests"""
+        parts, query = self._split()
+        if parts[:1] == ['node'] and len(parts) == 2:
+            node = self.store.get(parts[1])
+            if node is None:
+                self._send_json({'detail': 'Not found'}, 404)
+            else:
+                self._send_json(node)
+        elif parts == ['nodes']:
+            offset = int(query.pop('offset', 0))
+            limit = int(query.pop('limit', 100))
+            nodes = self.server.find(query)
+            self._send_json({'items': nodes[offset:offset + limit]})
+        elif parts == ['count']:
+            self._send_json(len(self.server.find(query)))
+        else:
+            self._send_json({'message': 'KernelCI API stand-in'})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handle POST requests"""
+        parts, _ = self._split()
+        if parts == ['node']:
+            self._send_json(self.server.add(self._read_json()))
+        else:
+            self._read_json()
+            self._send_json({})
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        """Handle PUT requests"""
+        parts, _ = self._split()
+        data = self._read_json()
+        if parts[:1] == ['node'] and len(parts) == 2:
+            self.store[parts[1]] = data
+        elif parts[:1] == ['nodes'] and len(parts) == 2:
+            self._send_json(self.server.add_hierarchy(data))
+            return
+        self._send_json(data)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the in-memory node store
+
+    An artificial `delay` in seconds can be added to every response to
+    simulate the latency of a remote API.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), delay=0.0):
+        super().__init__(address, StandInHandler)
+        self.store = {}
+        self.delay = delay
+        self.requests = 0
+        self.largest_request = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to use in the API configuration"""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def add(self, node):
+        """Add a node to the store and return it with a new id"""
+        with self._lock:
+            node = dict(node, id=f'{len(self.store):024x}')
+            self.store[node['id']] = node
+        return node
+
+    def add_hierarchy(self, hierarchy):
+        """Update a node and add its child nodes, and return all of them"""
+        node = hierarchy['node']
+        self.store[node['id']] = node
+        nodes = [node]
+        for child in hierarchy['child_nodes']:
+            child = dict(child, node=dict(child['node'], parent=node['id']))
+            nodes.extend(self.add_hierarchy(dict(
+                child, node=self.add(child['node'])
+            )))
+        return nodes
+
+    def find(self, attributes):
+        """Find nodes with top-level attributes matching exactly"""
+        return [
+            node for node in self.store.values()
+            if all(str(node.get(key)) == value
+                   for key, value in attributes.items())
+        ]
+
+    def start(self):
+        """Start serving requests in a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and close the socket"""
+        self.shutdown()
+        self.server_close()
+
+
+class MemoryNodes:
+    """In-memory replacement for the API node methods
+
+    Nodes are also indexed by tree id and name to look up ancestors without
+    scanning all the nodes.
+    """
+
+    def __init__(self):
+        self.store = {}
+        self._trees = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _match(cls, node, key, value):
+        if key.endswith('__re'):
+            return re.match(value, str(node.get(key[:-4]))) is not None
+        return node.get(key) == value
+
+    def _get_candidates(self, attributes):
+        if 'treeid' not in attributes:
+            return list(self.store.values())
+        names = self._trees.get(attributes['treeid'], {})
+        if 'name' in attributes:
+            return list(names.get(attributes['name'], []))
+        if 'name__re' in attributes:
+            pattern = re.compile(attributes['name__re'])
+            return [
+                node for name, nodes in names.items()
+                if pattern.match(str(name)) for node in nodes
+            ]
+        return [node for nodes in names.values() for node in nodes]
+
+    def get(self, node_id):
+        """Get a node by id"""
+        return self.store[node_id]
+
+    def find(self, attributes, offset=None, limit=None):
+        """Find nodes with top-level attributes matching the query"""
+        nodes = [
+            node for node in self._get_candidates(attributes)
+            if all(self._match(node, key, value)
+                   for key, value in attributes.items())
+        ]
+        offset = offset or 0
+        return nodes[offset:offset + limit] if limit else nodes[offset:]
+
+    def findfast(self, attributes):
+        """Find nodes, same as find()"""
+        return self.find(attributes)
+
+    def add(self, node):
+        """Add a node to the store and return it with a new id if needed"""
+        with self._lock:
+            node = dict(node)
+            node.setdefault('id', f'{len(self.store):024x}')
+            self.store[node['id']] = node
+            self._trees.setdefault(node.get('treeid'), {}).setdefault(
+                node.get('name'), []).append(node)
+        return node
+
+    def add_many(self, nodes):
+        """Add several nodes"""
+        return [self.add(node) for node in nodes]
+
+    def update(self, node, noevent=False):  # pylint: disable=unused-argument
+        """Update an existing node"""
+        self.store[node['id']].update(node)
+        return node
+
+
+class MemoryAPI:  # pylint: disable=too-few-public-methods
+    """In-memory replacement for the API object used by APIHelper"""
+
+    def __init__(self):
+        self.node = MemoryNodes()
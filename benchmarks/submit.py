@@ -0,0 +1,110 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Benchmark the round trips made by APIHelper.submit_results()
+
+Measure the time taken by each results submission as done by a runtime
+callback handler, with a simulated API latency.  The first run reproduces
+the root and parent node lookups which submit_results() used to make for
+every call.  The other runs look up the parent node only when the root node
+doesn't have its path and kind, with or without a node cache, or use the
+root node fields directly.
+"""
+
+import argparse
+import time
+
+import kernelci.api
+import kernelci.api.cache
+import kernelci.api.helper
+import kernelci.config.api
+
+from .standin import StandInServer
+
+
+def _make_results(count):
+    return {
+        'node': {
+            'name': 'baseline',
+            'result': 'pass',
+            'artifacts': {'lava_log': 'http://storage/lava_log.txt.gz'},
+        },
+        'child_nodes': [
+            {
+                'node': {'name': f'test-{idx}', 'result': 'pass'},
+                'child_nodes': [],
+            }
+            for idx in range(count)
+        ],
+    }
+
+
+def _add_nodes(api):
+    """Add a parent kbuild node and a root job node, and return the root"""
+    parent = api.node.add({
+        'name': 'kbuild', 'kind': 'kbuild', 'path': ['checkout', 'kbuild'],
+    })
+    return api.node.add({
+        'name': 'baseline', 'kind': 'job', 'parent': parent['id'],
+        'path': parent['path'] + ['baseline'], 'data': {},
+    })
+
+
+def _previous_submit(helper, results, root):
+    """Reproduce the previous behaviour with the root and parent lookups"""
+    helper.api.node.get(root['id'])
+    parent = helper.api.node.get(root['parent'])
+    return helper.submit_results(results, root, parent)
+
+
+def _run(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) * 1000 / count
+
+
+def main():
+    """Run the benchmark and print the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--count', type=int, default=200,
+                        help="Number of submissions for each run")
+    parser.add_argument('--delay', type=float, default=5.0,
+                        help="Simulated API latency in milliseconds")
+    parser.add_argument('--tests', type=int, default=20,
+                        help="Number of test results in each submission")
+    args = parser.parse_args()
+
+    server = StandInServer(delay=args.delay / 1000).start()
+    try:
+        config = kernelci.config.api.API('standin', server.url)
+        api = kernelci.api.get_api(config)
+        root = _add_nodes(api)
+        no_path = {key: val for key, val in root.items() if key != 'path'}
+        results = _make_results(args.tests)
+        helper = kernelci.api.helper.APIHelper(api)
+        cached = kernelci.api.helper.APIHelper(
+            api, node_cache=kernelci.api.cache.NodeCache()
+        )
+        runs = [
+            ("root and parent lookups:", lambda: _previous_submit(
+                helper, results, root)),
+            ("parent lookup:", lambda: helper.submit_results(
+                results, no_path)),
+            ("cached parent lookup:", lambda: cached.submit_results(
+                results, no_path)),
+            ("root path and kind:", lambda: helper.submit_results(
+                results, root)),
+        ]
+        latencies = [(name, _run(func, args.count)) for name, func in runs]
+        api.close()
+    finally:
+        server.stop()
+
+    baseline = latencies[0][1]
+    for name, latency in latencies:
+        print(f"{name:25} {latency:7.2f} ms/callback "
+              f"({baseline - latency:6.2f} ms saved)")
+
+
+if __name__ == '__main__':
+    main()
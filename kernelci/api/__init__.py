@@ -7,21 +7,27 @@
 """KernelCI API"""
 
 import abc
+import asyncio
+import concurrent.futures
 import enum
+import functools
 import importlib
 import json
+import threading
+import time
 import urllib
 from typing import Dict, Optional, Sequence
 
 from cloudevents.http import CloudEvent
 import requests
 from requests.adapters import HTTPAdapter
-from urllib3.util import Retry
 
 import kernelci.config.api
+from .limiter import JitterRetry, LimitedHTTPAdapter, RequestLimiter
+from .metrics import APIMetrics
 
 
-class Data:
+class Data:  # pylint: disable=too-many-instance-attributes
     """Convenience class to keep common data in API bindings implementation"""
 
     def __init__(self, config: kernelci.config.api.API, token: str):
@@ -30,7 +36,38 @@ class Data:
         self._headers = {}
         if self._token:
             self._headers['Authorization'] = f'Bearer {self._token}'
+        if not config.keep_alive:
+            self._headers['Connection'] = 'close'
         self._timeout = float(config.timeout)
+        self._adapter = self._make_adapter(config)
+        # Requests which can't be sent again if the response is lost
+        self._no_retry_adapter = self._make_adapter(config, read=False)
+        self._local = threading.local()
+        self._metrics: Optional[APIMetrics] = None
+
+    @classmethod
+    def _make_adapter(cls, config: kernelci.config.api.API,
+                      **retry_kwargs) -> HTTPAdapter:
+        retry_strategy = JitterRetry(
+            total=config.retries,
+            backoff_factor=config.backoff_factor,
+            status_forcelist=config.retry_status,
+            allowed_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
+            **retry_kwargs
+        )
+        kwargs = {
+            'pool_connections': config.pool_size,
+            'pool_maxsize': config.pool_size,
+            'max_retries': retry_strategy,
+        }
+        if config.rate_limit or config.max_concurrency:
+            # All the API objects for the same server share the same budget
+            limiter = RequestLimiter.shared(
+                config.url, rate=config.rate_limit,
+                max_concurrency=config.max_concurrency,
+            )
+            return LimitedHTTPAdapter(limiter, **kwargs)
+        return HTTPAdapter(**kwargs)
 
     @property
     def config(self) -> kernelci.config.api.API:
@@ -47,6 +84,79 @@ class Data:
         """HTTP headers with content type, authorization token etc."""
         return self._headers
 
+    @property
+    def session(self) -> requests.Session:
+        """HTTP session for the current thread
+
+        Each thread gets its own session object, but they all share the same
+        HTTP adapter and as such the same pool of persistent connections.
+        """
+        return self._get_session('session', self._adapter)
+
+    @property
+    def no_retry_session(self) -> requests.Session:
+        """HTTP session for the current thread without read retries
+
+        This is for requests which change the server state even if their
+        response is never received, such as popping events from a list.  They
+        are only sent again if the connection failed or the server replied
+        with an error status.
+        """
+        return self._get_session('no_retry_session', self._no_retry_adapter)
+
+    def _get_session(self, name: str, adapter: HTTPAdapter) -> requests.Session:
+        session = getattr(self._local, name, None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            setattr(self._local, name, session)
+        return session
+
+    @property
+    def limiter(self) -> Optional[RequestLimiter]:
+        """Shared request limiter object or None if not enabled"""
+        return getattr(self._adapter, 'limiter', None)
+
+    @property
+    def metrics(self) -> Optional[APIMetrics]:
+        """Request metrics object or None if not enabled"""
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: Optional[APIMetrics]):
+        self._metrics = metrics
+
+    def close(self):
+        """Close all the pooled connections"""
+        self._adapter.close()
+        self._no_retry_adapter.close()
+
+
+def _instrumented(method: str):
+    """Record the API requests made by a Base method if metrics are enabled
+
+    The metrics object is only checked for None when disabled so the overhead is
+    negligible in this case.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, path, *args, **kwargs):
+            metrics = self.data.metrics
+            if metrics is None:
+                return func(self, path, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                resp = func(self, path, *args, **kwargs)
+            except requests.exceptions.RequestException as exc:
+                metrics.record(method, path, time.perf_counter() - start,
+                               exc.response)
+                raise
+            metrics.record(method, path, time.perf_counter() - start, resp)
+            return resp
+        return wrapper
+    return decorator
+
 
 class Base:
     """Common primitive methods used in API bindings implementation"""
@@ -59,31 +169,28 @@ class Base:
         """Internal Data object instance"""
         return self._data
 
+    @property
+    def session(self) -> requests.Session:
+        """HTTP session with pooled connections"""
+        return self.data.session
+
     def make_url(self, path: str) -> str:
         """Make a full URL for a given API endpoint path"""
         version_path = '/'.join((self.data.config.version, path))
         return urllib.parse.urljoin(self.data.config.url, version_path)
 
-    def _get(self, path, params=None):
+    @_instrumented('GET')
+    def _get(self, path, params=None, timeout=None, retry_read=True):
         url = self.make_url(path)
-        retry_strategy = Retry(
-            total=5,
-            backoff_factor=1,
-            status_forcelist=[500, 502, 503, 504, 521],
-            allowed_methods=["GET"],  # need this
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session = requests.Session()
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-
+        session = self.session if retry_read else self.data.no_retry_session
         resp = session.get(
             url, params=params, headers=self.data.headers,
-            timeout=self.data.timeout
+            timeout=timeout or self.data.timeout
         )
         resp.raise_for_status()
         return resp
 
+    @_instrumented('POST')
     def _post(self, path, data=None, params=None, json_data=True):
         """Issues an API POST request to the endpoint specified in <path>.
 
@@ -99,16 +206,7 @@ class Base:
 
         """
         url = self.make_url(path)
-        retry_strategy = Retry(
-            total=5,
-            backoff_factor=1,
-            status_forcelist=[500, 502, 503, 504, 521],
-            allowed_methods=["POST"],  # need this
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session = requests.Session()
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
+        session = self.session
 
         if isinstance(data, str):
             # If the payload is a string we pass it as it is to
@@ -143,41 +241,33 @@ class Base:
             resp.raise_for_status()
         return resp
 
+    @_instrumented('PUT')
     def _put(self, path, data=None, params=None):
         url = self.make_url(path)
-        retry_strategy = Retry(
-            total=5,
-            backoff_factor=1,
-            status_forcelist=[500, 502, 503, 504, 521],
-            allowed_methods=["PUT"],  # need this
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session = requests.Session()
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-
-        resp = session.put(
-            url, json=data, headers=self.data.headers,
-            params=params, timeout=self.data.timeout
-        )
+        if isinstance(data, str):
+            # Already serialized JSON payload
+            resp = self.session.put(
+                url, data.encode(), headers=self.data.headers | {
+                    'Content-Type': 'application/json'
+                }, params=params, timeout=self.data.timeout
+            )
+        else:
+            resp = self.session.put(
+                url, json=data, headers=self.data.headers,
+                params=params, timeout=self.data.timeout
+            )
         resp.raise_for_status()
         return resp
 
+    @_instrumented('PATCH')
     def _patch(self, path, data=None, params=None):
         url = self.make_url(path)
-        retry_strategy = Retry(
-            total=5,
-            backoff_factor=1,
-            status_forcelist=[500, 502, 503, 504, 521],
-            allowed_methods=["PATCH"],  # need this
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session = requests.Session()
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-
-        resp = session.patch(
-            url, json=data, headers=self.data.headers,
+        headers = self.data.headers
+        if isinstance(data, list):
+            # List of RFC 6902 JSON Patch operations
+            headers = headers | {'Content-Type': 'application/json-patch+json'}
+        resp = self.session.patch(
+            url, json=data, headers=headers,
             params=params, timeout=self.data.timeout
         )
         resp.raise_for_status()
@@ -209,25 +299,68 @@ class Base:
             offset += limit
         return objs
 
+    def _get_page(self, params, path, offset):
+        params = dict(params, offset=offset)
+        return self._get(path, params=params).json()['items']
+
+    # pylint: disable=too-many-arguments
+    def _get_parallel(self, input_params, path, total, workers, limit=100):
+        """Get all the paginated items with concurrent requests
+
+        The pages needed to get `total` items are all requested concurrently
+        with up to `workers` threads and then reassembled in order.  If the
+        last page is full, which can happen when new items were added after
+        `total` was determined, the remaining pages are fetched sequentially.
+        """
+        params = input_params.copy()
+        params['limit'] = limit
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            pages = list(executor.map(
+                lambda offset: self._get_page(params, path, offset),
+                range(0, total, limit)
+            ))
+        offset = len(pages) * limit
+        while not pages or len(pages[-1]) == limit:
+            pages.append(self._get_page(params, path, offset))
+            offset += limit
+        return [item for items in pages for item in items]
+
+    def _iter_paginated(self, input_params, path, limit=100):
+        """Iterate over paginated items while prefetching the next page
+
+        Items are yielded one page at a time.  The next page is requested in
+        a background thread as soon as the previous one has been received, so
+        it's typically ready by the time the caller has consumed the current
+        one.  At most two pages are held in memory at any given time.
+        """
+        params = input_params.copy()
+        params['limit'] = limit
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            offset = 0
+            future = executor.submit(self._get_page, params, path, offset)
+            while future:
+                items = future.result()
+                if len(items) < limit:
+                    future = None
+                else:
+                    offset += limit
+                    future = executor.submit(
+                        self._get_page, params, path, offset
+                    )
+                yield from items
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def _get_fast(self, input_params, path):
         params = input_params.copy()
         resp = self._get(path, params=params)
         return resp.json()
 
+    @_instrumented('DELETE')
     def _delete(self, path):
         url = self.make_url(path)
-        retry_strategy = Retry(
-            total=5,
-            backoff_factor=1,
-            status_forcelist=[500, 502, 503, 504, 521],
-            allowed_methods=["DELETE"],  # need this
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session = requests.Session()
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-
-        resp = session.delete(
+        resp = self.session.delete(
             url, headers=self.data.headers,
             timeout=self.data.timeout
         )
@@ -235,7 +368,7 @@ class Base:
         return resp
 
 
-class API(abc.ABC, Base):
+class API(abc.ABC, Base):  # pylint: disable=too-many-public-methods
     """KernelCI API Python bindings abstraction"""
 
     # pylint: disable=abstract-class-instantiated
@@ -250,6 +383,29 @@ class API(abc.ABC, Base):
         """API configuration data"""
         return self.data.config
 
+    @property
+    def metrics(self) -> Optional[APIMetrics]:
+        """Request metrics object or None if not enabled"""
+        return self.data.metrics
+
+    def enable_metrics(
+            self, metrics: Optional[APIMetrics] = None) -> APIMetrics:
+        """Start recording metrics for all the API requests
+
+        A new APIMetrics object is used unless one is provided, for example
+        to share it between several API objects.  Return the metrics object.
+        """
+        self.data.metrics = metrics or APIMetrics()
+        return self.data.metrics
+
+    def disable_metrics(self):
+        """Stop recording metrics for the API requests"""
+        self.data.metrics = None
+
+    def close(self):
+        """Close the persistent HTTP connections"""
+        self.data.close()
+
     # -------------------------------------------------------------------------
     # Abstract interface to be implemented
     #
@@ -392,6 +548,19 @@ class API(abc.ABC, Base):
     def pop_event(self, list_name: str) -> CloudEvent:
         """Listen and pop an event from a given List"""
 
+    def pop_events(self, list_name: str, max_items: int = 16,
+                   timeout: Optional[float] = None) -> Sequence[CloudEvent]:
+        """Pop up to `max_items` events from a given List
+
+        Wait up to `timeout` seconds for at least one event and return an
+        empty list if none was received.  This default implementation only
+        pops a single event with pop_event() and doesn't support a timeout.
+        """
+        # pylint: disable=unused-argument
+        if timeout is not None:
+            raise ValueError("Timeout not supported without batch pops")
+        return [self.pop_event(list_name)]
+
     @abc.abstractmethod
     def subscription_stats(self):
         """Get Pub/Sub scribscription statistics"""
@@ -420,9 +589,291 @@ class API(abc.ABC, Base):
         """Delete a new group"""
 
 
+class AsyncBase:  # pylint: disable=too-few-public-methods
+    """Common primitive methods used in asyncio API bindings implementation
+
+    Calls are delegated to the equivalent synchronous bindings and run in a
+    thread pool executor shared by all the objects of a same API instance.
+    Any number of coroutines can be awaiting results, but each request in
+    flight uses an executor thread so the number of concurrent requests is
+    bounded by the number of workers.
+    """
+
+    def __init__(self, sync, executor: concurrent.futures.Executor):
+        self._sync = sync
+        self._executor = executor
+
+    @property
+    def sync(self):
+        """Synchronous bindings object used to run the requests"""
+        return self._sync
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+
+class AsyncAPI(AsyncBase):
+    """KernelCI API asyncio bindings
+
+    This mirrors the API abstract interface with coroutines.  Use
+    `get_async_api()` to get an instance matching the API version.
+
+    This is not a native asyncio HTTP client: the requests are sent by the
+    synchronous bindings in worker threads, and each request in flight uses
+    an executor thread.  Only up to `max_workers` requests are in flight at
+    a time, which is the HTTP connection pool size by default.  Requests
+    beyond the size of the pool use connections which aren't kept open, so
+    the pool size should be increased as well when using more workers.
+    Long-polling requests to receive events run in a separate executor with
+    up to `max_listeners` workers so they can't hold up the other requests.
+    """
+
+    MAX_LISTENERS = 8
+
+    def __init__(self, api: API, max_workers: Optional[int] = None,
+                 max_listeners: Optional[int] = None):
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or api.config.pool_size,
+            thread_name_prefix='kernelci-api',
+        )
+        super().__init__(api, executor)
+        self._listeners = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_listeners or self.MAX_LISTENERS,
+            thread_name_prefix='kernelci-api-events',
+        )
+        self._node = self.Node(api.node, executor)
+        self._user = self.User(api.user, executor)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    @property
+    def config(self) -> kernelci.config.api.API:
+        """API configuration data"""
+        return self.sync.config
+
+    async def close(self):
+        """Wait for pending requests and close the HTTP connections
+
+        Pending long-polling requests to receive events are not waited for.
+        """
+        self._listeners.shutdown(wait=False)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._executor.shutdown
+        )
+        self.sync.close()
+
+    async def _listen(self, func, *args, **kwargs):
+        """Run a long-polling request in the listeners executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._listeners, functools.partial(func, *args, **kwargs)
+        )
+
+    @property
+    def version(self) -> str:
+        """API version"""
+        return self.sync.version
+
+    async def hello(self) -> dict:
+        """Get the hello message"""
+        return await self._run(self.sync.hello)
+
+    class User(AsyncBase):
+        """Asyncio interface to manage API user accounts"""
+
+        async def whoami(self) -> dict:
+            """Get information about the current user"""
+            return await self._run(self.sync.whoami)
+
+        async def create_token(self, username: str, password: str) -> dict:
+            """Create a new API token for the current user"""
+            return await self._run(self.sync.create_token, username, password)
+
+        async def get(self, user_id: str) -> dict:
+            """Get the user matching the given user id"""
+            return await self._run(self.sync.get, user_id)
+
+        async def find(
+            self, attributes: Dict[str, str],
+            offset: Optional[int] = None, limit: Optional[int] = None
+        ) -> Sequence[dict]:
+            """Find user accounts that match the provided attributes"""
+            return await self._run(self.sync.find, attributes, offset, limit)
+
+        async def add(self, user: dict) -> dict:
+            """Create a new user"""
+            return await self._run(self.sync.add, user)
+
+        async def update(self, fields: dict,
+                         user_id: Optional[str] = None) -> dict:
+            """Update a user matching with the provided fields"""
+            return await self._run(self.sync.update, fields, user_id)
+
+        async def request_verification_token(self, email: str):
+            """Request an email verification token"""
+            return await self._run(self.sync.request_verification_token, email)
+
+        async def verify_email(self, token: str):
+            """Verify the user's email address"""
+            return await self._run(self.sync.verify_email, token)
+
+        async def request_password_reset_token(self, email: str):
+            """Request password reset token to be sent by email"""
+            return await self._run(
+                self.sync.request_password_reset_token, email
+            )
+
+        async def reset_password(self, token: str, password: str):
+            """Reset password"""
+            return await self._run(self.sync.reset_password, token, password)
+
+        async def update_password(self, username: str, current_password: str,
+                                  new_password: str):
+            """Update a user's password"""
+            return await self._run(
+                self.sync.update_password,
+                username, current_password, new_password
+            )
+
+    @property
+    def user(self) -> User:
+        """AsyncAPI.User part of the interface"""
+        return self._user
+
+    class Node(AsyncBase):
+        """Asyncio interface to manage node objects"""
+
+        @property
+        def states(self):
+            """An enum with all the valid node state names"""
+            return self.sync.states
+
+        async def get(self, node_id: str) -> dict:
+            """Get the node matching the given node id"""
+            return await self._run(self.sync.get, node_id)
+
+        async def find(
+            self, attributes: Dict[str, str],
+            offset: Optional[int] = None, limit: Optional[int] = None
+        ) -> Sequence[dict]:
+            """Find nodes that match the provided attributes"""
+            return await self._run(self.sync.find, attributes, offset, limit)
+
+        async def count(self, attributes: dict) -> int:
+            """Count nodes that match the provided attributes"""
+            return await self._run(self.sync.count, attributes)
+
+        async def add(self, node: dict) -> dict:
+            """Create a new node object (no id)"""
+            return await self._run(self.sync.add, node)
+
+        async def update(self, node: dict) -> dict:
+            """Update an existing node object (with id)"""
+            return await self._run(self.sync.update, node)
+
+    @property
+    def node(self) -> Node:
+        """AsyncAPI.Node part of the interface"""
+        return self._node
+
+    # -------
+    # Pub/Sub
+    # -------
+
+    async def subscribe(self, channel: str,
+                        promisc: Optional[bool] = None) -> int:
+        """Subscribe to a pub/sub channel"""
+        return await self._run(self.sync.subscribe, channel, promisc)
+
+    async def unsubscribe(self, sub_id: int):
+        """Unsubscribe from the given subscription id"""
+        return await self._run(self.sync.unsubscribe, sub_id)
+
+    async def send_event(self, channel: str, data):
+        """Send an event to a given pub/sub channel"""
+        return await self._run(self.sync.send_event, channel, data)
+
+    async def receive_event(self, sub_id: int) -> CloudEvent:
+        """Listen and receive an event from a given subscription id
+
+        Note that this occupies one listener thread while waiting.
+        """
+        return await self._listen(self.sync.receive_event, sub_id)
+
+    async def push_event(self, list_name: str, data):
+        """Push an event to a given Redis List"""
+        return await self._run(self.sync.push_event, list_name, data)
+
+    async def pop_event(self, list_name: str) -> CloudEvent:
+        """Listen and pop an event from a given List
+
+        Note that this occupies one listener thread while waiting.
+        """
+        return await self._listen(self.sync.pop_event, list_name)
+
+    async def pop_events(self, list_name: str, max_items: int = 16,
+                         timeout: Optional[float] = None
+                         ) -> Sequence[CloudEvent]:
+        """Pop up to `max_items` events from a given List
+
+        Note that this occupies one listener thread while waiting.
+        """
+        return await self._listen(
+            self.sync.pop_events, list_name, max_items, timeout
+        )
+
+    async def subscription_stats(self):
+        """Get Pub/Sub scribscription statistics"""
+        return await self._run(self.sync.subscription_stats)
+
+    # -----------
+    # User groups
+    # -----------
+
+    async def get_group(self, group_id: str) -> dict:
+        """Get the user group matching the given group id"""
+        return await self._run(self.sync.get_group, group_id)
+
+    async def get_groups(
+        self, attributes: dict,
+        offset: Optional[int] = None, limit: Optional[int] = None
+    ) -> Sequence[dict]:
+        """Get user groups that match the provided attributes"""
+        return await self._run(self.sync.get_groups, attributes, offset, limit)
+
+    async def create_group(self, name: str) -> dict:
+        """Create a new group"""
+        return await self._run(self.sync.create_group, name)
+
+    async def delete_group(self, group_id: str):
+        """Delete a new group"""
+        return await self._run(self.sync.delete_group, group_id)
+
+
 def get_api(config, token=None):
     """Get a KernelCI API object matching the provided configuration"""
     version = config.version
     mod = importlib.import_module('.'.join(['kernelci', 'api', version]))
     api = mod.get_api(config, token)
     return api
+
+
+def get_async_api(config, token=None, max_workers=None, max_listeners=None):
+    """Get a KernelCI AsyncAPI object matching the provided configuration
+
+    The `max_workers` argument is the maximum number of requests sent
+    concurrently, each using a thread, and defaults to the HTTP connection
+    pool size.  The `max_listeners` argument is the maximum number of
+    long-polling requests to receive events, see AsyncAPI.
+    """
+    version = config.version
+    mod = importlib.import_module('.'.join(['kernelci', 'api', version]))
+    api = mod.get_async_api(config, token, max_workers, max_listeners)
+    return api
@@ -0,0 +1,151 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""KernelCI API node caches"""
+
+import collections
+import copy
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class NodeCache:
+    """In-memory cache of node objects
+
+    Nodes are kept for up to `ttl` seconds and the least recently used ones
+    are evicted when there are more than `max_size` of them.  Nodes are
+    copied when they are stored and retrieved so the cached data can't be
+    modified by the callers.  All the methods are thread-safe.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._nodes: collections.OrderedDict = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self) -> int:
+        """Number of lookups which found a valid node in the cache"""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """Number of lookups which didn't find a valid node in the cache"""
+        return self._misses
+
+    def stats(self) -> dict:
+        """Get a dictionary with the hit and miss counters"""
+        return {'hits': self._hits, 'misses': self._misses}
+
+    def _lookup(self, node_id: str, now: float):
+        entry = self._nodes.get(node_id)
+        if entry is None:
+            return None
+        expiry, node = entry
+        if expiry < now:
+            del self._nodes[node_id]
+            return None
+        self._nodes.move_to_end(node_id)
+        return node
+
+    def _store(self, node: dict, expiry: float):
+        self._nodes[node['id']] = (expiry, node)
+        self._nodes.move_to_end(node['id'])
+        while len(self._nodes) > self._max_size:
+            self._nodes.popitem(last=False)
+
+    def _remove(self, node_id: str):
+        self._nodes.pop(node_id, None)
+
+    def _clear(self):
+        self._nodes.clear()
+
+    def _now(self) -> float:
+        return time.monotonic()
+
+    def get(self, node_id: str) -> Optional[dict]:
+        """Get a node from the cache or None if not found or expired"""
+        with self._lock:
+            node = self._lookup(node_id, self._now())
+            if node is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return copy.deepcopy(node)
+
+    def put(self, node: dict):
+        """Store a node in the cache"""
+        node = copy.deepcopy(node)
+        with self._lock:
+            self._store(node, self._now() + self._ttl)
+
+    def invalidate(self, node_id: str):
+        """Remove a node from the cache"""
+        with self._lock:
+            self._remove(node_id)
+
+    def clear(self):
+        """Remove all the nodes from the cache"""
+        with self._lock:
+            self._clear()
+
+
+class SQLiteNodeCache(NodeCache):
+    """On-disk cache of node objects stored in a SQLite database
+
+    This behaves like NodeCache but the nodes are stored in a SQLite database
+    file which can be shared between several processes on the same host.  The
+    hit and miss counters are specific to each instance.
+    """
+
+    def __init__(self, path: str, max_size: int = 16384, ttl: float = 60):
+        super().__init__(max_size, ttl)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS nodes "
+                "(id TEXT PRIMARY KEY, expiry REAL, used REAL, data TEXT)"
+            )
+
+    def _lookup(self, node_id: str, now: float):
+        row = self._db.execute(
+            "SELECT expiry, data FROM nodes WHERE id = ?", (node_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        expiry, data = row
+        with self._db:
+            if expiry < now:
+                self._db.execute("DELETE FROM nodes WHERE id = ?", (node_id,))
+                return None
+            self._db.execute(
+                "UPDATE nodes SET used = ? WHERE id = ?", (now, node_id)
+            )
+        return json.loads(data)
+
+    def _store(self, node: dict, expiry: float):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?)",
+                (node['id'], expiry, expiry - self._ttl, json.dumps(node))
+            )
+            self._db.execute(
+                "DELETE FROM nodes WHERE id IN (SELECT id FROM nodes "
+                "ORDER BY used DESC LIMIT -1 OFFSET ?)", (self._max_size,)
+            )
+
+    def _remove(self, node_id: str):
+        with self._db:
+            self._db.execute("DELETE FROM nodes WHERE id = ?", (node_id,))
+
+    def _clear(self):
+        with self._db:
+            self._db.execute("DELETE FROM nodes")
+
+    def _now(self) -> float:
+        return time.time()
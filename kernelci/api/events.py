@@ -0,0 +1,436 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""KernelCI API Pub/Sub and Redis list event helpers"""
+
+import asyncio
+import collections
+import queue
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+from cloudevents.http import CloudEvent, from_json
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class EventFilter:
+    """Pub/Sub event filter compiled from a filters dictionary
+
+    Filters are dictionaries with event keys and expected values.  A tuple
+    value means any of its items is accepted and a dictionary value applies
+    the same rules to the keys of a nested dictionary in the event.  Keys
+    not found in the event are ignored.  The nested key paths are flattened
+    and the tuples turned into frozensets when compiling the filters, and
+    the compiled objects for identical filters are shared via compile().
+    Up to MAX_CACHED of the most recently used compiled filters are kept.
+    """
+
+    __slots__ = ('_checks',)
+
+    MAX_CACHED = 256
+
+    _EQUAL, _IN_SET, _IN_TUPLE = range(3)
+    _cache: collections.OrderedDict = collections.OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, filters: dict):
+        checks: List[tuple] = []
+        for key, value in filters.items():
+            if isinstance(value, dict):
+                checks.extend(
+                    (key, sub_key) + self._compile_value(sub_value)
+                    for sub_key, sub_value in value.items()
+                )
+            else:
+                checks.append((key, None) + self._compile_value(value))
+        self._checks = tuple(checks)
+
+    @classmethod
+    def _compile_value(cls, value):
+        if not isinstance(value, tuple):
+            return (cls._EQUAL, value)
+        try:
+            return (cls._IN_SET, frozenset(value))
+        except TypeError:
+            return (cls._IN_TUPLE, value)
+
+    @classmethod
+    def _freeze(cls, value):
+        if isinstance(value, dict):
+            return tuple((key, cls._freeze(val)) for key, val in value.items())
+        if isinstance(value, tuple):
+            return ((),) + tuple(cls._freeze(val) for val in value)
+        hash(value)
+        return value
+
+    @classmethod
+    def compile(cls, filters: Optional[dict]) -> Optional['EventFilter']:
+        """Get a compiled filter, or None if there are no filters
+
+        Compiled filters are cached so all the subscriptions with identical
+        filters use the same object.
+        """
+        if not filters:
+            return None
+        try:
+            key = cls._freeze(filters)
+        except TypeError:
+            return cls(filters)
+        with cls._cache_lock:
+            event_filter = cls._cache.get(key)
+            if event_filter is None:
+                event_filter = cls._cache[key] = cls(filters)
+                if len(cls._cache) > cls.MAX_CACHED:
+                    cls._cache.popitem(last=False)
+            else:
+                cls._cache.move_to_end(key)
+        return event_filter
+
+    def match(self, event: dict) -> bool:
+        """Check whether an event matches the filters"""
+        for key, sub_key, kind, expected in self._checks:
+            if key not in event:
+                continue
+            value = event[key]
+            if sub_key is not None:
+                if sub_key not in value:
+                    continue
+                value = value[sub_key]
+            if kind == self._EQUAL:
+                if value != expected:
+                    return False
+            elif kind == self._IN_SET:
+                try:
+                    if value not in expected:
+                        return False
+                except TypeError:  # unhashable values can't be in the set
+                    return False
+            elif not any(item == value for item in expected):
+                return False
+        return True
+
+
+class EventStream:  # pylint: disable=too-many-instance-attributes
+    """Iterator over the events of a subscription using a persistent stream
+
+    Events are received as Server-Sent Events on a single long-lived
+    connection to the `stream/<sub_id>` endpoint rather than with one `listen`
+    request per event, and comment lines sent by the server while idle are
+    used as keep-alives.  The connection is reestablished automatically with
+    an increasing delay when it gets dropped, and a new subscription is made
+    if the previous one has expired in the meantime.  Events published while
+    there is no active subscription are lost, as with the `listen` endpoint.
+    If the API doesn't provide the streaming endpoint, events are received
+    with API.receive_event() instead.
+
+    The stream connections use their own HTTP session without the retry
+    strategy of the API bindings, so server errors are handled with the
+    stream reconnection delay rather than being retried by urllib3.
+    """
+
+    MAX_DELAY = 30.0
+
+    def __init__(self, api, channel: str, promisc: Optional[bool] = None,
+                 read_timeout: Optional[float] = None):
+        """Create an event stream for a subscription to a channel
+
+        *api* is an API object to subscribe to *channel* with the optional
+        *promisc* flag and *read_timeout* is the maximum time in seconds
+        without receiving any data or keep-alive before reconnecting, or the
+        API timeout by default.  The delay before reconnecting is doubled
+        after each failed attempt up to MAX_DELAY seconds.
+        """
+        self._api = api
+        self._channel = channel
+        self._promisc = promisc
+        self._read_timeout = read_timeout or api.data.timeout
+        self._sub_id: Optional[int] = None
+        self._resp: Optional[requests.Response] = None
+        self._streaming = True
+        self._connected = False
+        self._reconnects = 0
+        self._closed = threading.Event()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1,
+                              max_retries=0)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def sub_id(self) -> Optional[int]:
+        """Current subscription id"""
+        return self._sub_id
+
+    @property
+    def streaming(self) -> bool:
+        """False if the events are received with the listen endpoint"""
+        return self._streaming
+
+    @property
+    def reconnects(self) -> int:
+        """Number of times the stream connection was reestablished"""
+        return self._reconnects
+
+    def subscribe(self) -> int:
+        """Make a new subscription to the channel and get its id"""
+        sub_id = self._api.subscribe(self._channel, self._promisc)
+        self._sub_id = sub_id
+        return sub_id
+
+    def close(self):
+        """Stop receiving events and unsubscribe
+
+        This can be called from another thread to interrupt the iteration.
+        """
+        self._closed.set()
+        resp, self._resp = self._resp, None
+        if resp is not None:
+            resp.close()
+        sub_id, self._sub_id = self._sub_id, None
+        if sub_id is not None:
+            try:
+                self._api.unsubscribe(sub_id)
+            except requests.exceptions.RequestException:
+                pass
+        self._session.close()
+
+    def _connect(self) -> requests.Response:
+        headers = dict(self._api.data.headers)
+        headers['Accept'] = 'text/event-stream'
+        return self._session.get(
+            self._api.make_url(f'stream/{self._sub_id}'),
+            headers=headers, stream=True,
+            timeout=(self._api.data.timeout, self._read_timeout)
+        )
+
+    @staticmethod
+    def _read(resp: requests.Response) -> Iterator[str]:
+        """Get the data of each Server-Sent Event from a response"""
+        data: List[str] = []
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line:
+                if data:
+                    yield '\n'.join(data)
+                    data = []
+                continue
+            field, _, value = line.partition(':')
+            if field == 'data':
+                data.append(value[1:] if value.startswith(' ') else value)
+
+    def _receive(self) -> Iterator[CloudEvent]:
+        """Receive events until the connection is lost
+
+        The subscription is renewed when it has expired, streaming is
+        disabled when the endpoint isn't available and server errors are
+        handled like a lost connection.
+        """
+        resp = self._connect()
+        if resp.status_code in (404, 405, 410):
+            resp.close()
+            if not self._connected and resp.status_code != 410:
+                self._streaming = False
+            else:
+                self.subscribe()
+            return
+        if resp.status_code >= 500:
+            resp.close()
+            return
+        resp.raise_for_status()
+        self._connected = True
+        self._resp = resp
+        try:
+            for data in self._read(resp):
+                event = from_json(data)
+                if event.data != 'BEEP':
+                    yield event
+        except Exception:  # pylint: disable=broad-except
+            # The response may be closed by another thread in close()
+            if not self._closed.is_set():
+                raise
+        finally:
+            resp.close()
+            self._resp = None
+
+    def __iter__(self) -> Iterator[CloudEvent]:
+        if self._sub_id is None:
+            self.subscribe()
+        delay = 0.0
+        while not self._closed.is_set():
+            if not self._streaming:
+                yield self._api.receive_event(self._sub_id)
+                continue
+            try:
+                for event in self._receive():
+                    delay = 0.0
+                    yield event
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.RetryError,
+                    requests.exceptions.Timeout):
+                pass
+            if self._closed.is_set() or not self._streaming:
+                continue
+            self._closed.wait(delay)
+            delay = min(max(delay * 2, 0.5), self.MAX_DELAY)
+            self._reconnects += 1
+
+    async def queue(self, maxsize: int = 0) -> asyncio.Queue:
+        """Get an asyncio queue fed with the events from a background thread
+
+        The thread waits when the queue is full with *maxsize* events and
+        stops when the stream is closed or the event loop isn't running any
+        more.
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue(maxsize)
+
+        def _feed():
+            try:
+                for event in self:
+                    asyncio.run_coroutine_threadsafe(
+                        events.put(event), loop
+                    ).result()
+            except RuntimeError:  # event loop closed
+                self.close()
+
+        threading.Thread(target=_feed, daemon=True).start()
+        return events
+
+
+class EventMultiplexer:
+    """Receive events from several Pub/Sub subscriptions and Redis lists
+
+    Each source is polled by its own thread so a source blocking on a
+    long-polling request never delays the other ones.  A shared pool of
+    workers would need one worker per source anyway, as popping from a Redis
+    list blocks until an event is available.  Pub/Sub subscriptions are
+    polled without blocking on keep-alive events so the threads can stop
+    while a source is idle.  Events with a dictionary
+    payload from subscriptions made with APIHelper.subscribe_filters() are
+    filtered using the same filters.
+
+    Each source either has a callback, called in the source thread with each
+    CloudEvent, or a bounded queue to consume the events.  A source isn't
+    polled again until its callback has returned or while its queue is full
+    so the events accumulate on the API side when the consumer falls behind.
+    """
+
+    def __init__(self, helper, maxsize: int = 64, retry_delay: float = 1.0):
+        """Create a multiplexer for sources added later on
+
+        *helper* is the APIHelper object with the filters registry,
+        *maxsize* is the size of the event queues and *retry_delay* is the
+        time in seconds to wait before polling a source again after an
+        error or when its queue is full.
+        """
+        self._helper = helper
+        self._maxsize = maxsize
+        self._retry_delay = retry_delay
+        self._sources: Dict[object, tuple] = {}
+        self._errors: List[tuple] = []
+        self._stop: Optional[threading.Event] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def errors(self) -> List[tuple]:
+        """List of (source, exception) 2-tuples for the removed sources"""
+        return list(self._errors)
+
+    def _add(self, key, receive, callback):
+        events = None if callback else queue.Queue(self._maxsize)
+        self._sources[key] = (receive, callback, events)
+        if self._stop is not None:
+            self._start_thread(key, self._stop)
+        return events
+
+    def add_subscription(self, sub_id: int,
+                         callback: Optional[Callable] = None):
+        """Add a Pub/Sub subscription
+
+        Get the queue with the events or None if *callback* is provided.
+        """
+        def _receive():
+            event = self._helper.api.receive_event(sub_id, block=False)
+            if event is None or (
+                    isinstance(event.data, dict) and
+                    not self._helper.pubsub_event_filter(sub_id, event.data)):
+                return None
+            return event
+
+        return self._add(sub_id, _receive, callback)
+
+    def add_list(self, list_name: str, callback: Optional[Callable] = None):
+        """Add a Redis list to pop events from
+
+        Get the queue with the events or None if *callback* is provided.
+        """
+        return self._add(
+            list_name, lambda: self._helper.api.pop_event(list_name), callback
+        )
+
+    def remove(self, key):
+        """Stop polling a subscription id or list name"""
+        self._sources.pop(key, None)
+
+    def _start_thread(self, key, stop: threading.Event):
+        threading.Thread(
+            target=self._poll, args=(key, self._sources[key], stop),
+            name=f'kci-events-{key}', daemon=True
+        ).start()
+
+    def start(self):
+        """Start a thread to poll each source"""
+        self.stop()
+        self._stop = threading.Event()
+        for key in list(self._sources):
+            self._start_thread(key, self._stop)
+
+    def stop(self):
+        """Stop polling the sources
+
+        Requests which are already in progress are left to complete in the
+        background.  As their events have already been removed from the
+        API, they are still delivered to the callback or queue.
+        """
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def _poll(self, key, source, stop: threading.Event):
+        """Receive events from a source until stopped or removed
+
+        Each thread has the stop event of the run it was started for, so
+        the threads left over from a previous run don't poll the sources
+        again after a restart.
+        """
+        receive, callback, events = source
+        while not stop.is_set() and self._sources.get(key) is source:
+            if events is not None and events.full():
+                stop.wait(self._retry_delay)
+                continue
+            try:
+                event = receive()
+                if event is None:
+                    continue
+                if callback:
+                    callback(event)
+                else:
+                    # Another thread may have filled the queue after a restart
+                    events.put(event)
+            except requests.exceptions.RequestException:
+                stop.wait(self._retry_delay)
+            except Exception as exc:  # pylint: disable=broad-except
+                self._errors.append((key, exc))
+                self.remove(key)
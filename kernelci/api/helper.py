@@ -7,11 +7,19 @@
 
 """KernelCI API helpers"""
 
-from typing import Dict
+from typing import Dict, List, Optional
+import copy
 import json
+import re
 import requests
 
 from . import API
+from .cache import NodeCache
+from .events import EventFilter
+from .results import ResultsSubmitter, prepare_node
+from .writebehind import NodeUpdateQueue
+from ..config.rules import RuleSet, VersionRule
+from ..scheduler import SchedulerIndex
 
 
 def merge(primary: dict, secondary: dict):
@@ -35,33 +43,135 @@ def merge(primary: dict, secondary: dict):
     return result
 
 
-class APIHelper:
+_MATCH_ALL = EventFilter({})
+
+
+class _Ancestors:  # pylint: disable=too-few-public-methods
+    """Input node and its ancestors, only retrieved when first needed"""
+
+    def __init__(self, helper, node):
+        self._helper, self._node, self._parents = helper, node, None
+
+    def __iter__(self):
+        yield self._node
+        if self._parents is None:
+            self._parents = self._helper.get_ancestors(self._node)
+        yield from self._parents
+
+
+class APIHelper:  # pylint: disable=too-many-public-methods
     """API helper base class
 
     This provides some common middleware between the API class and
-    applications.
+    applications.  An optional `node_cache` object can be provided to avoid
+    retrieving the same nodes from the API repeatedly, for example when
+    looking up ancestors while evaluating rules.  An optional `index` keyed
+    by (job name, platform name) such as SchedulerIndex.from_configs() can
+    also be provided to skip the job nodes which would be rejected by the
+    rules without evaluating them one by one.  An optional `update_queue`
+    NodeUpdateQueue object can be provided to send the node updates made
+    with update_node() in batches in the background.
     """
 
-    def __init__(self, api: API):
+    def __init__(self, api: API, node_cache: Optional[NodeCache] = None,
+                 index: Optional[SchedulerIndex] = None,
+                 update_queue: Optional[NodeUpdateQueue] = None):
         self._api = api
         self._filters: Dict[str, Dict[str, str]] = {}
+        self._matchers: Dict[str, tuple] = {}
+        self._node_cache = node_cache
+        self._index = index
+        self._update_queue = update_queue
 
     @property
     def api(self):
         """API object"""
         return self._api
 
+    @property
+    def node_cache(self) -> Optional[NodeCache]:
+        """Node cache object or None if not enabled"""
+        return self._node_cache
+
+    @property
+    def update_queue(self) -> Optional[NodeUpdateQueue]:
+        """Node update queue object or None if not enabled"""
+        return self._update_queue
+
+    def get_node(self, node_id: str) -> dict:
+        """Get a node from the cache if enabled or from the API otherwise"""
+        if self._node_cache is None:
+            return self.api.node.get(node_id)
+        node = self._node_cache.get(node_id)
+        if node is None:
+            node = self.api.node.get(node_id)
+            self._node_cache.put(node)
+        return node
+
+    def get_nodes(self, node_ids: List[str]) -> List[dict]:
+        """Get several nodes, from the cache if enabled or from the API
+
+        All the nodes not found in the cache are retrieved together with
+        concurrent requests.  The nodes are returned in the same order as
+        the input node ids.
+        """
+        nodes = {}
+        if self._node_cache is not None:
+            for node_id in node_ids:
+                cached = self._node_cache.get(node_id)
+                if cached is not None:
+                    nodes[node_id] = cached
+        missing = list(dict.fromkeys(
+            node_id for node_id in node_ids if node_id not in nodes
+        ))
+        fetched = self.api.node.get_many(missing) if missing else []
+        for node_id, node in zip(missing, fetched):
+            if self._node_cache is not None and node:
+                self._node_cache.put(node)
+            nodes[node_id] = node
+        return [nodes[node_id] for node_id in node_ids]
+
+    def update_node(self, node: dict, noevent=False) -> dict:
+        """Update a node via the API and keep the node cache up to date
+
+        If the update queue is enabled, the update is only added to the
+        queue and the node is returned as-is.  It then won't be visible via
+        the API until the queue has been flushed, but it will via the node
+        cache if enabled.
+        """
+        if self._update_queue is not None:
+            self._update_queue.update(node, noevent)
+            updated = copy.deepcopy(node)
+        else:
+            updated = self.api.node.update(node, noevent)
+        if self._node_cache is not None:
+            self._node_cache.put(updated)
+        return updated
+
+    def flush_updates(self) -> bool:
+        """Send the node updates from the queue now if enabled
+
+        Return False if some updates are still pending due to API errors.
+        """
+        if self._update_queue is None:
+            return True
+        return self._update_queue.flush()
+
     def subscribe_filters(self, filters=None, channel='node',
                           promiscuous=False):
         """Subscribe to a channel with some added filters"""
         sub_id = self.api.subscribe(channel, promiscuous)
         self._filters[sub_id] = filters
+        self._matchers[sub_id] = (
+            filters, EventFilter.compile(filters) or _MATCH_ALL
+        )
         return sub_id
 
     def unsubscribe_filters(self, sub_id):
         """Unsubscribe from a channel with previously registered filters"""
         if sub_id in self._filters:
             self._filters.pop(sub_id)
+        self._matchers.pop(sub_id, None)
         self.api.unsubscribe(sub_id)
 
     def receive_event_data(self, sub_id, block=True):
@@ -79,12 +189,39 @@ class APIHelper:
         """Receive CloudEvent from Redis list and return its data payload"""
         return self.api.pop_event(list_name).data
 
+    def pop_events_data(self, list_name, max_items=16, timeout=None):
+        """Pop a batch of CloudEvents from a Redis list and return their data
+
+        Up to `max_items` events are popped with a single API request, which
+        waits up to `timeout` seconds for the first one.  An empty list is
+        returned if no events were received.  The timeout is only supported
+        if batch_pop is enabled in the API configuration.
+        """
+        events = self.api.pop_events(list_name, max_items, timeout)
+        return [event.data for event in events]
+
     def get_node_from_event(self, event_data):
         """Listen for an event and get the matching node object from it"""
         if 'id' in event_data:
-            return self.api.node.get(event_data['id'])
+            node = self.api.node.get(event_data['id'])
+            if self._node_cache is not None and node:
+                self._node_cache.put(node)
+            return node
         return None
 
+    def _get_matcher(self, sub_id):
+        """Get the compiled filter for a subscription
+
+        The filters are compiled again if they've been changed since the
+        subscription was created.
+        """
+        filters = self._filters.get(sub_id)
+        matcher = self._matchers.get(sub_id)
+        if matcher is None or matcher[0] is not filters:
+            matcher = (filters, EventFilter.compile(filters) or _MATCH_ALL)
+            self._matchers[sub_id] = matcher
+        return matcher[1]
+
     def pubsub_event_filter(self, sub_id, event):
         """Filter Pub/Sub events
 
@@ -93,63 +230,122 @@ class APIHelper:
         If filters are provided, return True if the event data matches with
         the filter parameters, otherwise False.
         """
-        filters = self._filters.get(sub_id)
-        if not filters:
-            return True
-        for key, value in filters.items():
-            if key not in event.keys():
-                continue
-            if isinstance(value, dict):
-                for sub_key, sub_value in value.items():
-                    if sub_key not in event.get(key):
-                        continue
-                    if isinstance(sub_value, tuple):
-                        if not any(sub_sub_value == event.get(key).get(sub_key)
-                                   for sub_sub_value in sub_value):
-                            return False
-                    elif sub_value != event.get(key).get(sub_key):
-                        return False
-            elif isinstance(value, tuple):
-                if not any(sub_value == event[key] for sub_value in value):
-                    return False
-            elif value != event[key]:
-                return False
-
-        return True
+        return self._get_matcher(sub_id).match(event)
 
     def receive_event_node(self, sub_id):
         """
         Listen to all the events on 'node' channel and apply filter on it.
         Return node if event matches with the filter.
+
+        The filters are first applied to the event data, so the node is only
+        retrieved if the event itself matches.
         """
+        matcher = self._get_matcher(sub_id)
         while True:
             event = self.receive_event_data(sub_id)
-            node = self.get_node_from_event(event)
             # Crude (provisional) filtering of non-node events
-            if not node:
+            if 'id' not in event or not matcher.match(event):
                 continue
-            if all(self.pubsub_event_filter(sub_id, obj)
-                   for obj in [node, event]):
+            node = self.get_node_from_event(event)
+            if node and matcher.match(node):
                 return node, event.get('is_hierarchy')
 
-    def _find_container(self, field, node):
+    def receive_event_nodes(self, sub_id, max_events=16):
+        """Receive a batch of nodes from the events on the 'node' channel
+
+        This is the same as receive_event_node() but it keeps receiving
+        events until `max_events` of them have matched the filters or the
+        subscription is idle, as signalled by a keep-alive event.  The nodes
+        for all the matching events are then retrieved together.  Return a
+        list of (node, is_hierarchy) 2-tuples for the nodes which also match
+        the filters.
         """
-        Return the first found dict containing a field of a given name,
-        recursing through all of the node's ancestors if not found.
+        matcher = self._get_matcher(sub_id)
+        events = []
+        while len(events) < max_events:
+            event = self.receive_event_data(sub_id, block=not events)
+            if event is None:
+                break
+            if 'id' in event and matcher.match(event):
+                events.append(event)
+        nodes = self.get_nodes([event['id'] for event in events])
+        return [
+            (node, event.get('is_hierarchy'))
+            for node, event in zip(nodes, events)
+            if node and matcher.match(node)
+        ]
+
+    def get_ancestors(self, node):
+        """Get the list of ancestors of a node, from its parent to the root
+
+        All the ancestors are first looked up with a single query using the
+        node's `treeid` and the names from its `path`.  The chain is then
+        resolved by following the `parent` ids, and any ancestor which wasn't
+        found by the query is retrieved individually with get_node().
+        """
+        parent_id = node.get('parent')
+        if not parent_id:
+            return []
+        names = set(node.get('path', [])[:-1])
+        found = {}
+        if node.get('treeid') and names:
+            pattern = '|'.join(re.escape(name) for name in sorted(names))
+            try:
+                nodes = self.api.node.findfast({
+                    'treeid': node['treeid'],
+                    'name__re': f'^({pattern})$',
+                })
+            except requests.exceptions.HTTPError:
+                nodes = []
+            if isinstance(nodes, list):
+                found = {item['id']: item for item in nodes}
+        ancestors = []
+        while parent_id:
+            parent = found.get(parent_id)
+            if parent is None:
+                parent = self.get_node(parent_id)
+            elif self._node_cache is not None:
+                self._node_cache.put(parent)
+            ancestors.append(parent)
+            parent_id = parent.get('parent')
+        return ancestors
+
+    def _find_field(self, field, node):
+        """
+        Return the first found dict containing a field of a given name in a
+        node, without looking at its ancestors.
         """
         for item in node:
             if isinstance(node[item], dict):
-                base_object = self._find_container(field, node[item])
+                base_object = self._find_field(field, node[item])
                 if base_object:
                     return base_object
             elif field == item:
                 return node
+        return None
+
+    def _find_container(self, field, node, ancestors=None):
+        """
+        Return the first found dict containing a field of a given name,
+        recursing through all of the node's ancestors if not found.  If the
+        list of `ancestors` has already been resolved, no other nodes are
+        retrieved from the API.
+        """
+        base_object = self._find_field(field, node)
+        if base_object:
+            return base_object
+        if ancestors is not None:
+            for ancestor in ancestors:
+                base_object = self._find_field(field, ancestor)
+                if base_object:
+                    return base_object
+            return None
         if node.get('parent'):
-            parent = self._api.node.get(node['parent'])
+            parent = self.get_node(node['parent'])
             return self._find_container(field, parent)
         return None
 
-    def _is_allowed(self, rules, key, node):
+    def _is_allowed(self, rule, key, node, ancestors=None):
         """
         Check whether the value of a specific node attribute matches
         a filtering rule. As the specified attribute might not be present
@@ -161,12 +357,11 @@ class APIHelper:
 
         # Find the node (or ancestor node) attribute corresponding to the
         # rule we're applying
-        base = self._find_container(key, node)
+        base = self._find_container(key, node, ancestors)
         if not base:
             return True
 
-        deny = [f.lstrip('!') for f in rules[key] if f.startswith('!')]
-        allow = [f for f in rules[key] if not f.startswith('!')]
+        deny, allow = rule.deny, rule.allow
 
         # Rules are appied depending on how the data is initially stored:
         # * if it's a list (e.g. config fragments), then it must contain
@@ -185,117 +380,68 @@ class APIHelper:
 
             for item in base[key]:
                 if item in deny:
-                    print(f"rules{key}: {key.capitalize()} {item} not allowed due {deny}")
+                    print(f"rules{key}: {key.capitalize()} {item} not allowed "
+                          f"due {list(rule.deny_list)}")
                     return False
                 if item in allow:
                     found = True
 
             if not found:
-                print(f"rules: {key.capitalize()} missing one of {allow}")
+                print(f"rules: {key.capitalize()} missing one of {list(rule.allow_list)}")
                 return False
 
         else:
             if base[key] in deny or (len(allow) > 0 and base[key] not in allow):
-                print(f"rule[{key}]: {key.capitalize()} {base[key]} not allowed due {deny}")
+                print(f"rule[{key}]: {key.capitalize()} {base[key]} not allowed "
+                      f"due {list(rule.deny_list)}")
                 return False
 
         return True
 
-    def _extract_combos(self, rules, key):
+    def _is_tree_branch_allowed(self, node, ruleset):
         """
-        Process tree/branch rules and extract "combo" values.
+        Check whether the tree and/or branch for the current checkout matches
+        the corresponding filtering rules.
 
         Tree and branch rules can be formatted as `<tree>:<branch>`, meaning
         only a given branch is allowed for a specific tree. When prepended with
-        `!`, it indicates a forbidden tree/branch combination.
-
-        In order to simplify further processing, this function processes those
-        rules and returns lists of allowed/denied single values and combos.
-
-        Returns a tuple of 4 arrays:
-          * allowed single values
-          * allowed combinations
-          * denied single values
-          * denied combinations
-        """
-
-        allow = []
-        allow_combos = []
-        deny = []
-        deny_combos = []
-
-        for rule in rules[key]:
-            if ':' in rule:
-                combo = {}
-                # we use ':' as a tree/branch separator as this character is forbidden
-                # in git branch names, so if found it should be present only once.
-                [combo['tree'], combo['branch']] = rule.split(':', 1)
-                if combo['tree'].startswith('!'):
-                    combo['tree'] = combo['tree'].lstrip('!')
-                    deny_combos.append(combo)
-                else:
-                    allow_combos.append(combo)
-            else:
-                if rule.startswith('!'):
-                    deny.append(rule.lstrip('!'))
-                else:
-                    allow.append(rule)
-
-        return (allow, allow_combos, deny, deny_combos)
-
-    def _match_combos(self, node, combos):
-        """
-        Check whether the current node's tree/branch attributes match one of the
-        combinations present in combos.
-
-        Returns the matched combo or None.
-        """
-        match = None
-        for combo in combos:
-            if node['tree'] == combo['tree'] and node['branch'] == combo['branch']:
-                match = combo
-                break
-        return match
-
-    def _is_tree_branch_allowed(self, node, rules):
-        """
-        Check whether the tree and/or branch for the current checkout matches
-        the corresponding filtering rules.
+        `!`, it indicates a forbidden tree/branch combination.  These "combo"
+        values are extracted when compiling the rules into a RuleSet.
 
         Returns True if the rules allow the current value, False otherwise.
         """
-        for key in ("tree", "branch"):
-            if key in rules:
-                (allow, allow_combos, deny, deny_combos) = self._extract_combos(rules, key)
-                # Process combos first:
-                # * if the tree/branch combination matches an allowed combo, then the node
-                #   fulfills the tree/branch rules and we can move forward to processing
-                #   the other rules
-                # * likewise, if the combination matches a denied combo, then we can stop
-                #   processing here and reject the node creation altogether
-                if self._match_combos(node, allow_combos):
-                    break
-                match = self._match_combos(node, deny_combos)
-                if match:
-                    print(f"Tree/branch combination "
-                          f"{match['tree']}/{match['branch']} not allowed")
-                    return False
+        combo = (node['tree'], node['branch'])
+        for key, rule in ruleset.tree_branch:
+            # Process combos first:
+            # * if the tree/branch combination matches an allowed combo, then the node
+            #   fulfills the tree/branch rules and we can move forward to processing
+            #   the other rules
+            # * likewise, if the combination matches a denied combo, then we can stop
+            #   processing here and reject the node creation altogether
+            if combo in rule.allow_combos:
+                break
+            if combo in rule.deny_combos:
+                print(f"Tree/branch combination "
+                      f"{combo[0]}/{combo[1]} not allowed")
+                return False
 
-                # Get back to regular allow/deny list processing
-                if node[key] in deny:
-                    print(f"{key.capitalize()} {node[key]} not allowed due {deny}")
-                    return False
-                if (len(allow) == 0 and len(allow_combos) > 0):
-                    print(f"{key.capitalize()} {node[key]} not allowed due"
-                          f" to tree/branch rules")
-                    return False
-                if (len(allow) > 0 and node[key] not in allow):
-                    print(f"{key.capitalize()} {node[key]} not allowed due {allow}")
-                    return False
+            # Get back to regular allow/deny list processing
+            if node[key] in rule.deny:
+                print(f"{key.capitalize()} {node[key]} not allowed due "
+                      f"{list(rule.deny_list)}")
+                return False
+            if (len(rule.allow) == 0 and len(rule.allow_combos) > 0):
+                print(f"{key.capitalize()} {node[key]} not allowed due"
+                      f" to tree/branch rules")
+                return False
+            if (len(rule.allow) > 0 and node[key] not in rule.allow):
+                print(f"{key.capitalize()} {node[key]} not allowed due "
+                      f"{list(rule.allow_list)}")
+                return False
 
         return True
 
-    def should_create_node(self, rules, node):
+    def should_create_node(self, rules, node, ancestors=None):
         """
         Check whether a node should be created based on configured rules.
         Those can be specified in the job, platform or runtime configuration
@@ -350,8 +496,17 @@ class APIHelper:
             fragments:
               - 'kselftest'
               - '!arm64-chromebook'
+
+        The `rules` can be either a dictionary as defined in the YAML
+        configuration or a RuleSet object already compiled from it, which
+        avoids parsing the rules again for each node.
+
+        If the list of `ancestors` of the node has already been resolved, for
+        example with get_ancestors(), it's used to look up the attributes not
+        found in the node itself instead of retrieving each parent node.
         """
-        if rules is None:
+        ruleset = RuleSet.compile(rules)
+        if ruleset is None:
             return True
 
         # Process the tree and branch rules first as they need specific processing
@@ -359,37 +514,29 @@ class APIHelper:
 
         # Find the node (or ancestor node) attribute containing the "tree" (and therefore
         # "branch") value
-        ref_base = self._find_container("tree", node)
-        if ref_base and not self._is_tree_branch_allowed(ref_base, rules):
-            return False
-
-        for key in rules:
-            # Skip tree and branch rules as we already processed them above
-            if key in ("tree", "branch"):
-                continue
+        if ruleset.tree_branch:
+            ref_base = self._find_container("tree", node, ancestors)
+            if ref_base and not self._is_tree_branch_allowed(ref_base, ruleset):
+                return False
 
+        for key, rule in ruleset.checks:
             # Special case as there is no field in the node giving us the full
             # kernel version in "x.y" format
-            if key.endswith('_version'):
+            if isinstance(rule, VersionRule):
                 kver = node['data']['kernel_revision']['version']
                 major = kver['version']
                 minor = kver['patchlevel']
-                rule_major = rules[key]['version']
-                rule_minor = rules[key]['patchlevel']
-                if (key.startswith('min') and
-                    ((major < rule_major) or
-                     (major == rule_major and minor < rule_minor))):
+                rule_major, rule_minor = rule.bound
+                if key.startswith('min') and (major, minor) < rule.bound:
                     print(f"rules: Version {major}.{minor} older than minimum version "
                           f"({rule_major}.{rule_minor})")
                     return False
-                if (key.startswith('max') and
-                    ((major > rule_major) or
-                     (major == rule_major and minor > rule_minor))):
+                if key.startswith('max') and (major, minor) > rule.bound:
                     print(f"rules: Version {major}.{minor} more recent than maximum version "
                           f"({rule_major}.{rule_minor})")
                     return False
 
-            elif not self._is_allowed(rules, key, node):
+            elif not self._is_allowed(rule, key, node, ancestors):
                 return False
 
         return True
@@ -439,10 +586,23 @@ class APIHelper:
 
         return False
 
-    # pylint: disable=too-many-arguments
-    def create_job_node(self, job_config, input_node,
-                        runtime=None, platform=None, retry_counter=0):
-        """Create a new job node based on input and configuration"""
+    def _resolve_rules_ancestors(self, input_node, rules):
+        """Get the input node and its ancestors if any rules are defined
+
+        The ancestors are only retrieved if a rule isn't answered by the
+        input node, and then kept to evaluate the other rules.
+        """
+        if any(rules):
+            return _Ancestors(self, input_node)
+        return None
+
+    def _make_job_node(self, job_config, input_node, retry_counter,
+                       ancestors):
+        """Make a job node and apply the job filter and job rules
+
+        Return the job node data without any runtime or platform specific
+        fields, or None if the node should not be created.
+        """
         jobfilter = input_node.get('jobfilter')
         platform_filter = input_node.get('platform_filter')
         treeid = input_node.get('treeid')
@@ -471,7 +631,7 @@ class APIHelper:
                   f"not found in jobfilter for node {input_node['id']}")
             return None
 
-        if not self.should_create_node(job_config.rules, job_node):
+        if not self.should_create_node(job_config.ruleset, job_node, ancestors):
             print(f"Not creating node due to job rules for {job_config.name} "
                   f"evaluating node {input_node['id']}")
             return None
@@ -483,13 +643,25 @@ class APIHelper:
             job_node['data']['defconfig'] = input_node['data'].get('defconfig')
             job_node['data']['config_full'] = input_node['data'].get('config_full')
             job_node['data']['compiler'] = input_node['data'].get('compiler')
+        return job_node
+
+    # pylint: disable=too-many-arguments
+    def _target_job_node(self, job_node, job_config, input_node,
+                         runtime, platform, ancestors):
+        """Add the runtime and platform fields to a job node
+
+        Return the job node data updated in place for the given runtime and
+        platform, or None if their rules prevent the node from being created.
+        """
+        platform_filter = input_node.get('platform_filter')
         # This information is highly useful, as we might
         # extract from it the following, for example:
         # in case of lab: lab-name, device-name
         # in case of kubernetes: cluster name
         if runtime:
             job_node['data']['runtime'] = runtime.config.name
-            if not self.should_create_node(runtime.config.rules, job_node):
+            if not self.should_create_node(runtime.config.ruleset, job_node,
+                                           ancestors):
                 print(f"Not creating node {input_node['id']} due to runtime rules "
                       f"for {runtime.config.name}")
                 return None
@@ -502,7 +674,8 @@ class APIHelper:
                       f"for node {input_node['id']}")
                 return None
             job_node['data']['platform'] = platform.name
-            if not self.should_create_node(platform.rules, job_node):
+            if not self.should_create_node(platform.ruleset, job_node,
+                                           ancestors):
                 print(f"Not creating node {input_node['id']} due to platform rules "
                       f"for {platform.name}")
                 return None
@@ -522,10 +695,132 @@ class APIHelper:
             except Exception as error:
                 print(f"Exception Error, node id: {input_node['id']}, {error}")
                 raise error
+        return job_node
+
+    def _is_indexed_out(self, job_config, platform, candidates):
+        """Check whether the index rules out a job on a platform"""
+        if candidates is None or platform is None:
+            return False
+        key = (job_config.name, platform.name)
+        if key in self._index and key not in candidates:
+            print(f"Not creating node due to indexed rules for "
+                  f"{job_config.name} on {platform.name}")
+            return True
+        return False
+
+    def get_index_candidates(self, input_node):
+        """Get the index candidates for an input node, or None if no index
+
+        This can be computed once per input node and passed to
+        create_job_node() or create_job_nodes() for each job to create.
+        """
+        if self._index is None:
+            return None
+        return self._index.candidates(input_node)
+
+    # pylint: disable=too-many-arguments
+    def create_job_node(self, job_config, input_node,
+                        runtime=None, platform=None, retry_counter=0,
+                        candidates=None):
+        """Create a new job node based on input and configuration
+
+        The index `candidates` from get_index_candidates() can be provided
+        to avoid computing them again for each job with the same input node.
+        """
+        if candidates is None:
+            candidates = self.get_index_candidates(input_node)
+        if self._is_indexed_out(job_config, platform, candidates):
+            return None
+        # Resolve all the ancestors once if they're needed to apply the rules
+        ancestors = self._resolve_rules_ancestors(input_node, (
+            job_config.ruleset,
+            runtime and runtime.config.ruleset,
+            platform and platform.ruleset,
+        ))
+        job_node = self._make_job_node(
+            job_config, input_node, retry_counter, ancestors
+        )
+        if job_node is None:
+            return None
+        job_node = self._target_job_node(
+            job_node, job_config, input_node, runtime, platform, ancestors
+        )
+        if job_node is None:
+            return None
         try:
-            return self._api.node.add(job_node)
+            node = self._api.node.add(job_node)
         except requests.exceptions.HTTPError as error:
             raise RuntimeError(json.loads(error.response.content)) from error
+        if self._node_cache is not None:
+            self._node_cache.put(node)
+        return node
+
+    # pylint: disable=too-many-arguments
+    def create_job_nodes(self, job_config, input_node, targets,
+                         retry_counter=0, candidates=None):
+        """Create job nodes for a list of runtimes and platforms
+
+        This is equivalent to calling create_job_node() for each (runtime,
+        platform) 2-tuple in `targets`, but the job filter and job rules are
+        only evaluated once and all the resulting nodes are submitted
+        together as a batch.  Return a list with the created nodes, or None
+        for the targets where no node was created.  If some nodes could not
+        be created, a RuntimeError is raised with the error details and the
+        list of nodes as arguments, with None in place of the failed ones.
+        The index `candidates` can be provided as with create_job_node().
+        """
+        targets = list(targets)
+        if candidates is None:
+            candidates = self.get_index_candidates(input_node)
+        selected = [
+            not self._is_indexed_out(job_config, platform, candidates)
+            for _, platform in targets
+        ]
+        ancestors = self._resolve_rules_ancestors(input_node, [
+            job_config.ruleset,
+        ] + [
+            rules
+            for (runtime, platform), sel in zip(targets, selected) if sel
+            for rules in (runtime and runtime.config.ruleset,
+                          platform and platform.ruleset)
+        ])
+        base_node = self._make_job_node(
+            job_config, input_node, retry_counter, ancestors
+        ) if any(selected) else None
+        if base_node is None:
+            return [None] * len(targets)
+        job_nodes = [
+            self._target_job_node(
+                copy.deepcopy(base_node), job_config, input_node,
+                runtime, platform, ancestors
+            ) if sel else None
+            for (runtime, platform), sel in zip(targets, selected)
+        ]
+        added, error = self._add_job_nodes(
+            [job_node for job_node in job_nodes if job_node]
+        )
+        nodes = [next(added) if job_node else None for job_node in job_nodes]
+        if error is not None:
+            detail = json.loads(error.response.content) \
+                if error.response is not None else str(error)
+            raise RuntimeError(detail, nodes) from error
+        return nodes
+
+    def _add_job_nodes(self, job_nodes):
+        """Add job nodes and get an iterator with them and the first error
+
+        The nodes which could not be created are replaced with None.
+        """
+        nodes = self._api.node.add_many(job_nodes, return_exceptions=True)
+        errors = [node for node in nodes if isinstance(node, Exception)]
+        nodes = [
+            None if isinstance(node, Exception) else node for node in nodes
+        ]
+        if self._node_cache is not None:
+            for node in nodes:
+                if node:
+                    self._node_cache.put(node)
+        return iter(nodes), errors[0] if errors else None
 
     def submit_regression(self, regression):
         """Post a regression object
@@ -540,19 +835,7 @@ class APIHelper:
             raise RuntimeError(json.loads(error.response.content)) from error
 
     def _prepare_results(self, results, parent, base):
-        node = results['node'].copy()
-        # Merge `Node.data` instead of overwriting it
-        for key, value in base.items():
-            if isinstance(value, dict):
-                if node.get(key):
-                    node[key].update(value)
-                else:
-                    node.update({key: value})
-            else:
-                node[key] = value
-        node['path'] = (parent['path'] if parent else []) + [node['name']]
-        if 'kind' not in node:
-            node['kind'] = parent['kind']
+        node = prepare_node(results['node'], parent, base)
         child_nodes = []
         for child_node in results['child_nodes']:
             child_nodes.append(self._prepare_results(child_node, node, base))
@@ -561,7 +844,56 @@ class APIHelper:
             'child_nodes': child_nodes,
         }
 
-    def submit_results(self, results, root):
+    @classmethod
+    def _get_results_root(cls, results, root):
+        """Get a copy of the root node updated with its own results"""
+        root_node = root.copy()
+        root_node['result'] = results['node']['result']
+        root_node['state'] = results['node'].get('state', 'done')
+        if root_node.get('artifacts') is None:
+            root_node['artifacts'] = {}
+        root_node['artifacts'].update(results['node']['artifacts'])
+        root_node['data'].update(results['node'].get('data', {}))
+        root_node['processed_by_kcidb_bridge'] = False
+        if 'holdoff' in results['node']:
+            root_node['holdoff'] = results['node']['holdoff']
+        if root_node['result'] != 'incomplete':
+            data = root_node.get('data', {})
+            if data.get('error_code') == 'node_timeout':
+                root_node['data']['error_code'] = None
+                root_node['data']['error_msg'] = None
+        return root_node
+
+    @classmethod
+    def _get_results_base(cls, root):
+        """Get the fields from the root node to add to all the results"""
+        return {
+            'data': {
+                'kernel_revision': root['data'].get('kernel_revision'),
+                'kernel_type': root['data'].get('kernel_type'),
+                'arch': root['data'].get('arch'),
+                'defconfig': root['data'].get('defconfig'),
+                'config_full': root['data'].get('config_full'),
+                'compiler': root['data'].get('compiler'),
+                'platform': root['data'].get('platform'),
+                'runtime': root['data'].get('runtime'),
+            },
+            'group': root['name'],
+            'processed_by_kcidb_bridge': False,
+        }
+
+    def _get_results_parent(self, root):
+        """Get the parent fields needed to prepare results for a root node
+
+        Only the parent `path` and `kind` are used, which can be inferred
+        from the root node itself if it was retrieved from the API.  The
+        parent node is retrieved otherwise, from the node cache if enabled.
+        """
+        if root.get('path') and root.get('kind'):
+            return {'path': root['path'][:-1], 'kind': root['kind']}
+        return self.get_node(root['parent'])
+
+    def submit_results(self, results, root, parent=None):
         """Submit a hierarchy of results
 
         Submit a hierarchy of test results with 'node' containing data for a
@@ -570,6 +902,9 @@ class APIHelper:
         previously retrieved from the API with an existing id.
 
         `root` is the root node for all the child results
+        `parent` is the parent of the root node, or any dictionary with its
+            `path` and `kind`.  It's only retrieved from the API if not
+            provided and if the root node doesn't have a `path` and `kind`.
         `results` are the child results with the following recursive format:
         {
             "node": {
@@ -589,53 +924,56 @@ class APIHelper:
         Logic need fix:
         https://github.com/kernelci/kernelci-core/issues/2386
         """
-        root_from_db = self.api.node.get(root['id'])
-        root_node = merge(root_from_db, root)
-        root_node = root.copy()
-        root_node['result'] = results['node']['result']
-        root_node['state'] = results['node'].get('state', 'done')
-        if root_node.get('artifacts') is None:
-            root_node['artifacts'] = {}
-        root_node['artifacts'].update(results['node']['artifacts'])
-        root_node['data'].update(results['node'].get('data', {}))
-        root_node['processed_by_kcidb_bridge'] = False
-        if 'holdoff' in results['node']:
-            root_node['holdoff'] = results['node']['holdoff']
-        if root_node['result'] != 'incomplete':
-            data = root_node.get('data', {})
-            if data.get('error_code') == 'node_timeout':
-                root_node['data']['error_code'] = None
-                root_node['data']['error_msg'] = None
-
+        root_node = self._get_results_root(results, root)
         root_results = {
             'node': root_node,
             'child_nodes': results['child_nodes'],
         }
-        parent = self.api.node.get(root['parent'])
-        base = {
-            'data': {
-                'kernel_revision': root['data'].get('kernel_revision'),
-                'kernel_type': root['data'].get('kernel_type'),
-                'arch': root['data'].get('arch'),
-                'defconfig': root['data'].get('defconfig'),
-                'config_full': root['data'].get('config_full'),
-                'compiler': root['data'].get('compiler'),
-                'platform': root['data'].get('platform'),
-                'runtime': root['data'].get('runtime'),
-            },
-            'group': root['name'],
-            'processed_by_kcidb_bridge': False,
-        }
+        if parent is None:
+            parent = self._get_results_parent(root)
+        base = self._get_results_base(root)
         data = self._prepare_results(root_results, parent, base)
         # Once this has been consolidated at the API level:
         # self.api.create_node_hierarchy(data)
         node_id = data['node']['id']
+        if self._node_cache is not None:
+            self._node_cache.invalidate(node_id)
         # pylint: disable=protected-access
         try:
             return self.api._put(f'nodes/{node_id}', data).json()
         except requests.exceptions.HTTPError as error:
             raise RuntimeError(json.loads(error.response.content)) from error
 
+    # pylint: disable=too-many-arguments
+    def submit_results_chunked(self, results, root, parent=None,
+                               max_nodes=1000, max_bytes=1024 * 1024,
+                               state_path=None):
+        """Submit a large hierarchy of results in chunks
+
+        This is the same as submit_results() but the results are prepared
+        and sent one suite at a time in requests of up to `max_nodes` nodes
+        and `max_bytes` bytes, and the root node is updated last.  If
+        `state_path` is provided, the progress is saved in this file so the
+        submission can be resumed by calling this method again with the same
+        arguments if it failed.  See ResultsSubmitter for more details.
+        """
+        original = copy.deepcopy(root)
+        root_node = self._get_results_root(results, root)
+        if parent is None:
+            parent = self._get_results_parent(root)
+        base = self._get_results_base(root)
+        if self._node_cache is not None:
+            self._node_cache.invalidate(root['id'])
+        submitter = ResultsSubmitter(self.api, max_nodes, max_bytes,
+                                     state_path)
+        try:
+            return submitter.submit(
+                original, prepare_node(root_node, parent, base),
+                results['child_nodes'], base
+            )
+        except requests.exceptions.HTTPError as error:
+            raise RuntimeError(json.loads(error.response.content)) from error
+
     def set_kv(self, namespace, key, value):
         """Set a key-value pair in the API"""
         try:
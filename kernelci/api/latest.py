@@ -6,13 +6,19 @@
 
 """KernelCI API bindings for the latest version"""
 
+import collections
+import concurrent.futures
+import copy
 import enum
 import json
-from typing import Dict, Optional, Sequence
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence
 
-from cloudevents.http import from_json
+from cloudevents.http import CloudEvent, from_json
+import requests
 
-from . import API
+from . import API, AsyncAPI, Data
+from .events import EventStream
 
 
 class NodeStates(enum.Enum):
@@ -23,6 +29,29 @@ class NodeStates(enum.Enum):
     DONE = 'done'
 
 
+def make_patch(old: dict, new: dict, path: str = '') -> List[dict]:
+    """Make a JSON Patch (RFC 6902) with the changes from old to new
+
+    Dictionaries are compared recursively and any other changed values,
+    including lists, are replaced as a whole.
+    """
+    def _path(key):
+        return '/'.join((path, str(key).replace('~', '~0').replace('/', '~1')))
+
+    ops = []
+    for key, value in new.items():
+        if key not in old:
+            ops.append({'op': 'add', 'path': _path(key), 'value': value})
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            ops.extend(make_patch(old[key], value, _path(key)))
+        elif value != old[key]:
+            ops.append({'op': 'replace', 'path': _path(key), 'value': value})
+    ops.extend(
+        {'op': 'remove', 'path': _path(key)} for key in old if key not in new
+    )
+    return ops
+
+
 class LatestAPI(API):  # pylint: disable=too-many-public-methods
     """Latest API version
 
@@ -61,6 +90,17 @@ class LatestAPI(API):  # pylint: disable=too-many-public-methods
             params = attributes.copy() if attributes else {}
             return self._get_paginated(params, 'users', offset, limit)
 
+        def iter_find(
+            self, attributes: Dict[str, str], page_length: int = 100
+        ) -> Iterator[dict]:
+            """Iterate over the users that match the provided attributes
+
+            Users are fetched from the API one page of `page_length` items at
+            a time, with the next page being prefetched in the background.
+            """
+            params = attributes.copy() if attributes else {}
+            return self._iter_paginated(params, 'users', page_length)
+
         def add(self, user: dict) -> dict:
             return self._post('user/register', user).json()
 
@@ -98,22 +138,125 @@ class LatestAPI(API):  # pylint: disable=too-many-public-methods
             return self._post('user/update-password', data, json_data=False)
 
     class Node(API.Node):
-        """Node bindings for the latest API version"""
+        """Node bindings for the latest API version
+
+        If patch_updates is enabled in the API configuration, a copy of the
+        last known state of the most recently retrieved or updated nodes is
+        kept so that update() only needs to send the fields which have
+        changed, as a JSON Patch.  Full nodes are sent instead if there is no
+        copy of the original node or if the API doesn't accept patches.
+
+        Concurrent calls to get() for the same node id are coalesced: while
+        a request is in flight, other callers wait for its response instead
+        of sending the same request again and each get their own copy of the
+        node.
+        """
+
+        MAX_SNAPSHOTS = 1024
+
+        def __init__(self, data: Data):
+            super().__init__(data)
+            self._snapshots: collections.OrderedDict = \
+                collections.OrderedDict()
+            self._lock = threading.Lock()
+            self._use_patch = bool(data.config.patch_updates)
+            self._in_flight: Dict[str, list] = {}
+            self._requests = 0
+            self._coalesced = 0
 
         @property
         def states(self):
             return NodeStates
 
+        def _save(self, node: dict) -> dict:
+            """Keep a copy of a node as retrieved from the API if needed"""
+            if self._use_patch and isinstance(node, dict) and node.get('id'):
+                snapshot = copy.deepcopy(node)
+                with self._lock:
+                    self._snapshots[node['id']] = snapshot
+                    self._snapshots.move_to_end(node['id'])
+                    if len(self._snapshots) > self.MAX_SNAPSHOTS:
+                        self._snapshots.popitem(last=False)
+            return node
+
+        @property
+        def coalesced(self) -> int:
+            """Number of get() calls served by another in-flight request"""
+            return self._coalesced
+
+        def stats(self) -> dict:
+            """Get the get() requests and coalesced calls counters"""
+            return {'requests': self._requests, 'coalesced': self._coalesced}
+
         def get(self, node_id: str) -> dict:
-            return self._get(f'node/{node_id}').json()
+            with self._lock:
+                in_flight = self._in_flight.get(node_id)
+                if in_flight is None:
+                    future: concurrent.futures.Future = \
+                        concurrent.futures.Future()
+                    self._in_flight[node_id] = [future, 0]
+                    self._requests += 1
+                else:
+                    in_flight[1] += 1
+                    self._coalesced += 1
+            if in_flight is not None:
+                return copy.deepcopy(in_flight[0].result())
+            try:
+                node = self._save(self._get(f'node/{node_id}').json())
+            except BaseException as exc:
+                with self._lock:
+                    self._in_flight.pop(node_id)
+                future.set_exception(exc)
+                raise
+            with self._lock:
+                waiters = self._in_flight.pop(node_id)[1]
+            # Waiters get copies of a private copy as the caller may modify it
+            future.set_result(copy.deepcopy(node) if waiters else None)
+            return node
+
+        def get_many(self, node_ids: Sequence[str]) -> Sequence[dict]:
+            """Get several node objects
+
+            The nodes are retrieved with concurrent requests over the pool of
+            persistent connections, and returned in the same order as the
+            input node ids.
+            """
+            if len(node_ids) <= 1:
+                return [self.get(node_id) for node_id in node_ids]
+            with concurrent.futures.ThreadPoolExecutor(
+                    min(len(node_ids), self.data.config.pool_size)) as executor:
+                return list(executor.map(self.get, node_ids))
 
         def find(
             self, attributes: Dict[str, str],
-            offset: Optional[int] = None, limit: Optional[int] = None
+            offset: Optional[int] = None, limit: Optional[int] = None,
+            workers: Optional[int] = None,
         ) -> Sequence[dict]:
+            """Find nodes that match the provided attributes
+
+            If `workers` is set and neither `offset` nor `limit` are provided,
+            the matching nodes are counted first and then all the pages are
+            retrieved concurrently with up to `workers` requests at a time.
+            """
             params = attributes.copy() if attributes else {}
+            if workers and not any((offset, limit)):
+                total = self.count(params)
+                return self._get_parallel(params, 'nodes', total, workers)
             return self._get_paginated(params, 'nodes', offset, limit)
 
+        def iter_find(
+            self, attributes: Dict[str, str], page_length: int = 100
+        ) -> Iterator[dict]:
+            """Iterate over the nodes that match the provided attributes
+
+            Nodes are fetched from the API one page of `page_length` items at
+            a time, with the next page being prefetched in the background.
+            This keeps memory usage bounded when finding a large number of
+            nodes, unlike find() which returns them all in a single list.
+            """
+            params = attributes.copy() if attributes else {}
+            return self._iter_paginated(params, 'nodes', page_length)
+
         def findfast(
             self, attributes: Dict[str, str],
         ) -> dict:
@@ -128,9 +271,42 @@ class LatestAPI(API):  # pylint: disable=too-many-public-methods
             return self._get('count', params=attributes).json()
 
         def add(self, node: dict) -> dict:
-            return self._post('node', node).json()
+            return self._save(self._post('node', node).json())
+
+        def add_many(self, nodes: Sequence[dict],
+                     return_exceptions: bool = False) -> Sequence:
+            """Create several new node objects
+
+            The nodes are sent as concurrent requests over the pool of
+            persistent connections, and the created nodes are returned in the
+            same order as the input ones.  All the requests are completed
+            even if some of them fail.  If `return_exceptions` is True, the
+            exceptions are then returned in place of the nodes which could
+            not be created.  Otherwise, the first exception is raised and
+            the nodes which were created can't be told apart.
+            """
+            def _add(node):
+                try:
+                    return self.add(node)
+                except Exception as exc:  # pylint: disable=broad-except
+                    if not return_exceptions:
+                        raise
+                    return exc
+
+            if len(nodes) <= 1:
+                return [_add(node) for node in nodes]
+            with concurrent.futures.ThreadPoolExecutor(
+                    min(len(nodes), self.data.config.pool_size)) as executor:
+                futures = [executor.submit(_add, node) for node in nodes]
+            return [future.result() for future in futures]
 
         def update(self, node: dict, noevent=False) -> dict:
+            """Update an existing node object (with id)
+
+            If patch_updates is enabled in the API configuration, only the
+            changes since the node was last retrieved or updated with this
+            object are sent if possible, see make_patch().
+            """
             if node['result'] != 'incomplete':
                 data = node.get('data', {})
                 if data.get('error_code') == 'node_timeout':
@@ -139,7 +315,45 @@ class LatestAPI(API):  # pylint: disable=too-many-public-methods
             uri = '/'.join(['node', node['id']])
             if noevent:
                 uri += '?noevent=true'
-            return self._put(uri, node).json()
+            with self._lock:
+                snapshot = self._snapshots.get(node['id'])
+            patch = make_patch(snapshot, node) if snapshot else None
+            if patch and self._use_patch:
+                try:
+                    return self._save(self._patch(uri, patch).json())
+                except requests.exceptions.HTTPError as error:
+                    if error.response.status_code not in (405, 415):
+                        raise
+                    self._use_patch = False
+                    with self._lock:
+                        self._snapshots.clear()
+            return self._save(self._put(uri, node).json())
+
+        def update_many(self, nodes: Sequence[dict], noevent=False,
+                        return_exceptions: bool = False) -> Sequence:
+            """Update several existing node objects
+
+            Each node is updated as with update(), so only the changed fields
+            are sent when possible, using concurrent requests over the pool
+            of persistent connections.  The updated nodes are returned in
+            the same order as the input ones.  All the requests are completed
+            even if some of them fail, and `return_exceptions` works as with
+            add_many().
+            """
+            def _update(node):
+                try:
+                    return self.update(node, noevent)
+                except Exception as exc:  # pylint: disable=broad-except
+                    if not return_exceptions:
+                        raise
+                    return exc
+
+            if len(nodes) <= 1:
+                return [_update(node) for node in nodes]
+            with concurrent.futures.ThreadPoolExecutor(
+                    min(len(nodes), self.data.config.pool_size)) as executor:
+                futures = [executor.submit(_update, node) for node in nodes]
+            return [future.result() for future in futures]
 
         def bulkset(self, nodes: list, field: str, value: str):
             """
@@ -179,16 +393,55 @@ class LatestAPI(API):  # pylint: disable=too-many-public-methods
                 continue
             return event
 
+    def subscribe_stream(self, channel: str,
+                         promisc: Optional[bool] = None) -> EventStream:
+        """Subscribe to a channel and receive its events with a stream
+
+        The returned EventStream object keeps a single connection open to
+        receive all the events from the subscription, which is made when
+        starting to iterate over it and removed when closing it.
+        """
+        return EventStream(self, channel, promisc)
+
     def push_event(self, list_name: str, data):
         self._post('/'.join(['push', list_name]), data)
 
     def pop_event(self, list_name: str):
         path = '/'.join(['pop', str(list_name)])
-        while True:
-            resp = self._get(path)
-            data = json.dumps(resp.json())
-            event = from_json(data)
-            return event
+        # Not sent again if the response is lost, see pop_events()
+        resp = self._get(path, retry_read=False)
+        data = json.dumps(resp.json())
+        event = from_json(data)
+        return event
+
+    def pop_events(self, list_name: str, max_items: int = 16,
+                   timeout: Optional[float] = None) -> Sequence[CloudEvent]:
+        """Pop up to `max_items` events from a given List in one request
+
+        The API returns a list of events if batch_pop is enabled in the API
+        configuration, or a single one otherwise in which case the timeout
+        isn't supported.  The request is never sent again once it may have
+        reached the server, as the popped events would then be lost.
+        """
+        path = f'pop/{list_name}'
+        if not self.config.batch_pop:
+            if timeout is not None:
+                raise ValueError(
+                    f"Timeout requires batch_pop in API {self.config.name}"
+                )
+            resp = self._get(path, retry_read=False)
+        else:
+            params: Dict[str, float] = {'max_items': max_items}
+            if timeout is not None:
+                params['timeout'] = timeout
+            resp = self._get(
+                path, params=params, retry_read=False,
+                timeout=self.data.timeout + (timeout or 0)
+            )
+        items = resp.json()
+        if isinstance(items, dict):
+            items = [items]
+        return [from_json(json.dumps(item)) for item in items]
 
     def subscription_stats(self):
         return self._get('stats/subscriptions').json()
@@ -222,6 +475,47 @@ class LatestAPI(API):  # pylint: disable=too-many-public-methods
         return self._get(f'kv/{namespace}/{key}').json()
 
 
+class AsyncLatestAPI(AsyncAPI):
+    """Asyncio bindings for the latest API version"""
+
+    class Node(AsyncAPI.Node):
+        """Asyncio node bindings for the latest API version"""
+
+        async def findfast(self, attributes: Dict[str, str]) -> dict:
+            """Find nodes using the non-paginated endpoint"""
+            return await self._run(self.sync.findfast, attributes)
+
+        async def update(self, node: dict, noevent=False) -> dict:
+            return await self._run(self.sync.update, node, noevent)
+
+        async def update_many(self, nodes: Sequence[dict], noevent=False,
+                              return_exceptions: bool = False) -> Sequence:
+            """Update several existing node objects"""
+            return await self._run(
+                self.sync.update_many, nodes, noevent, return_exceptions
+            )
+
+        async def bulkset(self, nodes: list, field: str, value: str):
+            """Set a field to a value for a list of nodes(ids)"""
+            return await self._run(self.sync.bulkset, nodes, field, value)
+
+    async def receive_event(self, sub_id: int, block: bool = True):
+        return await self._listen(self.sync.receive_event, sub_id, block)
+
+    async def set_kv(self, namespace: str, key: str, value: str):
+        """Set a key-value pair in the database"""
+        return await self._run(self.sync.set_kv, namespace, key, value)
+
+    async def get_kv(self, namespace: str, key: str) -> str:
+        """Get a value from the database"""
+        return await self._run(self.sync.get_kv, namespace, key)
+
+
 def get_api(config, token):
     """Get an API object for the latest version"""
     return LatestAPI(config, token)
+
+
+def get_async_api(config, token, max_workers=None, max_listeners=None):
+    """Get an AsyncAPI object for the latest version"""
+    return AsyncLatestAPI(LatestAPI(config, token), max_workers, max_listeners)
@@ -0,0 +1,224 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""KernelCI API client-side request rate and concurrency limits"""
+
+import math
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util import Retry
+
+
+class JitterRetry(Retry):
+    """Retry policy with a random jitter added to the exponential backoff
+
+    Half of each backoff delay is drawn at random so the clients which
+    failed at the same time don't all retry at the same time again.
+    """
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class RequestLimiter:  # pylint: disable=too-many-instance-attributes
+    """Token bucket and adaptive concurrency window for the API requests
+
+    Requests are started at up to `rate` per second on average with bursts
+    of up to `burst` requests, and up to `window` of them can be in flight
+    at the same time.  The window grows additively by one request per
+    window's worth of successful requests up to `max_concurrency`, and is
+    halved when a request gets a 429 or 5xx response or fails to connect.
+    Only the first congestion signal among the requests started before the
+    last decrease shrinks the window, so a burst of errors from a single
+    round of requests only halves it once.  Either limit is disabled if set
+    to None or 0.  All the methods are thread-safe.
+    """
+
+    _shared: Dict[tuple, 'RequestLimiter'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, rate: Optional[float] = None,
+                 burst: Optional[int] = None,
+                 max_concurrency: Optional[int] = None):
+        self._rate = rate
+        self._burst = burst or max(1, math.ceil(rate or 1))
+        self._tokens = float(self._burst)
+        self._stamp = time.monotonic()
+        self._max = max_concurrency
+        self._window = float(max_concurrency) if max_concurrency else math.inf
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def shared(cls, key, rate: Optional[float] = None,
+               burst: Optional[int] = None,
+               max_concurrency: Optional[int] = None) -> 'RequestLimiter':
+        """Get a limiter shared by all the API objects using the same key
+
+        A new limiter is created the first time a key is used with the given
+        parameters.  The key is typically the API URL so all the requests to
+        the same server in a process share the same budget, unless they are
+        made with different limits in which case they get separate limiters.
+        """
+        key = (key, rate, burst, max_concurrency)
+        with cls._shared_lock:
+            limiter = cls._shared.get(key)
+            if limiter is None:
+                limiter = cls(rate, burst, max_concurrency)
+                cls._shared[key] = limiter
+            return limiter
+
+    @property
+    def window(self) -> float:
+        """Current maximum number of requests in flight"""
+        return self._window
+
+    @property
+    def in_flight(self) -> int:
+        """Current number of requests in flight"""
+        return self._in_flight
+
+    def _reserve_token(self) -> float:
+        """Take a token and get the time to wait until it's available"""
+        if not self._rate:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(
+            self._burst, self._tokens + (now - self._stamp) * self._rate
+        )
+        self._stamp = now
+        self._tokens -= 1
+        return -self._tokens / self._rate if self._tokens < 0 else 0.0
+
+    def acquire(self, window: bool = True) -> float:
+        """Wait until a request can be started
+
+        Return the time when the request was started, to be passed to
+        release() when it has completed.  If `window` is False, only the
+        rate limit applies and release() must not be called.
+        """
+        with self._cond:
+            delay = self._reserve_token()
+        if delay:
+            time.sleep(delay)
+        if not window:
+            return time.monotonic()
+        with self._cond:
+            while self._max and self._in_flight >= int(self._window):
+                self._cond.wait()
+            self._in_flight += 1
+        return time.monotonic()
+
+    def release(self, started: float, congested: bool = False):
+        """Record that a request has completed and adjust the window"""
+        with self._cond:
+            self._in_flight -= 1
+            if self._max:
+                if not congested:
+                    self._window = min(
+                        self._max, self._window + 1 / self._window
+                    )
+                elif started >= self._last_decrease:
+                    self._window = max(1.0, self._window / 2)
+                    self._last_decrease = time.monotonic()
+            self._cond.notify_all()
+
+    @classmethod
+    def is_congested(cls, resp) -> bool:
+        """Check whether a response signals server overload
+
+        This is checked for each attempt when a request is retried, so only
+        the status of the response itself is taken into account.
+        """
+        return resp.status_code == 429 or resp.status_code >= 500
+
+
+class LimitedHTTPAdapter(HTTPAdapter):
+    """HTTP adapter sending all the requests through a RequestLimiter
+
+    The limiter slot is held while each attempt is sent, until the response
+    headers are received.  Retries are made here rather than by urllib3 so
+    every attempt takes a token and a slot in the concurrency window, and
+    the backoff delays are spent without holding a slot or a connection.
+    Long-polling requests to receive events are only subject to the rate
+    limit as they can be held by the server until an event is available,
+    which would otherwise block the other requests.
+    """
+
+    LONG_POLL = re.compile(r'/(listen|pop|stream)/[^/]+$')
+
+    def __init__(self, limiter: RequestLimiter, max_retries=0, **kwargs):
+        self._limiter = limiter
+        self._retries = Retry.from_int(max_retries)
+        super().__init__(**kwargs)
+
+    @property
+    def limiter(self) -> RequestLimiter:
+        """Request limiter object"""
+        return self._limiter
+
+    def _send_once(self, request, window, *args, **kwargs):
+        if not window:
+            self._limiter.acquire(window=False)
+            return super().send(request, *args, **kwargs)
+        started = self._limiter.acquire()
+        congested = True
+        try:
+            resp = super().send(request, *args, **kwargs)
+            congested = self._limiter.is_congested(resp)
+            return resp
+        finally:
+            self._limiter.release(started, congested)
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=W0221
+        window = not self.LONG_POLL.search(request.path_url.split('?', 1)[0])
+        retries = self._retries
+        while True:
+            try:
+                resp = self._send_once(request, window, *args, **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as exc:
+                error = exc.args[0] if exc.args else exc
+                try:
+                    retries = retries.increment(
+                        request.method, request.url,
+                        error=getattr(error, 'reason', None) or error,
+                    )
+                except (urllib3.exceptions.HTTPError, OSError):
+                    raise exc from None
+                retries.sleep()
+                continue
+            # Keep the history of the attempts made here with the response
+            resp.raw.retries = retries
+            has_retry_after = bool(resp.headers.get('Retry-After'))
+            if not retries.is_retry(request.method, resp.status_code,
+                                    has_retry_after):
+                return resp
+            try:
+                retries = retries.increment(
+                    request.method, request.url, response=resp.raw
+                )
+            except urllib3.exceptions.MaxRetryError as exc:
+                if retries.raise_on_status:
+                    resp.close()
+                    raise requests.exceptions.RetryError(
+                        exc, request=request
+                    ) from exc
+                return resp
+            retry_after = retries.get_retry_after(resp.raw) \
+                if retries.respect_retry_after_header else None
+            # Read the body to release the connection before waiting
+            resp.content  # pylint: disable=pointless-statement
+            resp.close()
+            if retry_after:
+                time.sleep(retry_after)
+            else:
+                retries.sleep()
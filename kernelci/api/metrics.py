@@ -0,0 +1,157 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""KernelCI API client-side request metrics"""
+
+import bisect
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+
+class APIMetrics:
+    """Latency histograms and counters for the API requests
+
+    Requests are recorded per HTTP method and endpoint template, with the
+    variable parts of the paths such as node ids replaced with placeholders
+    so `node/6332d8f51a45d41c279e7a01` is recorded as `node/{id}`.  For each
+    of them, the number of requests per status code, the number of retries
+    made by the urllib3 retry strategy, the request and response payload
+    sizes and a histogram of the latency in seconds are kept.  Requests
+    which failed without any response are recorded with an `error` status.
+    All the methods are thread-safe.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    TEMPLATES = [
+        (re.compile(r'^kv/[^/]+/[^/]+$'), 'kv/{namespace}/{key}'),
+        (re.compile(r'^(publish|push|pop|subscribe)/[^/]+$'), r'\1/{name}'),
+        (re.compile(r'(?<=/)([0-9a-f]{24}|[0-9]+)(?=/|$)'), '{id}'),
+    ]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[Tuple[str, str], dict] = {}
+        self._templates: Dict[str, str] = {}
+
+    def template(self, path: str) -> str:
+        """Get the endpoint template for a given API path"""
+        template = self._templates.get(path)
+        if template is None:
+            template = path.split('?', 1)[0].strip('/')
+            for regex, repl in self.TEMPLATES:
+                template = regex.sub(repl, template)
+            if len(self._templates) < 4096:
+                self._templates[path] = template
+        return template
+
+    def record(self, method: str, path: str, duration: float,
+               resp: Optional[requests.Response] = None):
+        """Record a request and its response if one was received"""
+        key = (method, self.template(path))
+        if resp is None:
+            status, retries, sent, received = 'error', 0, 0, 0
+        else:
+            status = str(resp.status_code)
+            history = getattr(getattr(resp.raw, 'retries', None),
+                              'history', None)
+            retries = len(history) if history else 0
+            body = resp.request.body if resp.request is not None else None
+            sent = len(body) if body else 0
+            received = int(resp.headers.get('Content-Length') or
+                           len(resp.content or b''))
+        bucket = bisect.bisect_left(self.BUCKETS, duration)
+        with self._lock:
+            stats = self._endpoints.get(key)
+            if stats is None:
+                stats = self._endpoints[key] = {
+                    'status': {},
+                    'retries': 0,
+                    'request_bytes': 0,
+                    'response_bytes': 0,
+                    'latency_sum': 0.0,
+                    'latency_buckets': [0] * (len(self.BUCKETS) + 1),
+                }
+            stats['status'][status] = stats['status'].get(status, 0) + 1
+            stats['retries'] += retries
+            stats['request_bytes'] += sent
+            stats['response_bytes'] += received
+            stats['latency_sum'] += duration
+            stats['latency_buckets'][bucket] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, str], dict]:
+        """Get a copy of the metrics for each (method, endpoint) key
+
+        Each entry has the request counts per `status`, the total number of
+        `retries`, `request_bytes` and `response_bytes`, the `latency_sum` in
+        seconds and the non-cumulative `latency_buckets` counts for each
+        upper bound in BUCKETS followed by the ones above the last bound.
+        """
+        with self._lock:
+            return {
+                key: dict(
+                    stats, status=dict(stats['status']),
+                    latency_buckets=list(stats['latency_buckets'])
+                )
+                for key, stats in self._endpoints.items()
+            }
+
+    def reset(self):
+        """Discard all the recorded metrics"""
+        with self._lock:
+            self._endpoints.clear()
+
+    def _histogram(self, name: str, labels: str, stats: dict) -> List[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.BUCKETS + ('+Inf',),
+                                stats['latency_buckets']):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f'{name}_sum{{{labels}}} {stats["latency_sum"]}')
+        lines.append(f'{name}_count{{{labels}}} {total}')
+        return lines
+
+    def to_prometheus(self, prefix: str = 'kernelci_api') -> str:
+        """Get the metrics in the Prometheus text exposition format"""
+        lines: Dict[str, List[str]] = {
+            'requests_total': [],
+            'retries_total': [],
+            'request_bytes_total': [],
+            'response_bytes_total': [],
+            'request_duration_seconds': [],
+        }
+        for (method, endpoint), stats in sorted(self.snapshot().items()):
+            labels = f'method="{method}",endpoint="{endpoint}"'
+            lines['requests_total'].extend(
+                f'{prefix}_requests_total{{{labels},status="{status}"}} '
+                f'{count}'
+                for status, count in sorted(stats['status'].items())
+            )
+            for name in ('retries', 'request_bytes', 'response_bytes'):
+                lines[f'{name}_total'].append(
+                    f'{prefix}_{name}_total{{{labels}}} {stats[name]}'
+                )
+            lines['request_duration_seconds'].extend(self._histogram(
+                f'{prefix}_request_duration_seconds', labels, stats
+            ))
+        output = []
+        for name, name_lines in lines.items():
+            kind = 'histogram' if name.endswith('seconds') else 'counter'
+            output.append(f'# TYPE {prefix}_{name} {kind}')
+            output.extend(name_lines)
+        return '\n'.join(output) + '\n'
+
+    def dump(self, path: str, prefix: str = 'kernelci_api'):
+        """Write the metrics in the Prometheus text format to a file
+
+        The file is replaced atomically so it can be read at any time, for
+        example by the node exporter textfile collector.
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as output:
+            output.write(self.to_prometheus(prefix))
+        os.replace(tmp_path, path)
@@ -0,0 +1,220 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""KernelCI API submission of test results hierarchies"""
+
+import hashlib
+import json
+import os
+from typing import Iterator, List, Optional, Tuple
+
+
+def prepare_node(results_node: dict, parent: Optional[dict],
+                 base: dict) -> dict:
+    """Prepare a results node to be submitted as a child of `parent`
+
+    The fields from `base` are added to a copy of the node, with the
+    dictionaries merged into the existing ones, and the node path and kind
+    are set using the parent node.
+    """
+    node = results_node.copy()
+    # Merge `Node.data` instead of overwriting it
+    for key, value in base.items():
+        if isinstance(value, dict):
+            if node.get(key):
+                node[key].update(value)
+            else:
+                node.update({key: value})
+        else:
+            node[key] = value
+    node['path'] = (parent['path'] if parent else []) + [node['name']]
+    if 'kind' not in node and parent is not None:
+        node['kind'] = parent['kind']
+    return node
+
+
+class ResultsSubmitter:
+    """Submit a hierarchy of results in chunks of bounded size
+
+    The hierarchy is walked iteratively, one suite at a time, and the
+    children of each node are prepared, serialized and sent in chunks of up
+    to `max_nodes` nodes or `max_bytes` bytes to the `nodes/<id>` endpoint of
+    their parent.  The ids of the created nodes are then used to submit
+    their own children in the same way.  The root node is updated last so
+    its final state is only visible once all the results are in the API.
+
+    Nodes are identified by their path, so a ValueError is raised before
+    sending anything if two sibling results have the same name.
+
+    If `state_path` is provided, the progress is saved in this JSON file
+    after each chunk.  Submitting the same results again with the same file,
+    for example after a timeout, then skips the chunks already sent.  The
+    chunk being sent is also recorded beforehand, so if its outcome isn't
+    known its nodes which were already created are looked up in the API and
+    only the other ones are sent again.  The file is removed once all the
+    results have been submitted.  As the chunks are identified by their
+    position in the hierarchy, the file also has the chunking parameters and
+    a digest of the results and a ValueError is raised if they don't match
+    when resuming.
+    """
+
+    def __init__(self, api, max_nodes: int = 1000,
+                 max_bytes: int = 1024 * 1024,
+                 state_path: Optional[str] = None):
+        self._api = api
+        self._max_nodes = max_nodes
+        self._max_bytes = max_bytes
+        self._state_path = state_path
+        self._requests = 0
+
+    @property
+    def requests(self) -> int:
+        """Number of requests sent by the last call to submit()"""
+        return self._requests
+
+    @classmethod
+    def _path_key(cls, node: dict) -> str:
+        return json.dumps(node['path'])
+
+    @classmethod
+    def _check_names(cls, children: List[dict]):
+        """Check that sibling results all have different names"""
+        stack = [children]
+        while stack:
+            nodes = stack.pop()
+            names = set()
+            for child in nodes:
+                name = child['node']['name']
+                if name in names:
+                    raise ValueError(f"Duplicate sibling result name: {name}")
+                names.add(name)
+                stack.append(child['child_nodes'])
+
+    def _load_state(self, root_id: str, digest: str) -> dict:
+        params = {
+            'max_nodes': self._max_nodes,
+            'max_bytes': self._max_bytes,
+            'digest': digest,
+        }
+        if self._state_path and os.path.exists(self._state_path):
+            with open(self._state_path, encoding='utf-8') as state_file:
+                state = json.load(state_file)
+            if state.get('root') == root_id:
+                for key, value in params.items():
+                    if state.get(key) != value:
+                        raise ValueError(
+                            f"Can't resume from {self._state_path}, "
+                            f"{key} has changed"
+                        )
+                return state
+        return dict(params, root=root_id, done=[], ids={})
+
+    @classmethod
+    def _digest(cls, children: List[dict], base: dict) -> str:
+        """Get a digest of the results to detect changes when resuming"""
+        data = json.dumps([children, base], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _save_state(self, state: dict):
+        if self._state_path:
+            tmp_path = self._state_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as state_file:
+                json.dump(state, state_file)
+            os.replace(tmp_path, self._state_path)
+
+    def _chunks(self, parent: dict, children: List[dict],
+                base: dict) -> Iterator[List[Tuple[dict, dict, str]]]:
+        """Get chunks of (results, prepared node, JSON) 3-tuples"""
+        chunk: List[Tuple[dict, dict, str]] = []
+        size = 0
+        for child in children:
+            node = prepare_node(child['node'], parent, base)
+            data = json.dumps({'node': node, 'child_nodes': []})
+            if chunk and (len(chunk) >= self._max_nodes or
+                          size + len(data) > self._max_bytes):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append((child, node, data))
+            size += len(data) + 1
+        if chunk:
+            yield chunk
+
+    def _put(self, parent: dict, children: List[str]) -> list:
+        body = ''.join((
+            '{"node": ', json.dumps(parent),
+            ', "child_nodes": [', ','.join(children), ']}',
+        ))
+        self._requests += 1
+        # pylint: disable=protected-access
+        return self._api._put(f"nodes/{parent['id']}", body).json()
+
+    def _submit_chunk(self, parent: dict, chunk: list, state: dict):
+        """Submit a chunk of child nodes and save the ids of the suites"""
+        created = self._put(parent, [data for _, _, data in chunk])
+        ids = {self._path_key(node): node['id'] for node in created}
+        for child, node, _ in chunk:
+            if child['child_nodes']:
+                path_key = self._path_key(node)
+                state['ids'][path_key] = ids[path_key]
+
+    def _reconcile_chunk(self, parent: dict, chunk: list, state: dict):
+        """Get the nodes of an interrupted chunk which weren't created"""
+        existing = {
+            node['name']: node['id']
+            for node in self._api.node.find({'parent': parent['id']})
+        }
+        missing = []
+        for child, node, data in chunk:
+            node_id = existing.get(node['name'])
+            if node_id is None:
+                missing.append((child, node, data))
+            elif child['child_nodes']:
+                state['ids'][self._path_key(node)] = node_id
+        return missing
+
+    def _submit_children(self, parent: dict, children: List[dict],
+                         base: dict, state: dict) -> list:
+        """Submit the children of a node and get the ones with children"""
+        prefix = self._path_key(parent)
+        pending = []
+        for index, chunk in enumerate(self._chunks(parent, children, base)):
+            key = f'{prefix}:{index}'
+            if key not in state['done']:
+                missing = chunk
+                if state.get('sending') == key:
+                    missing = self._reconcile_chunk(parent, chunk, state)
+                state['sending'] = key
+                self._save_state(state)
+                if missing:
+                    self._submit_chunk(parent, missing, state)
+                state['done'].append(key)
+                state['sending'] = None
+                self._save_state(state)
+            for child, node, _ in chunk:
+                if child['child_nodes']:
+                    node['id'] = state['ids'][self._path_key(node)]
+                    pending.append((node, child['child_nodes']))
+        return pending
+
+    def submit(self, root: dict, root_node: dict, children: List[dict],
+               base: dict) -> list:
+        """Submit all the results and return the updated root nodes
+
+        `root` is the root node as currently stored in the API which is
+        sent with the first level of children, `root_node` is the prepared
+        root node with its final results and `children` is the list of
+        child results as in APIHelper.submit_results().
+        """
+        self._requests = 0
+        self._check_names(children)
+        state = self._load_state(root['id'], self._digest(children, base))
+        root = dict(root, path=root_node['path'], kind=root_node['kind'])
+        stack = [(root, children)]
+        while stack:
+            parent, nodes = stack.pop()
+            stack.extend(reversed(
+                self._submit_children(parent, nodes, base, state)
+            ))
+        result = self._put(root_node, [])
+        if self._state_path and os.path.exists(self._state_path):
+            os.remove(self._state_path)
+        return result
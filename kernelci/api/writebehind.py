@@ -0,0 +1,252 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""KernelCI API write-behind queue for node updates"""
+
+import copy
+import json
+import os
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+
+class NodeUpdateQueue:  # pylint: disable=too-many-instance-attributes
+    """Write-behind queue to send node updates in batches
+
+    Updated nodes are kept in the queue and sent later on in batches using
+    concurrent requests with update_many() if available, each sending only
+    the changed fields when possible.  Successive updates to the same node
+    while it's in the queue are coalesced so only its last state is sent,
+    with events unless all the updates were made with `noevent`.
+
+    The queue is flushed by a background thread once it has `max_nodes`
+    nodes or `delay` seconds after the oldest pending update, as well as
+    when stopped.  If the API can't be reached or replies with a 429 or 5xx
+    error, the updates are kept in the queue and sent again after
+    `retry_delay` seconds.  Updates rejected with other errors or which
+    failed with any other exception are dropped and added to the `errors`
+    list.
+
+    If `spool_path` is provided, each update is also appended to this JSON
+    Lines file until it has been sent.  Any updates left in the file, for
+    example if the process was stopped during an API outage, are loaded in
+    the queue when it's created.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, api, max_nodes: int = 64, delay: float = 1.0,
+                 retry_delay: float = 5.0, spool_path: Optional[str] = None):
+        self._api = api
+        self._max_nodes = max_nodes
+        self._delay = delay
+        self._retry_delay = retry_delay
+        self._spool_path = spool_path
+        self._pending: Dict[str, Tuple[dict, bool]] = {}
+        self._first: Optional[float] = None
+        self._retry: Optional[float] = None
+        self._errors: List[tuple] = []
+        self._stats = {'updates': 0, 'coalesced': 0, 'sent': 0, 'batches': 0}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+        self._load_spool()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def pending(self) -> int:
+        """Number of nodes with updates not sent yet"""
+        return len(self._pending)
+
+    @property
+    def errors(self) -> List[tuple]:
+        """List of (node, exception) 2-tuples for the rejected updates"""
+        return list(self._errors)
+
+    def stats(self) -> dict:
+        """Get the number of updates, coalesced ones, sent nodes and batches"""
+        with self._cond:
+            return dict(self._stats)
+
+    def _load_spool(self):
+        if not self._spool_path or not os.path.exists(self._spool_path):
+            return
+        with open(self._spool_path, encoding='utf-8') as spool:
+            for line in spool:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:  # partly written last line
+                    continue
+                self._add(entry['node'], bool(entry['noevent']))
+        if self._pending:
+            self._first = time.monotonic()
+
+    def _write_spool(self, entries, replace=False):
+        if not self._spool_path:
+            return
+        path = self._spool_path + '.tmp' if replace else self._spool_path
+        with open(path, 'w' if replace else 'a', encoding='utf-8') as spool:
+            for node, noevent in entries:
+                spool.write(json.dumps({
+                    'node': node, 'noevent': noevent
+                }) + '\n')
+        if replace:
+            os.replace(path, self._spool_path)
+
+    def _add(self, node: dict, noevent: bool) -> bool:
+        """Add an update to the pending ones and tell if it was coalesced"""
+        queued = self._pending.pop(node['id'], None)
+        if queued is not None:
+            noevent = noevent and queued[1]
+        self._pending[node['id']] = (node, noevent)
+        return queued is not None
+
+    def update(self, node: dict, noevent: bool = False):
+        """Add a node update to the queue
+
+        A copy of the node is made so it can be modified again by the
+        caller before the update is sent.
+        """
+        node, noevent = copy.deepcopy(node), bool(noevent)
+        with self._cond:
+            self._write_spool([(node, noevent)])
+            if self._add(node, noevent):
+                self._stats['coalesced'] += 1
+            self._stats['updates'] += 1
+            if self._first is None:
+                self._first = time.monotonic()
+                self._cond.notify_all()
+            elif len(self._pending) >= self._max_nodes:
+                self._cond.notify_all()
+
+    @classmethod
+    def _is_transient(cls, exc: requests.exceptions.RequestException):
+        resp = exc.response
+        return resp is None or resp.status_code == 429 or \
+            resp.status_code >= 500
+
+    def _send(self, batch: List[Tuple[dict, bool]]) -> list:
+        """Send a batch of updates and get the ones to retry"""
+        retry: List[Tuple[dict, bool]] = []
+        for noevent in (False, True):
+            nodes = [node for node, flag in batch if bool(flag) == noevent]
+            if not nodes:
+                continue
+            update_many = getattr(self._api.node, 'update_many', None)
+            if update_many and len(nodes) > 1:
+                results = update_many(nodes, noevent, return_exceptions=True)
+            else:
+                results = [self._update(node, noevent) for node in nodes]
+            for node, result in zip(nodes, results):
+                if not isinstance(result, Exception):
+                    continue
+                if isinstance(result, requests.exceptions.RequestException) \
+                        and self._is_transient(result):
+                    retry.append((node, noevent))
+                else:
+                    self._errors.append((node, result))
+        return retry
+
+    def _update(self, node: dict, noevent: bool):
+        try:
+            return self._api.node.update(node, noevent)
+        except Exception as exc:  # pylint: disable=broad-except
+            return exc
+
+    def flush(self) -> bool:
+        """Send all the pending updates now
+
+        Return True if all the updates were sent or dropped due to errors,
+        or False if some of them are kept to be sent again later.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = list(self._pending.values())
+                self._pending.clear()
+                self._first = None
+            if not batch:
+                return True
+            try:
+                retry = self._send(batch)
+            except BaseException:
+                # Keep the whole batch to send it again later
+                with self._cond:
+                    self._requeue(batch)
+                raise
+            with self._cond:
+                self._stats['sent'] += len(batch) - len(retry)
+                self._stats['batches'] += 1
+                self._requeue(retry)
+                if self._pending:
+                    self._write_spool(self._pending.values(), replace=True)
+                elif self._spool_path and os.path.exists(self._spool_path):
+                    os.remove(self._spool_path)
+            return not retry
+
+    def _requeue(self, entries: List[Tuple[dict, bool]]):
+        """Add back some updates to send them again after `retry_delay`"""
+        for node, noevent in entries:
+            # Newer updates queued in the meantime take precedence
+            queued = self._pending.get(node['id'])
+            if queued is not None:
+                node, noevent = queued[0], queued[1] and noevent
+            self._pending[node['id']] = (node, noevent)
+        if self._pending and self._first is None:
+            self._first = time.monotonic()
+        self._retry = time.monotonic() + self._retry_delay \
+            if entries else None
+
+    def _next_flush(self) -> Optional[float]:
+        """Get the time until the next flush, or None if nothing pending"""
+        if self._first is None:
+            return None
+        if len(self._pending) >= self._max_nodes and self._retry is None:
+            return 0
+        due = max(self._first + self._delay, self._retry or 0)
+        return max(0, due - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                timeout = self._next_flush()
+                while not self._stop and timeout != 0:
+                    self._cond.wait(timeout)
+                    timeout = self._next_flush()
+                if self._stop:
+                    return
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                # Keep the thread running, the updates are sent again later
+                traceback.print_exc()
+
+    def start(self):
+        """Start the background thread to flush the queue"""
+        with self._cond:
+            self._stop = False
+        self._thread = threading.Thread(
+            target=self._run, name='kci-write-behind', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, flush: bool = True) -> bool:
+        """Stop the background thread and flush the queue unless disabled
+
+        Return True if there are no pending updates left.
+        """
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.flush() if flush else not self._pending
@@ -99,20 +99,34 @@ def push(input_file, list_name, is_json, config, api, secrets):
 
 @kci_event.command(secrets=True)
 @click.argument('list_name')
+@click.option('--batch', type=int,
+              help="Pop up to this number of events in one request")
+@click.option('--timeout', type=float,
+              help="Time to wait for the first event in seconds, only "
+              "supported with batch_pop enabled in the API config")
 @Args.config
 @Args.api
 @Args.indent
 @catch_error
-def pop(list_name, config, api, indent, secrets):
+# pylint: disable=too-many-arguments
+def pop(list_name, batch, timeout, config, api, indent, secrets):
     """Wait and pop an event from a List when received print on stdout"""
     helper = get_api_helper(config, api, secrets)
-    event = helper.pop_event_data(list_name)
-    if isinstance(event, str):
-        click.echo(event.strip())
-    elif isinstance(event, dict):
-        echo_json(event, indent)
+    if timeout is not None and not helper.api.config.batch_pop:
+        raise click.UsageError(
+            "--timeout requires batch_pop to be enabled in the API config"
+        )
+    if batch or timeout is not None:
+        events = helper.pop_events_data(list_name, batch or 1, timeout)
     else:
-        click.echo(event)
+        events = [helper.pop_event_data(list_name)]
+    for event in events:
+        if isinstance(event, str):
+            click.echo(event.strip())
+        elif isinstance(event, dict):
+            echo_json(event, indent)
+        else:
+            click.echo(event)
 
 
 @kci_event.command(secrets=True)
@@ -48,14 +48,22 @@ def get(node_id, config, api, indent):
 @Args.indent
 @Args.page_length
 @Args.page_number
+@click.option(
+    '--workers', type=int,
+    help="Get all the nodes with up to this number of concurrent requests"
+)
 @catch_error
 # pylint: disable=too-many-arguments
-def find(attributes, config, api, indent, page_length, page_number):
+def find(attributes, config, api, indent, page_length, page_number,
+         workers):
     """Find nodes with arbitrary attributes"""
     api = get_api(config, api)
-    offset, limit = get_pagination(page_length, page_number)
     attributes = split_attributes(attributes)
-    nodes = api.node.find(attributes, offset, limit)
+    if workers:
+        nodes = api.node.find(attributes, workers=workers)
+    else:
+        offset, limit = get_pagination(page_length, page_number)
+        nodes = api.node.find(attributes, offset, limit)
     data = json.dumps(nodes, indent=indent or None)
     echo = click.echo_via_pager if len(nodes) > 1 else click.echo
     echo(data)
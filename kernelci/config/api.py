@@ -8,16 +8,29 @@
 from .base import YAMLConfigObject
 
 
-class API(YAMLConfigObject):
+class API(YAMLConfigObject):  # pylint: disable=too-many-instance-attributes
     """Base KernelCI API configuration object"""
 
     yaml_tag = '!API'
 
-    def __init__(self, name, url, version='latest', timeout=60):
+    # pylint: disable=too-many-arguments
+    def __init__(self, name, url, version='latest', timeout=60,
+                 pool_size=10, keep_alive=True, retries=5, backoff_factor=1,
+                 retry_status=None, rate_limit=0, max_concurrency=0,
+                 patch_updates=False, batch_pop=False):
         self._name = name
         self._url = url
         self._version = version
         self._timeout = timeout
+        self._pool_size = pool_size
+        self._keep_alive = keep_alive
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._retry_status = retry_status or [500, 502, 503, 504, 521]
+        self._rate_limit = rate_limit
+        self._max_concurrency = max_concurrency
+        self._patch_updates = patch_updates
+        self._batch_pop = batch_pop
 
     @property
     def name(self):
@@ -39,10 +52,72 @@ class API(YAMLConfigObject):
         """HTTP request timeout in seconds"""
         return self._timeout
 
+    @property
+    def pool_size(self):
+        """Maximum number of HTTP connections kept in the pool"""
+        return self._pool_size
+
+    @property
+    def keep_alive(self):
+        """Whether to keep HTTP connections open between requests"""
+        return self._keep_alive
+
+    @property
+    def retries(self):
+        """Maximum number of retries for a failed HTTP request"""
+        return self._retries
+
+    @property
+    def backoff_factor(self):
+        """Backoff factor applied between retries, in seconds"""
+        return self._backoff_factor
+
+    @property
+    def retry_status(self):
+        """List of HTTP status codes that cause a request to be retried"""
+        return list(self._retry_status)
+
+    @property
+    def rate_limit(self):
+        """Maximum average number of HTTP requests per second, 0 if unlimited"""
+        return self._rate_limit
+
+    @property
+    def max_concurrency(self):
+        """Maximum number of HTTP requests in flight, 0 if unlimited
+
+        When set, the actual limit is adjusted between 1 and this value
+        depending on the server responses.  Long-polling requests to receive
+        events don't count towards it.
+        """
+        return self._max_concurrency
+
+    @property
+    def patch_updates(self):
+        """Whether to send node updates as JSON Patch with the changes only
+
+        This requires the API to support PATCH requests on nodes.
+        """
+        return self._patch_updates
+
+    @property
+    def batch_pop(self):
+        """Whether the API can pop several events from a list at once
+
+        This requires the API to support the max_items and timeout parameters
+        when popping events, otherwise only one event is returned by each
+        request and it may wait indefinitely until one is available.
+        """
+        return self._batch_pop
+
     @classmethod
     def _get_yaml_attributes(cls):
         attrs = super()._get_yaml_attributes()
-        attrs.update({'url', 'version', 'timeout'})
+        attrs.update({
+            'url', 'version', 'timeout', 'pool_size', 'keep_alive',
+            'retries', 'backoff_factor', 'retry_status', 'rate_limit',
+            'max_concurrency', 'patch_updates', 'batch_pop',
+        })
         return attrs
 
 
@@ -6,6 +6,7 @@
 """KernelCI pipeline job configuration"""
 
 from .base import YAMLConfigObject
+from .rules import RuleSet
 
 
 class Job(YAMLConfigObject):  # pylint: disable=too-many-instance-attributes
@@ -24,6 +25,7 @@ class Job(YAMLConfigObject):  # pylint: disable=too-many-instance-attributes
         self._priority = priority
         self._params = self.format_params(params.copy(), params) if params else {}
         self._rules = rules
+        self._ruleset = RuleSet.compile(rules)
 
     @property
     def name(self):
@@ -65,6 +67,11 @@ class Job(YAMLConfigObject):  # pylint: disable=too-many-instance-attributes
         """Kernel requirements (tree, branch, version...)"""
         return self._rules
 
+    @property
+    def ruleset(self):
+        """Rules compiled as a RuleSet object, or None if there are none"""
+        return self._ruleset
+
     @property
     def kcidb_test_suite(self):
         """Mapping of KernelCI test to KCIDB test suite"""
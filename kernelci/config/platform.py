@@ -6,6 +6,7 @@
 """KernelCI platform configuration"""
 
 from .base import YAMLConfigObject
+from .rules import RuleSet
 
 
 # pylint: disable=too-many-instance-attributes
@@ -33,6 +34,7 @@ class Platform(YAMLConfigObject):
         self._mach = mach
         self._params = self.format_params(params.copy(), params) if params else None
         self._rules = rules
+        self._ruleset = RuleSet.compile(rules)
 
     @property
     def name(self):
@@ -84,6 +86,11 @@ class Platform(YAMLConfigObject):
         """Kernel requirements (tree, branch, version...)"""
         return self._rules
 
+    @property
+    def ruleset(self):
+        """Rules compiled as a RuleSet object, or None if there are none"""
+        return self._ruleset
+
     @classmethod
     def _get_yaml_attributes(cls):
         attrs = super()._get_yaml_attributes()
@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""KernelCI compiled node creation rules
+
+Rules are defined in the YAML configuration of jobs, platforms, runtimes and
+scheduler entries as plain dictionaries.  See
+`kernelci.api.helper.APIHelper.should_create_node()` for the format.  The
+RuleSet class provides an immutable version of them parsed only once, with
+allow-lists and deny-lists stored as sets.
+"""
+
+from collections.abc import Mapping
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+
+class FieldRule(NamedTuple):
+    """Allow-list and deny-list for a node field"""
+    allow: frozenset
+    deny: frozenset
+    allow_list: Tuple[str, ...]
+    deny_list: Tuple[str, ...]
+
+
+class TreeBranchRule(NamedTuple):
+    """Tree or branch rule with tree:branch combinations"""
+    allow: frozenset
+    allow_combos: frozenset
+    deny: frozenset
+    deny_combos: frozenset
+    allow_list: Tuple[str, ...]
+    deny_list: Tuple[str, ...]
+
+
+class VersionRule(NamedTuple):
+    """Minimum or maximum kernel version as (version, patchlevel)"""
+    bound: Tuple[int, int]
+
+
+class RuleSet(Mapping):
+    """Immutable set of rules compiled from a configuration dictionary
+
+    This is also a read-only mapping over the original rules dictionary, so
+    it can be used in place of it.
+    """
+
+    __slots__ = ('_rules', '_tree_branch', '_checks')
+
+    def __init__(self, rules: dict):
+        self._rules = rules
+        self._tree_branch = tuple(
+            (key, self._compile_tree_branch(rules[key] or ()))
+            for key in ('tree', 'branch') if key in rules
+        )
+        checks: List[Tuple[str, Union[FieldRule, VersionRule]]] = []
+        for key, values in rules.items():
+            values = values or ()
+            if key in ('tree', 'branch'):
+                continue
+            if key.endswith('_version'):
+                if not values:  # no version bound
+                    continue
+                checks.append((key, VersionRule(
+                    (values['version'], values['patchlevel'])
+                )))
+            else:
+                checks.append((key, self._compile_field(values)))
+        self._checks = tuple(checks)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, '_checks'):
+            raise AttributeError("RuleSet objects are immutable")
+        super().__setattr__(name, value)
+
+    def __getitem__(self, key):
+        return self._rules[key]
+
+    def __iter__(self):
+        return iter(self._rules)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __contains__(self, key):
+        return key in self._rules
+
+    def __repr__(self):
+        return f"RuleSet({self._rules!r})"
+
+    @classmethod
+    def compile(cls, rules: Optional[dict]) -> Optional['RuleSet']:
+        """Compile a rules dictionary, or return None if there are no rules
+
+        If `rules` is already a RuleSet object, it's returned as-is.
+        """
+        if rules is None or isinstance(rules, RuleSet):
+            return rules
+        return cls(rules)
+
+    @classmethod
+    def _compile_field(cls, values) -> FieldRule:
+        deny = tuple(val.lstrip('!') for val in values if val.startswith('!'))
+        allow = tuple(val for val in values if not val.startswith('!'))
+        return FieldRule(frozenset(allow), frozenset(deny), allow, deny)
+
+    @classmethod
+    def _compile_tree_branch(cls, values) -> TreeBranchRule:
+        allow, allow_combos, deny, deny_combos = [], set(), [], set()
+        for rule in values:
+            if ':' in rule:
+                # we use ':' as a tree/branch separator as this character is
+                # forbidden in git branch names, so if found it should be
+                # present only once.
+                tree, branch = rule.split(':', 1)
+                if tree.startswith('!'):
+                    deny_combos.add((tree.lstrip('!'), branch))
+                else:
+                    allow_combos.add((tree, branch))
+            elif rule.startswith('!'):
+                deny.append(rule.lstrip('!'))
+            else:
+                allow.append(rule)
+        return TreeBranchRule(
+            frozenset(allow), frozenset(allow_combos),
+            frozenset(deny), frozenset(deny_combos),
+            tuple(allow), tuple(deny),
+        )
+
+    @property
+    def rules(self) -> dict:
+        """Original rules dictionary"""
+        return self._rules
+
+    @property
+    def tree_branch(self) -> tuple:
+        """Compiled tree and branch rules as (key, TreeBranchRule) tuples"""
+        return self._tree_branch
+
+    @property
+    def checks(self) -> tuple:
+        """All the other compiled rules as (key, FieldRule or VersionRule)"""
+        return self._checks
@@ -6,6 +6,7 @@
 """KernelCI Runtime environment configuration"""
 
 from .base import FilterFactory, YAMLConfigObject
+from .rules import RuleSet
 
 
 class Runtime(YAMLConfigObject):
@@ -25,6 +26,7 @@ class Runtime(YAMLConfigObject):
         self._lab_type = lab_type
         self._filters = filters or []
         self._rules = rules
+        self._ruleset = RuleSet.compile(rules)
 
     @property
     def name(self):
@@ -41,6 +43,11 @@ class Runtime(YAMLConfigObject):
         """Kernel requirements (tree, branch, version...)"""
         return self._rules
 
+    @property
+    def ruleset(self):
+        """Rules compiled as a RuleSet object, or None if there are none"""
+        return self._ruleset
+
     @classmethod
     def _get_yaml_attributes(cls):
         attrs = super()._get_yaml_attributes()
@@ -6,6 +6,7 @@
 """KernelCI scheduler configuration"""
 
 from .base import YAMLConfigObject
+from .rules import RuleSet
 
 
 class SchedulerEntry(YAMLConfigObject):
@@ -20,6 +21,7 @@ class SchedulerEntry(YAMLConfigObject):
         self._event = event
         self._platforms = platforms or []
         self._rules = rules
+        self._ruleset = RuleSet.compile(rules)
 
     @property
     def job(self):
@@ -46,6 +48,11 @@ class SchedulerEntry(YAMLConfigObject):
         """Kernel requirements (tree, branch, version...)"""
         return self._rules
 
+    @property
+    def ruleset(self):
+        """Rules compiled as a RuleSet object, or None if there are none"""
+        return self._ruleset
+
     @classmethod
     def _get_yaml_attributes(cls):
         attrs = super()._get_yaml_attributes()
@@ -203,6 +203,18 @@ class Runtime(abc.ABC):
             output.write(job)
         return output_file
 
+    def get_load(self):
+        """Get the current load of the runtime environment
+
+        Return a dictionary with any of the following counters, or None if
+        the runtime doesn't report its load:
+
+        *queued* is the number of jobs waiting to be run
+        *latency* is the recent average time jobs have spent in the queue,
+                  in seconds
+        """
+        return None
+
     @abc.abstractmethod
     def generate(self, job, params):
         """Generate a test job definition.
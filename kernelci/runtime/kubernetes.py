@@ -26,6 +26,7 @@ class Kubernetes(Runtime):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.kcontext = None
+        self._clients = {}
 
     @classmethod
     def _get_job_file_name(cls, params):
@@ -47,12 +48,23 @@ class Kubernetes(Runtime):
         params['k8s_job_name'] = k8s_job_name
         return template.render(params)
 
-    def _fetch_load(self, ctxname):
-        """
-        Fetch load with retry and workaround due repeating errors
+    def _get_core_v1(self, ctxname):
+        """Get a CoreV1Api object for a context
+
+        Each context gets its own API client so the global default context
+        used by submit() and wait() is left unchanged.  Clients are kept
+        until a request is rejected with a 401 error, for example after the
+        credentials have been rotated.
         """
-        kubernetes.config.load_kube_config(context=ctxname)
-        core_v1 = kubernetes.client.CoreV1Api()
+        client = self._clients.get(ctxname)
+        if client is None:
+            client = kubernetes.config.new_client_from_config(context=ctxname)
+            self._clients[ctxname] = client
+        return kubernetes.client.CoreV1Api(client)
+
+    def _list_pods(self, ctxname):
+        """List the pods in a context with retries, or None if it failed"""
+        core_v1 = self._get_core_v1(ctxname)
         pods = None
         for _ in range(3):
             try:
@@ -60,14 +72,28 @@ class Kubernetes(Runtime):
                 break
             except kubernetes.client.rest.ApiException as error:
                 print(f'Error listing pods in {ctxname}: {error}')
+                if error.status == 401:
+                    # Reload the configuration to get new credentials
+                    self._clients.pop(ctxname, None)
+                    core_v1 = self._get_core_v1(ctxname)
                 continue
+        return pods
+
+    @classmethod
+    def _count_pending(cls, pods):
+        return len([pod for pod in pods.items if pod.status.phase == 'Pending'])
+
+    def _fetch_load(self, ctxname):
+        """
+        Fetch load with retry and workaround due repeating errors
+        """
+        pods = self._list_pods(ctxname)
 
         if not pods:
             print(f'No pods found in {ctxname}, returning 1000')
             return 1000
 
-        load = len([pod for pod in pods.items if pod.status.phase == 'Pending'])
-        return load
+        return self._count_pending(pods)
 
     def _get_clusters_load(self):
         """Get the load of all clusters (number of pods in Pending state)"""
@@ -79,6 +105,24 @@ class Kubernetes(Runtime):
                 break
         return load
 
+    def get_load(self):
+        """Get the number of pending pods in all the contexts
+
+        Contexts where the pods can't be listed are skipped, and None is
+        returned if this failed in all of them.
+        """
+        contexts = self.config.context
+        if not isinstance(contexts, list):
+            contexts = [contexts]
+        queued = None
+        for ctxname in contexts:
+            pods = self._list_pods(ctxname)
+            if not pods:
+                print(f'No pods found in {ctxname}, skipping it')
+                continue
+            queued = (queued or 0) + self._count_pending(pods)
+        return None if queued is None else {'queued': queued}
+
     def submit(self, job_path):
         # if context is array, we have multiple k8s build clusters
         # TBD: Implement caching to not check load for each job?
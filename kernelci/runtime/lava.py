@@ -10,6 +10,7 @@
 """LAVA runtime implementation"""
 
 from collections import namedtuple
+from datetime import datetime
 import time
 from urllib.parse import urljoin
 
@@ -367,6 +368,31 @@ class LAVA(Runtime):
                 return 0 if health == 'Complete' else 1
             time.sleep(3)
 
+    @classmethod
+    def _parse_time(cls, timestamp):
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+    def get_load(self):
+        jobs_url = urljoin(self._server.url, 'jobs/')
+        resp = self._server.session.get(
+            jobs_url, params={'state': 'Submitted', 'limit': 1}, timeout=30
+        )
+        resp.raise_for_status()
+        load = {'queued': resp.json()['count']}
+        resp = self._server.session.get(jobs_url, params={
+            'state': 'Running', 'ordering': '-start_time', 'limit': 16,
+        }, timeout=30)
+        resp.raise_for_status()
+        waits = [
+            (self._parse_time(job['start_time']) -
+             self._parse_time(job['submit_time'])).total_seconds()
+            for job in resp.json()['results']
+            if job.get('start_time') and job.get('submit_time')
+        ]
+        if waits:
+            load['latency'] = sum(waits) / len(waits)
+        return load
+
     def _connect(self):
         rest_url = f'{self.config.url}/api/{self.API_VERSION}/'
         rest_api = self.RestAPIServer(rest_url, requests.Session())
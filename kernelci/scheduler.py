@@ -7,6 +7,370 @@
 
 import random
 
+from kernelci.config.rules import VersionRule
+
+
+def _find_field(field, node):
+    """Find the first dict containing a given non-dict field in a node"""
+    for key, value in node.items():
+        if isinstance(value, dict):
+            container = _find_field(field, value)
+            if container:
+                return container
+        elif key == field:
+            return node
+    return None
+
+
+class SchedulerIndex:
+    """Inverted index of node creation rules
+
+    The index is built from a list of (key, rulesets) 2-tuples where each key
+    identifies a candidate such as a (job, platform) pair and the rulesets
+    are all the RuleSet objects (or None) that apply to it.  For a given
+    node, candidates() returns the keys of the candidates whose rules don't
+    reject it.
+
+    This is a conservative pre-filter: values not found in the node data
+    but which could be in one of its ancestors, tree/branch combinations and
+    fields which are set differently in the job nodes are not indexed and
+    never cause a candidate to be excluded.  As such,
+    APIHelper.should_create_node() still needs to be called for the
+    remaining candidates.
+    """
+
+    # Fields set in job nodes by APIHelper.create_job_node() rather than
+    # inherited from the input node
+    JOB_NODE_FIELDS = frozenset([
+        'kind', 'parent', 'name', 'path', 'group', 'artifacts', 'treeid',
+        'submitter', 'retry_counter', 'jobfilter', 'platform_filter',
+        'runtime', 'platform',
+    ])
+
+    def __init__(self, candidates):
+        self._keys = set()
+        self._anyval = {}
+        self._allow = {}
+        self._deny = {}
+        self._versions = {}
+        self._version_cache = {}
+        for key, rulesets in candidates:
+            self._add(key, [ruleset for ruleset in rulesets if ruleset])
+        self._constrained = {
+            field: keys.union(
+                *self._allow.get(field, {}).values(),
+                *self._deny.get(field, {}).values()
+            )
+            for field, keys in self._anyval.items()
+        }
+
+    def _add(self, key, rulesets):
+        self._keys.add(key)
+        allow, deny, bounds = self._combine(rulesets)
+        for field in set(allow) | set(deny):
+            values = allow.get(field)
+            if values is None:
+                self._anyval.setdefault(field, set()).add(key)
+            else:
+                for value in values:
+                    self._allow.setdefault(field, {}).setdefault(
+                        value, set()).add(key)
+            for value in deny.get(field, ()):
+                self._deny.setdefault(field, {}).setdefault(
+                    value, set()).add(key)
+            self._anyval.setdefault(field, set())
+        if bounds != (0, 0, float('inf'), 0):
+            self._versions[key] = (bounds[:2], bounds[2:])
+
+    @classmethod
+    def _combine(cls, rulesets):
+        """Combine the indexable rules for a candidate
+
+        Return the allowed and denied values for each field with None when
+        any value is allowed, and the (min, max) version bounds flattened
+        as a 4-tuple.
+        """
+        allow, deny = {}, {}
+        vmin, vmax = (0, 0), (float('inf'), 0)
+        for ruleset in rulesets:
+            # A matching tree:branch combination skips the remaining tree and
+            # branch rules so they can't be indexed
+            if not any(rule.allow_combos or rule.deny_combos
+                       for _, rule in ruleset.tree_branch):
+                for field, rule in ruleset.tree_branch:
+                    cls._merge(field, rule, allow, deny)
+            for field, rule in ruleset.checks:
+                if isinstance(rule, VersionRule):
+                    if field.startswith('min'):
+                        vmin = max(vmin, rule.bound)
+                    elif field.startswith('max'):
+                        vmax = min(vmax, rule.bound)
+                elif field not in cls.JOB_NODE_FIELDS:
+                    cls._merge(field, rule, allow, deny)
+        return allow, deny, vmin + vmax
+
+    @classmethod
+    def _merge(cls, field, rule, allow, deny):
+        if rule.allow:
+            # Values need to be allowed by every rule, but list fields such
+            # as fragments only need one of their items to be allowed by each
+            # rule.  The union keeps the index conservative in both cases.
+            allow[field] = (allow.get(field) or frozenset()) | rule.allow
+        elif field not in allow:
+            allow[field] = None
+        if rule.deny:
+            deny[field] = deny.get(field, frozenset()) | rule.deny
+
+    @classmethod
+    def from_configs(cls, configs):
+        """Create an index keyed by (job name, platform name) 2-tuples
+
+        The job and platform rules are indexed for all the combinations of
+        the jobs and platforms found in `configs`.
+        """
+        return cls(
+            ((job.name, platform.name), (job.ruleset, platform.ruleset))
+            for job in configs.get('jobs', {}).values()
+            for platform in configs.get('platforms', {}).values()
+        )
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def _field_candidates(self, field, value):
+        values = value if isinstance(value, list) else [value]
+        try:
+            allowed = set(self._anyval[field])
+            for item in values:
+                allowed.update(self._allow.get(field, {}).get(item, ()))
+            for item in values:
+                allowed.difference_update(
+                    self._deny.get(field, {}).get(item, ())
+                )
+        except TypeError:  # unhashable values aren't indexed
+            return None
+        return allowed | (self._keys - self._constrained[field])
+
+    def _version_excluded(self, version):
+        excluded = self._version_cache.get(version)
+        if excluded is None:
+            excluded = frozenset(
+                key for key, (vmin, vmax) in self._versions.items()
+                if not vmin <= version <= vmax
+            )
+            self._version_cache[version] = excluded
+        return excluded
+
+    def candidates(self, node):
+        """Get the set of candidate keys whose rules may accept a node"""
+        result = set(self._keys)
+        data = node.get('data') or {}
+        for field in self._anyval:
+            container = _find_field(field, data)
+            if container is None:
+                continue
+            allowed = self._field_candidates(field, container[field])
+            if allowed is not None:
+                result &= allowed
+        if self._versions:
+            try:
+                kver = data['kernel_revision']['version']
+                version = (kver['version'], kver['patchlevel'])
+            except (KeyError, TypeError):
+                version = None
+            if version:
+                result -= self._version_excluded(version)
+        return result
+
+    def excluded(self, node):
+        """Get the set of candidate keys whose rules reject a node"""
+        return self._keys - self.candidates(node)
+
+
+class EventIndex:  # pylint: disable=too-few-public-methods
+    """Index of scheduler entries by event channel and criteria
+
+    Entries are grouped by channel and by the values of the discriminating
+    event fields (see FIELDS) found in their criteria, so only the entries
+    with matching values need to be checked for each event.  The remaining
+    criteria are stored as tuples of items to check them without copying
+    the entry event dictionaries.
+    """
+
+    FIELDS = ('kind', 'name', 'state', 'result')
+
+    def __init__(self, entries):
+        self._channels = {}
+        for idx, entry in enumerate(entries):
+            criteria = entry.event
+            fields = tuple(
+                field for field in self.FIELDS
+                if field in criteria and self._is_hashable(criteria[field])
+            )
+            values = tuple(criteria[field] for field in fields)
+            others = tuple(
+                (key, value) for key, value in criteria.items()
+                if key != 'channel' and key not in fields
+            )
+            groups = self._channels.setdefault(criteria.get('channel'), {})
+            groups.setdefault(fields, {}).setdefault(values, []).append(
+                (idx, entry, others)
+            )
+
+    @classmethod
+    def _is_hashable(cls, value):
+        try:
+            hash(value)
+        except TypeError:
+            return False
+        return True
+
+    def get_entries(self, event, channel):
+        """Get the (position, entry) 2-tuples of entries matching an event"""
+        matches = []
+        for fields, entries in self._channels.get(channel, {}).items():
+            try:
+                values = tuple(event[field] for field in fields)
+                candidates = entries.get(values, ())
+            except (KeyError, TypeError):
+                continue
+            matches.extend(
+                (idx, entry) for idx, entry, others in candidates
+                if all(key in event and event[key] == value
+                       for key, value in others)
+            )
+        if len(matches) > 1:
+            matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class RuntimeLoad:
+    """Live load counters for each runtime
+
+    Runtimes report how many jobs are waiting in their queue and how long
+    they have been waiting for, for example with Runtime.get_load().  Jobs
+    scheduled since the last report are counted as outstanding so they're
+    taken into account until the runtime reports them as queued.
+    """
+
+    def __init__(self):
+        self._queued = {}
+        self._latency = {}
+        self._outstanding = {}
+
+    def report(self, name, queued=None, latency=None):
+        """Report the load of a runtime"""
+        if queued is not None:
+            self._queued[name] = queued
+            self._outstanding[name] = 0
+        if latency is not None:
+            self._latency[name] = latency
+
+    def scheduled(self, name, count=1):
+        """Count some jobs scheduled to run in a runtime"""
+        self._outstanding[name] = self._outstanding.get(name, 0) + count
+
+    def jobs(self, name):
+        """Get the number of queued and outstanding jobs in a runtime"""
+        return self._queued.get(name, 0) + self._outstanding.get(name, 0)
+
+    def latency(self, name):
+        """Get the queue latency of a runtime or None if unknown"""
+        return self._latency.get(name)
+
+
+class RuntimeSelector:
+    """Strategy to select one of several runtimes of the same type
+
+    *runtimes* is a list of Runtime objects to choose from
+    *load* is a RuntimeLoad object with the runtime counters
+    *weights* is an optional dictionary with runtime names as keys and
+              relative weights as values, 1 by default and 0 to never
+              select a runtime
+    """
+
+    def __init__(self, runtimes, load, weights=None):
+        weights = weights or {}
+        weighted = [
+            (runtime, weights.get(runtime.config.name, 1))
+            for runtime in runtimes
+        ]
+        self._runtimes = [runtime for runtime, weight in weighted if weight]
+        self._weights = [weight for _, weight in weighted if weight]
+        self._load = load
+
+    @property
+    def runtimes(self):
+        """List of the runtimes which can be selected"""
+        return list(self._runtimes)
+
+    def select(self):
+        """Select a runtime, picking one at random by default"""
+        if not self._runtimes:
+            return None
+        return random.choices(self._runtimes, self._weights)[0]
+
+
+class RoundRobinSelector(RuntimeSelector):
+    """Smooth weighted round-robin runtime selection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._current = [0] * len(self._runtimes)
+
+    def select(self):
+        if not self._runtimes:
+            return None
+        total = 0
+        for idx, weight in enumerate(self._weights):
+            self._current[idx] += weight
+            total += weight
+        best = max(range(len(self._runtimes)), key=self._current.__getitem__)
+        self._current[best] -= total
+        return self._runtimes[best]
+
+
+class LeastJobsSelector(RuntimeSelector):
+    """Select the runtime with the fewest outstanding jobs per weight unit"""
+
+    def select(self):
+        if not self._runtimes:
+            return None
+        jobs = [
+            self._load.jobs(runtime.config.name) / weight
+            for runtime, weight in zip(self._runtimes, self._weights)
+        ]
+        least = min(jobs)
+        return random.choice([
+            runtime for runtime, count in zip(self._runtimes, jobs)
+            if count == least
+        ])
+
+
+class LatencySelector(RuntimeSelector):
+    """Select the runtime with the lowest queue latency
+
+    Runtimes with no known latency are selected first and ties are broken
+    using the number of outstanding jobs per weight unit.
+    """
+
+    def _get_key(self, item):
+        name = item[0].config.name
+        return (self._load.latency(name) or 0, self._load.jobs(name) / item[1])
+
+    def select(self):
+        if not self._runtimes:
+            return None
+        return min(zip(self._runtimes, self._weights), key=self._get_key)[0]
+
+
+SELECTORS = {
+    'random': RuntimeSelector,
+    'round-robin': RoundRobinSelector,
+    'least-jobs': LeastJobsSelector,
+    'latency': LatencySelector,
+}
+
 
 class Scheduler:
     """Core logic for implementing a pipeline scheduler
@@ -15,51 +379,144 @@ class Scheduler:
     down the scope, this class can be used to determine which jobs to run in
     which runtimes and on which platforms based on an event received from the
     API via the Pub/Sub interface.
+
+    When a scheduler entry has a runtime type rather than a name, one of the
+    runtimes of this type is selected using the strategy named in the entry
+    runtime parameters (see SELECTORS) with optional weights for each
+    runtime, for example:
+
+      runtime:
+        type: lava
+        strategy: least-jobs
+        weights:
+          lab-collabora: 2
+
+    The default strategy is to pick a runtime at random.
     """
 
     def __init__(self, configs, runtimes):
-        self._scheduler = configs['scheduler']
+        entries = configs['scheduler']
         self._jobs = configs['jobs']
         self._runtimes = runtimes
-        self._runtimes_by_type = {}
+        self._platforms = configs['platforms']
+        self._load = RuntimeLoad()
+        self._events = EventIndex(entries)
+        runtimes_by_type = {}
         for _, runtime in self._runtimes.items():
-            runtime_type = self._runtimes_by_type.setdefault(
+            runtime_type = runtimes_by_type.setdefault(
                 runtime.config.lab_type, []
             )
             runtime_type.append(runtime)
-        self._platforms = configs['platforms']
+        self._targets = [
+            (entry.runtime.get('name'),
+             self._get_selector(entry.runtime, runtimes_by_type),
+             entry.platforms)
+            for entry in entries
+        ]
+        self._index = SchedulerIndex(self._get_candidates(entries))
 
-    def get_configs(self, event, channel='node'):
-        """Get the scheduler configs matching a given event"""
+    def _get_selector(self, params, runtimes_by_type):
+        runtime_type = params.get('type')
+        if params.get('name') or not runtime_type:
+            return None
+        strategy = params.get('strategy', 'random')
+        selector = SELECTORS.get(strategy)
+        if selector is None:
+            raise ValueError(f"Invalid runtime selection strategy: {strategy}")
+        return selector(runtimes_by_type.get(runtime_type, []), self._load,
+                        params.get('weights'))
+
+    def _get_candidates(self, entries):
+        """Get all the (entry, platform) candidates with their rules"""
+        for idx, entry in enumerate(entries):
+            job = self._jobs.get(entry.job)
+            if job is None:
+                continue
+            runtime_name = entry.runtime.get('name')
+            runtime_type = entry.runtime.get('type')
+            runtime = self._runtimes.get(runtime_name)
+            if runtime:
+                runtime_types = [runtime.config.lab_type]
+            else:
+                runtime_types = [runtime_type] if runtime_type else []
+            platforms = entry.platforms or runtime_types
+            for platform_name in platforms:
+                platform = self._platforms.get(platform_name)
+                if platform:
+                    yield (idx, platform_name), (
+                        entry.ruleset, job.ruleset, platform.ruleset,
+                        runtime.config.ruleset if runtime else None,
+                    )
+
+    @property
+    def index(self):
+        """SchedulerIndex keyed by (entry position, platform name)"""
+        return self._index
+
+    @property
+    def load(self):
+        """RuntimeLoad object used to select runtimes"""
+        return self._load
+
+    def job_created(self, runtime, count=1):
+        """Count some job nodes created to run in a runtime
+
+        This should be called once the job nodes have actually been created
+        for the targets returned by get_schedule(), as the rules may still
+        reject them, so they're taken into account when selecting runtimes
+        until the runtime reports its load again.
+        """
+        self._load.scheduled(runtime.config.name, count)
+
+    def update_load(self):
+        """Update the load counters reported by all the runtimes"""
+        for name, runtime in self._runtimes.items():
+            try:
+                load = runtime.get_load()
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"Failed to get load for runtime {name}: {exc}")
+                continue
+            if load:
+                self._load.report(name, **load)
+
+    def _get_entries(self, event, channel):
         # scheduler expects a dict, but in some cases someone
         # might pass something else, this will prevent a crash
         if not isinstance(event, dict):
             print("Error: event type should be dict")
-            return
-        for entry in self._scheduler:
-            sched_event_channel = entry.event.get('channel')
-            if sched_event_channel == channel:
-                sched_event = entry.event.copy()
-                sched_event.pop('channel')
-                if sched_event.items() <= event.items():
-                    yield entry
-
-    def get_schedule(self, event, channel='node'):
-        """Get the (job, runtime, platform) configs for each job to run"""
-        for config in self.get_configs(event, channel):
-            runtime_name = config.runtime.get('name')
-            runtime_type = config.runtime.get('type')
+            return []
+        return self._events.get_entries(event, channel)
+
+    def get_configs(self, event, channel='node'):
+        """Get the scheduler configs matching a given event"""
+        for _, entry in self._get_entries(event, channel):
+            yield entry
+
+    def get_schedule(self, event, channel='node', node=None):
+        """Get the (job, runtime, platform) configs for each job to run
+
+        The scheduler entry rules are provided as a 4th item.  They're
+        compiled as a RuleSet object, which is a read-only mapping of the
+        rules dictionary and can be passed to APIHelper.should_create_node()
+        without parsing the rules again.
+
+        If the `node` which caused the event is provided, the candidates
+        which would be rejected by the rules are skipped using the scheduler
+        index.
+        """
+        excluded = self._index.excluded(node) if node else set()
+        for idx, config in self._get_entries(event, channel):
+            runtime_name, selector, platforms = self._targets[idx]
             if runtime_name:
                 runtime = self._runtimes.get(runtime_name)
-            elif runtime_type:
-                # Pick one at random until there's more criteria
-                runtimes = self._runtimes_by_type.get(runtime_type)
-                runtime = random.sample(runtimes, 1)[0] if runtimes else None
+            else:
+                runtime = selector.select() if selector else None
             job = self._jobs.get(config.job)
             if not all((job, runtime)):
                 continue
-            platforms = config.platforms or [runtime.config.lab_type]
-            for platform_name in platforms:
+            for platform_name in platforms or [runtime.config.lab_type]:
+                if (idx, platform_name) in excluded:
+                    continue
                 platform = self._platforms.get(platform_name)
                 if platform:
-                    yield job, runtime, platform, config.rules
+                    yield job, runtime, platform, config.ruleset
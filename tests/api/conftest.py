@@ -7,6 +7,11 @@
 """pytest fixtures for APIHelper unit tests"""
 
 import json
+import queue
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
 from cloudevents.http import CloudEvent
 from cloudevents.conversion import to_json
@@ -220,7 +225,7 @@ def mock_api_unsubscribe(mocker):
 @pytest.fixture
 def mock_api_get_node_from_id(mocker):
     """Mocks call to LatestAPI class method used to get node from node ID"""
-    mocker.patch(
+    return mocker.patch(
         'kernelci.api.latest.LatestAPI.Node.get',
         return_value=APIHelperTestData().checkout_node,
     )
@@ -254,7 +259,7 @@ def mock_api_put_nodes(mocker):
     ]
     resp._content = json.dumps(  # pylint: disable=protected-access
         resp_data).encode('utf-8')
-    mocker.patch(
+    return mocker.patch(
         'kernelci.api.API._put',
         return_value=resp,
     )
@@ -273,3 +278,169 @@ def mock_receive_event(mocker):
         'kernelci.api.latest.LatestAPI.receive_event',
         return_value=event,
     )
+
+
+@pytest.fixture
+def mock_api_get_paginated(mocker):
+    """
+    Mocks call to LatestAPI class method used to get paginated items, with
+    250 nodes available in total
+    """
+    nodes = [{'id': f'{idx:024x}', 'name': 'kunit'} for idx in range(250)]
+
+    def get_page(_path, params=None):
+        offset, limit = params['offset'], params['limit']
+        resp = Response()
+        resp.status_code = 200
+        resp._content = json.dumps({  # pylint: disable=protected-access
+            'items': nodes[offset:offset + limit],
+        }).encode('utf-8')
+        return resp
+
+    return mocker.patch('kernelci.api.Base._get', side_effect=get_page)
+
+
+def _make_event(data):
+    return CloudEvent(attributes={'type': 'test', 'source': 'test'}, data=data)
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    """Request handler for the Pub/Sub stand-in server"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def _reply(self, status, data=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handle subscribe and unsubscribe requests"""
+        _, _, action, arg = self.path.split('?')[0].split('/')
+        if action == 'subscribe':
+            self._reply(200, {'id': self.server.subscribe(arg)})
+        elif action == 'unsubscribe':
+            self.server.subs.pop(int(arg), None)
+            self._reply(200)
+        else:
+            self._reply(404)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle listen, stream and pop requests"""
+        url = urllib.parse.urlparse(self.path)
+        _, _, action, arg = url.path.split('/')
+        self.server.requests.append(action)
+        if action == 'pop':
+            self._pop(arg, urllib.parse.parse_qs(url.query))
+            return
+        sub = self.server.subs.get(int(arg))
+        if sub is None or (action == 'stream' and not self.server.streaming):
+            self._reply(404)
+        elif action == 'stream' and self.server.stream_errors:
+            self.server.stream_errors -= 1
+            self._reply(503)
+        elif action == 'listen':
+            try:
+                data = sub.get(timeout=0.1)
+            except queue.Empty:
+                data = 'BEEP'
+            self._reply(200, {'data': to_json(_make_event(data)).decode()})
+        else:
+            self._stream(int(arg), sub)
+
+    def _pop(self, list_name, params):
+        items = self.server.lists.setdefault(list_name, queue.Queue())
+        if not self.server.batch_pop:
+            self._reply(200, json.loads(to_json(_make_event(items.get()))))
+            return
+        timeout = float(params.get('timeout', ['1'])[0])
+        max_items = int(params.get('max_items', ['1'])[0])
+        events = []
+        try:
+            events.append(items.get(timeout=timeout))
+            while len(events) < max_items:
+                events.append(items.get_nowait())
+        except queue.Empty:
+            pass
+        self._reply(200, [
+            json.loads(to_json(_make_event(data))) for data in events
+        ])
+
+    def _stream(self, sub_id, sub):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        count = 0
+        while (count != self.server.drop_after and
+               self.server.subs.get(sub_id) is sub):
+            try:
+                data = sub.get(timeout=0.05)
+            except queue.Empty:
+                self._send_chunk(b': keep-alive\n\n')
+                continue
+            event = to_json(_make_event(data))
+            self._send_chunk(b'data: ' + event + b'\n\n')
+            count += 1
+        self._send_chunk(b'')
+        self.close_connection = True  # pylint: disable=attribute-defined-outside-init
+
+    def _send_chunk(self, chunk):
+        self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+        self.wfile.flush()
+
+
+class StreamServer(ThreadingHTTPServer):  # pylint: disable=R0902
+    """Pub/Sub stand-in server with listen, stream and pop endpoints
+
+    Stream connections are dropped after sending `drop_after` events or when
+    their subscription is removed, and the next `stream_errors` stream
+    requests get a 503 error.  Lists only return one event per pop
+    request unless `batch_pop` is True.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StreamHandler)
+        self.subs = {}
+        self.requests = []
+        self.streaming = True
+        self.drop_after = None
+        self.stream_errors = 0
+        self.lists = {}
+        self.batch_pop = True
+        self._last_id = 0
+
+    @property
+    def url(self):
+        """Base URL of the server"""
+        return f'http://127.0.0.1:{self.server_address[1]}/'
+
+    def subscribe(self, _channel):
+        """Add a subscription to any channel and get its id"""
+        self._last_id += 1
+        self.subs[self._last_id] = queue.Queue()
+        return self._last_id
+
+    def publish(self, data):
+        """Send an event to all the subscriptions"""
+        for sub in list(self.subs.values()):
+            sub.put(data)
+
+
+@pytest.fixture
+def stream_server():
+    """Fixture to run a Pub/Sub and Redis lists stand-in server"""
+    server = StreamServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
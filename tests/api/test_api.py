@@ -9,9 +9,27 @@
 
 """Unit tests for KernelCI API bindings"""
 
+import asyncio
+import concurrent.futures
+import copy
+import json
+import os
+import queue
+import threading
+import time
+
+from cloudevents.http import CloudEvent
+import pytest
+import requests
+from requests import Response
+import urllib3
+
 import kernelci.api
+import kernelci.api.cache
 import kernelci.api.helper
+import kernelci.api.limiter
 import kernelci.config
+import kernelci.config.api
 
 from .conftest import APIHelperTestData
 
@@ -196,6 +214,126 @@ def test_submit_results(get_api_config, mock_api_put_nodes,
         }
 
 
+def test_submit_results_parent(get_api_config, mock_api_put_nodes,
+                               mock_api_get_node_from_id):
+    """Test that results are submitted without looking up the parent"""
+    api = kernelci.api.get_api(next(iter(get_api_config.values())))
+    helper = kernelci.api.helper.APIHelper(
+        api, node_cache=kernelci.api.cache.NodeCache()
+    )
+    results = {"node": APIHelperTestData().kunit_node, "child_nodes": []}
+    root = APIHelperTestData().kunit_node
+    helper.submit_results(results, root)
+    assert not mock_api_get_node_from_id.called
+    sent = mock_api_put_nodes.call_args.args[1]
+    assert sent['node']['path'] == root['path']
+    root = {
+        key: value for key, value in root.items() if key not in ('path',)
+    }
+    for _ in range(2):
+        helper.submit_results(results, root)
+    assert mock_api_get_node_from_id.call_count == 1
+    sent = mock_api_put_nodes.call_args.args[1]
+    assert sent['node']['path'] == (
+        APIHelperTestData().checkout_node['path'] + [root['name']]
+    )
+    helper.submit_results(results, root, parent={'path': ['a'], 'kind': 'b'})
+    assert mock_api_get_node_from_id.call_count == 1
+    sent = mock_api_put_nodes.call_args.args[1]
+    assert sent['node']['path'] == ['a', root['name']]
+
+
+def _make_results(suites, tests):
+    return {
+        "node": {"name": "kunit", "result": "pass", "artifacts": {}},
+        "child_nodes": [
+            {
+                "node": {"name": f"suite-{suite}", "result": "pass"},
+                "child_nodes": [
+                    {
+                        "node": {"name": f"test-{test}", "result": "pass"},
+                        "child_nodes": [],
+                    }
+                    for test in range(tests)
+                ],
+            }
+            for suite in range(suites)
+        ] + [{"node": {"name": "leaf", "result": "fail"}, "child_nodes": []}],
+    }
+
+
+def test_submit_results_chunked(get_api_config, mocker, tmp_path):
+    """Test submitting results in chunks and resuming after an error"""
+    created = {}
+    requests_sent = []
+
+    def _put(path, body):
+        data = json.loads(body)
+        requests_sent.append(data)
+        assert path == f"nodes/{data['node']['id']}"
+        nodes = [data['node']]
+        for child in data['child_nodes']:
+            node = dict(child['node'], id=f'{len(created):024x}',
+                        parent=data['node']['id'])
+            assert tuple(node['path']) not in created
+            created[tuple(node['path'])] = node
+            nodes.append(node)
+        if len(requests_sent) in (3, 4) and len(requests_sent) not in failed:
+            # Chunk either rejected or applied by the time the client fails
+            failed.add(len(requests_sent))
+            if len(requests_sent) == 3:
+                for node in nodes[1:]:
+                    del created[tuple(node['path'])]
+            raise requests.exceptions.HTTPError(
+                response=_response({'detail': 'timeout'}, 504)
+            )
+        return _response(nodes)
+
+    failed = set()
+    api = kernelci.api.get_api(next(iter(get_api_config.values())))
+    mocker.patch.object(api, '_put', side_effect=_put)
+    mocker.patch.object(api.node, 'find', side_effect=lambda attrs: [
+        node for node in created.values() if node['parent'] == attrs['parent']
+    ])
+    helper = kernelci.api.helper.APIHelper(api)
+    root = APIHelperTestData().kunit_node
+    state_path = str(tmp_path / 'state.json')
+    results = _make_results(3, 5)
+    for _ in range(2):
+        with pytest.raises(RuntimeError) as exc_info:
+            helper.submit_results_chunked(results, root, max_nodes=2,
+                                          state_path=state_path)
+        assert exc_info.value.args[0] == {'detail': 'timeout'}
+    assert os.path.exists(state_path)
+    with pytest.raises(ValueError, match='max_nodes'):
+        helper.submit_results_chunked(results, root, max_nodes=3,
+                                      state_path=state_path)
+    changed = copy.deepcopy(results)
+    changed['child_nodes'][0]['node']['result'] = 'fail'
+    with pytest.raises(ValueError, match='digest'):
+        helper.submit_results_chunked(changed, root, max_nodes=2,
+                                      state_path=state_path)
+    resp = helper.submit_results_chunked(results, root, max_nodes=2,
+                                         state_path=state_path)
+    assert not os.path.exists(state_path)
+    assert len(created) == 3 * 5 + 3 + 1
+    assert created[('checkout', 'kunit', 'suite-1', 'test-4')]['group'] == \
+        'kunit'
+    assert all(len(data['child_nodes']) <= 2 for data in requests_sent)
+    assert resp[0]['state'] == 'done' and resp[0]['result'] == 'pass'
+    assert requests_sent[-1]['child_nodes'] == []
+    assert all(data['node']['result'] is None for data in requests_sent[:2])
+    # 2 for the first level, 3 for each suite, 1 rejected and 1 for the root
+    assert len(requests_sent) == 2 + 3 * 3 + 1 + 1
+
+    changed = _make_results(2, 1)
+    changed['child_nodes'][1]['node']['name'] = 'suite-0'
+    requests_sent.clear()
+    with pytest.raises(ValueError, match='suite-0'):
+        helper.submit_results_chunked(changed, root)
+    assert not requests_sent
+
+
 def test_receive_event_node(get_api_config, mock_receive_event,
                             mock_api_get_node_from_id, mock_api_subscribe):
     """Test method to receive node from event"""
@@ -265,3 +403,533 @@ def test_prepare_results(get_api_config, mock_api_get_node_from_id):
             'result',
             'state',
         }
+
+
+def test_api_session_pool(get_api_config):
+    """Test that HTTP sessions share one connection pool across threads"""
+    for _, api_config in get_api_config.items():
+        api = kernelci.api.get_api(api_config)
+        session = api.node.session
+        assert session is api.user.session
+        assert session is api.session
+        sessions = []
+        thread = threading.Thread(
+            target=lambda res, node: res.append(node.session),
+            args=(sessions, api.node)
+        )
+        thread.start()
+        thread.join()
+        assert sessions[0] is not session
+        assert sessions[0].get_adapter(api_config.url) is \
+            session.get_adapter(api_config.url)
+        adapter = session.get_adapter(api_config.url)
+        assert adapter.max_retries.total == api_config.retries
+        assert adapter.max_retries.status_forcelist == api_config.retry_status
+        api.close()
+
+
+def test_async_api_node_get(get_api_config, mock_api_get_node_from_id):
+    """Test concurrent node lookups with the asyncio bindings"""
+    async def get_nodes(api, count):
+        async with api:
+            return await asyncio.gather(*(
+                api.node.get(APIHelperTestData().checkout_node['id'])
+                for _ in range(count)
+            ))
+
+    for _, api_config in get_api_config.items():
+        api = kernelci.api.get_async_api(api_config)
+        assert isinstance(api, kernelci.api.AsyncAPI)
+        assert isinstance(api.sync, kernelci.api.API)
+        # One worker thread per pooled connection
+        # pylint: disable=protected-access
+        assert api._executor._max_workers == api_config.pool_size
+        nodes = asyncio.run(get_nodes(api, 100))
+        assert len(nodes) == 100
+        assert all(node == APIHelperTestData().checkout_node
+                   for node in nodes)
+
+
+def test_async_api_listeners(get_api_config, mock_api_get_node_from_id,
+                             mocker):
+    """Test that long-polling requests don't hold up the other requests"""
+    release = threading.Event()
+
+    async def get_node(api):
+        async with api:
+            pending = [asyncio.ensure_future(api.pop_events('jobs'))
+                       for _ in range(2)]
+            node = await asyncio.wait_for(
+                api.node.get(APIHelperTestData().checkout_node['id']), 5
+            )
+            release.set()
+            await asyncio.gather(*pending)
+            return node
+
+    api = kernelci.api.get_async_api(
+        next(iter(get_api_config.values())), max_workers=1, max_listeners=2
+    )
+    mocker.patch.object(api.sync, 'pop_events',
+                        side_effect=lambda *args: release.wait(5) and [])
+    assert asyncio.run(get_node(api)) == APIHelperTestData().checkout_node
+
+
+def test_node_iter_find(get_api_config, mock_api_get_paginated):
+    """Test iterating over paginated nodes with prefetching"""
+    for _, api_config in get_api_config.items():
+        api = kernelci.api.get_api(api_config)
+        mock_api_get_paginated.reset_mock()
+        nodes = api.node.iter_find({'name': 'kunit'})
+        assert not isinstance(nodes, list)
+        ids = [node['id'] for node in nodes]
+        assert ids == [f'{idx:024x}' for idx in range(250)]
+        assert mock_api_get_paginated.call_count == 3
+        offsets = [call.kwargs['params']['offset']
+                   for call in mock_api_get_paginated.call_args_list]
+        assert offsets == [0, 100, 200]
+
+
+def test_node_find_parallel(get_api_config, mock_api_get_paginated, mocker):
+    """Test finding all the nodes with concurrent page requests"""
+    for _, api_config in get_api_config.items():
+        api = kernelci.api.get_api(api_config)
+        for count in (0, 100, 200, 250):
+            mocker.patch('kernelci.api.latest.LatestAPI.Node.count',
+                         return_value=count)
+            nodes = api.node.find({'name': 'kunit'}, workers=4)
+            assert [node['id'] for node in nodes] == [
+                f'{idx:024x}' for idx in range(250)
+            ]
+
+
+def test_receive_event_nodes(get_api_config, mocker, mock_api_subscribe):
+    """Test receiving a batch of nodes with the event filters applied first"""
+    attributes = {
+        "type": "api.kernelci.org",
+        "source": "https://api.kernelci.org/",
+    }
+    events = [
+        {"op": "created", "id": "n0", "kind": "kbuild", "state": "done"},
+        {"op": "updated", "id": "n1", "kind": "checkout"},
+        {"op": "updated", "id": "n2", "kind": "kbuild", "state": "running"},
+        {"op": "updated", "id": "n3", "kind": "kbuild", "state": "done"},
+        {"op": "updated", "id": "n4", "kind": "kbuild"},
+        None,
+    ]
+    nodes = {
+        "n0": {"id": "n0", "kind": "kbuild", "state": "done"},
+        "n3": {"id": "n3", "kind": "kbuild", "state": "done"},
+        "n4": {"id": "n4", "kind": "kbuild", "state": "available"},
+    }
+    for _, api_config in get_api_config.items():
+        mocker.patch(
+            'kernelci.api.latest.LatestAPI.receive_event',
+            side_effect=[
+                CloudEvent(attributes=attributes, data=data) if data else None
+                for data in events
+            ],
+        )
+        get = mocker.patch('kernelci.api.latest.LatestAPI.Node.get',
+                           side_effect=nodes.get)
+        api = kernelci.api.get_api(api_config)
+        helper = kernelci.api.helper.APIHelper(api)
+        sub_id = helper.subscribe_filters(
+            filters={"kind": "kbuild", "state": "done"},
+        )
+        received = helper.receive_event_nodes(sub_id)
+        assert [node["id"] for node, _ in received] == ["n0", "n3"]
+        assert sorted(call.args[0] for call in get.call_args_list) == [
+            "n0", "n3", "n4"
+        ]
+
+
+def _get_stream_api(server):
+    config = kernelci.config.api.API('stream', server.url, retries=0,
+                                     batch_pop=True)
+    return kernelci.api.get_api(config)
+
+
+def _response(data, status_code=200):
+    resp = Response()
+    resp.status_code = status_code
+    resp._content = json.dumps(  # pylint: disable=protected-access
+        data).encode('utf-8')
+    return resp
+
+
+def test_node_update_patch(get_api_config, mocker):
+    """Test that node updates only send the changed fields when possible"""
+    stored = {}
+
+    def _patch(path, ops):
+        if not patch_allowed:
+            raise requests.exceptions.HTTPError(response=_response({}, 405))
+        node = stored[path.split('/')[1].split('?')[0]]
+        for operation in ops:
+            *parents, key = operation['path'].split('/')[1:]
+            target = node
+            for parent in parents:
+                target = target[parent]
+            if operation['op'] == 'remove':
+                del target[key]
+            else:
+                target[key] = operation['value']
+        return _response(node)
+
+    def _put(path, node):
+        stored[node['id']] = copy.deepcopy(node)
+        return _response(node)
+
+    def _get_api(**kwargs):
+        config = next(iter(get_api_config.values()))
+        api = kernelci.api.get_api(
+            kernelci.config.api.API(config.name, config.url, **kwargs)
+        )
+        mocker.patch.object(api.node, '_get', side_effect=lambda path: (
+            _response(stored[path.split('/')[1]])
+        ))
+        return (
+            api,
+            mocker.patch.object(api.node, '_put', side_effect=_put),
+            mocker.patch.object(api.node, '_patch', side_effect=_patch),
+        )
+
+    checkout = APIHelperTestData().checkout_node
+    stored[checkout['id']] = checkout
+    patch_allowed = True
+
+    # Full nodes are sent by default
+    api, put, patch = _get_api()
+    node = api.node.get(checkout['id'])
+    node['state'] = 'closing'
+    api.node.update(node)
+    assert not patch.called
+    assert put.call_args.args[1] == node
+    stored[checkout['id']] = checkout
+
+    api, put, patch = _get_api(patch_updates=True)
+
+    node = api.node.get(checkout['id'])
+    node['state'] = 'closing'
+    node['data']['kernel_revision']['commit'] = 'abcd'
+    updated = api.node.update(node, noevent=True)
+    assert updated == node
+    assert not put.called
+    assert patch.call_args.args[0] == f"node/{checkout['id']}?noevent=true"
+    assert sorted(patch.call_args.args[1], key=lambda op: op['path']) == [
+        {'op': 'replace', 'path': '/data/kernel_revision/commit',
+         'value': 'abcd'},
+        {'op': 'replace', 'path': '/state', 'value': 'closing'},
+    ]
+
+    updated['result'] = 'fail'
+    other = dict(checkout, id='other', state='closing')
+    assert api.node.update_many([updated, other])[0]['result'] == 'fail'
+    assert patch.call_args.args[1] == [
+        {'op': 'replace', 'path': '/result', 'value': 'fail'},
+    ]
+    assert put.call_args.args[1] == other
+    assert stored['other'] == other
+
+    patch_allowed = False
+    node = api.node.get(checkout['id'])
+    node['state'] = 'available'
+    api.node.update(node)
+    api.node.update(node)
+    assert patch.call_count == 3
+    assert put.call_count == 3
+    assert stored[checkout['id']]['state'] == 'available'
+
+
+def test_patch_content_type(get_api_config, mocker):
+    """Test that JSON Patch operations are sent with their content type"""
+    # pylint: disable=protected-access
+    api = kernelci.api.get_api(next(iter(get_api_config.values())))
+    patch = mocker.patch('requests.Session.patch', return_value=_response({}))
+    ops = [{'op': 'replace', 'path': '/state', 'value': 'done'}]
+    api.node._patch('node/abc', ops)
+    assert patch.call_args.kwargs['headers']['Content-Type'] == \
+        'application/json-patch+json'
+    assert patch.call_args.kwargs['json'] == ops
+    api.user._patch('user/me', {'email': 'a@b.c'})
+    assert 'Content-Type' not in patch.call_args.kwargs['headers']
+
+
+def test_api_metrics(stream_server, tmp_path):
+    """Test the request metrics recorded per endpoint template"""
+    api = _get_stream_api(stream_server)
+    assert api.metrics is None
+    metrics = api.enable_metrics()
+    assert api.node.data.metrics is metrics
+    sub_id = api.subscribe('node')
+    stream_server.publish('hello')
+    assert api.receive_event(sub_id).data == 'hello'
+    api.pop_events('jobs', timeout=0)
+    try:
+        api.receive_event(sub_id + 1)
+    except requests.exceptions.HTTPError:
+        pass
+    offline = kernelci.api.get_api(
+        kernelci.config.api.API('offline', 'http://127.0.0.1:1', retries=0,
+                                batch_pop=True)
+    )
+    offline.enable_metrics(metrics)
+    try:
+        offline.pop_events('jobs', timeout=0)
+    except requests.exceptions.ConnectionError:
+        pass
+    stats = metrics.snapshot()
+    assert set(stats) == {
+        ('POST', 'subscribe/{name}'),
+        ('GET', 'listen/{id}'),
+        ('GET', 'pop/{name}'),
+    }
+    assert stats[('GET', 'listen/{id}')]['status'] == {'200': 1, '404': 1}
+    assert stats[('GET', 'pop/{name}')]['status'] == {'200': 1, 'error': 1}
+    assert stats[('GET', 'pop/{name}')]['response_bytes'] == 2
+    assert sum(stats[('POST', 'subscribe/{name}')]['latency_buckets']) == 1
+    assert metrics.template(
+        'node/6332d8f51a45d41c279e7a01?noevent=true'
+    ) == 'node/{id}'
+    assert metrics.template('kv/ns/some/key') == 'kv/ns/some/key'
+    path = str(tmp_path / 'api.prom')
+    metrics.dump(path)
+    with open(path, encoding='utf-8') as prom:
+        text = prom.read()
+    assert 'kernelci_api_requests_total{method="GET",endpoint="listen/{id}",'\
+        'status="404"} 1\n' in text
+    assert 'kernelci_api_request_duration_seconds_count{method="POST",'\
+        'endpoint="subscribe/{name}"} 1\n' in text
+    api.disable_metrics()
+    metrics.reset()
+    assert not metrics.snapshot()
+
+
+def test_api_metrics_limiter_retries(stream_server):
+    """Test the retries recorded when made by the request limiter"""
+    api = kernelci.api.get_api(kernelci.config.api.API(
+        'stream', stream_server.url, retries=2, backoff_factor=0,
+        max_concurrency=8
+    ))
+    metrics = api.enable_metrics()
+    sub_id = stream_server.subscribe('node')
+    # One 503 error then an empty stream
+    stream_server.stream_errors = 1
+    stream_server.drop_after = 0
+    assert api.node._get(  # pylint: disable=protected-access
+        f'stream/{sub_id}').status_code == 200
+    assert metrics.snapshot()[('GET', 'stream/{id}')]['retries'] == 1
+    api.close()
+
+
+def test_request_limiter():
+    """Test the token bucket and adaptive concurrency window"""
+    limiter = kernelci.api.limiter.RequestLimiter(max_concurrency=4)
+    assert limiter.window == 4
+    started = [limiter.acquire() for _ in range(4)]
+    assert limiter.in_flight == 4
+    stamps = []
+    blocked = threading.Thread(
+        target=lambda: stamps.append(limiter.acquire())
+    )
+    blocked.start()
+    blocked.join(0.1)
+    assert blocked.is_alive()
+    # Only the first error from requests started before the decrease counts
+    for stamp in started[:2]:
+        limiter.release(stamp, congested=True)
+    assert limiter.window == 2
+    limiter.release(started[2])
+    blocked.join(1)
+    assert not blocked.is_alive()
+    assert limiter.window == 2.5
+    assert limiter.in_flight == 2
+    limiter.release(stamps[0], congested=True)
+    assert limiter.window == 1.25
+    limiter.release(started[3])
+    assert limiter.window == 1.25 + 1 / 1.25
+    assert limiter.in_flight == 0
+    for _ in range(100):
+        limiter.release(limiter.acquire())
+    assert limiter.window == 4
+
+    limiter = kernelci.api.limiter.RequestLimiter(rate=50, burst=5)
+    start = time.monotonic()
+    for _ in range(15):
+        limiter.release(limiter.acquire())
+    assert 0.18 < time.monotonic() - start < 1
+    assert limiter.window == float('inf')
+
+
+def test_api_limiter_shared(stream_server):
+    """Test that the API requests to one server share a request limiter"""
+    config = kernelci.config.api.API(
+        'stream', stream_server.url, retries=0, max_concurrency=8
+    )
+    api = kernelci.api.get_api(config)
+    other = kernelci.api.get_api(config)
+    limiter = api.node.data.limiter
+    assert limiter is not None
+    assert other.node.data.limiter is limiter
+    assert _get_stream_api(stream_server).node.data.limiter is None
+    # Different limits for the same server get their own limiter
+    config = kernelci.config.api.API(
+        'stream', stream_server.url, retries=0, max_concurrency=2
+    )
+    separate = kernelci.api.get_api(config)
+    assert separate.node.data.limiter is not limiter
+    sub_id = api.subscribe('node')
+    try:
+        api.receive_event(sub_id + 1)
+    except requests.exceptions.HTTPError:
+        pass
+    assert limiter.window == 8
+    assert limiter.in_flight == 0
+    offline = kernelci.api.get_api(kernelci.config.api.API(
+        'offline', 'http://127.0.0.1:1', retries=0, rate_limit=100,
+        max_concurrency=8
+    ))
+    try:
+        offline.node.count({})
+    except requests.exceptions.ConnectionError:
+        pass
+    assert offline.node.data.limiter.window == 4
+    assert offline.node.data.limiter.in_flight == 0
+    for api_object in (api, other, separate, offline):
+        api_object.close()
+
+
+def test_api_limiter_long_poll(stream_server):
+    """Test that long-polling requests don't hold concurrency slots"""
+    stream_server.batch_pop = False
+    api = kernelci.api.get_api(kernelci.config.api.API(
+        'stream', stream_server.url, retries=0, max_concurrency=1
+    ))
+    limiter = api.node.data.limiter
+    events = queue.Queue()
+    thread = threading.Thread(
+        target=lambda: events.put(api.pop_event('jobs')), daemon=True
+    )
+    thread.start()
+    deadline = time.monotonic() + 5
+    while 'pop' not in stream_server.requests:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    # Not blocked by the pending long-poll with a window of 1
+    subscribe = threading.Thread(
+        target=lambda: events.put(api.subscribe('node')), daemon=True
+    )
+    subscribe.start()
+    assert events.get(timeout=5) == 1
+    assert limiter.in_flight == 0
+    stream_server.lists['jobs'].put('hello')
+    assert events.get(timeout=5).data == 'hello'
+    assert limiter.in_flight == 0
+    assert limiter.window == 1
+    api.close()
+
+
+def test_api_limiter_retries(stream_server, mocker):
+    """Test that every retried request goes through the request limiter"""
+    data = kernelci.api.get_api(kernelci.config.api.API(
+        'stream', stream_server.url, retries=2, backoff_factor=0,
+        max_concurrency=8)).node.data
+    acquire = mocker.spy(data.limiter, 'acquire')
+    url = f'{stream_server.url}latest/stream/{stream_server.subscribe("node")}'
+    stream_server.stream_errors = 3
+    with pytest.raises(requests.exceptions.RetryError):
+        data.session.get(url, stream=True, timeout=5)
+    assert acquire.call_count == 3 and not stream_server.stream_errors
+    data.session.get(url, stream=True, timeout=5).close()
+    data.close()
+    retry = kernelci.api.limiter.JitterRetry(backoff_factor=1, history=(
+        urllib3.util.retry.RequestHistory('GET', '/', None, 503, None),) * 3)
+    assert all(2 <= retry.get_backoff_time() <= 4 for _ in range(20))
+
+
+def test_api_limiter_retries_release(stream_server, mocker):
+    """Test that the connections aren't held during the retry delays"""
+    data = kernelci.api.get_api(kernelci.config.api.API(
+        'stream', stream_server.url, retries=2, backoff_factor=1,
+        max_concurrency=8)).node.data
+    url = f'{stream_server.url}latest/stream/{stream_server.subscribe("node")}'
+    pools = data._adapter.poolmanager.pools  # pylint: disable=protected-access
+    idle = []
+    mocker.patch('time.sleep', side_effect=lambda _: idle.append(all(
+        pools[key].pool.qsize() == pools[key].pool.maxsize
+        for key in pools.keys()
+    )))
+    stream_server.stream_errors = 2
+    data.session.get(url, stream=True, timeout=5).close()
+    assert idle and all(idle)
+    data.close()
+
+
+def test_node_get_coalesced(get_api_config, mocker):
+    """Test that concurrent requests for the same node are coalesced"""
+    api = kernelci.api.get_api(next(iter(get_api_config.values())))
+    checkout = APIHelperTestData().checkout_node
+    started = threading.Event()
+    release = threading.Event()
+
+    def _get(path):
+        started.set()
+        release.wait(5)
+        if path.endswith('missing'):
+            raise requests.exceptions.HTTPError(response=_response({}, 404))
+        return _response(checkout)
+
+    get = mocker.patch.object(api.node, '_get', side_effect=_get)
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        first = executor.submit(api.node.get, checkout['id'])
+        started.wait(5)
+        others = [
+            executor.submit(api.node.get, checkout['id']) for _ in range(7)
+        ]
+        while api.node.coalesced < 7:
+            time.sleep(0.01)
+        release.set()
+        nodes = [first.result()] + [other.result() for other in others]
+    assert get.call_count == 1
+    assert all(node == checkout for node in nodes)
+    assert len({id(node) for node in nodes}) == 8
+    assert api.node.stats() == {'requests': 1, 'coalesced': 7}
+
+    release.clear()
+    started.clear()
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(api.node.get, 'missing')]
+        started.wait(5)
+        futures.append(executor.submit(api.node.get, 'missing'))
+        while api.node.coalesced < 8:
+            time.sleep(0.01)
+        release.set()
+        for future in futures:
+            try:
+                future.result()
+                assert False
+            except requests.exceptions.HTTPError as exc:
+                assert exc.response.status_code == 404
+    assert api.node.stats() == {'requests': 2, 'coalesced': 8}
+
+
+def test_node_add_many_errors(get_api_config, mocker):
+    """Test that all the nodes are added even if some of them fail"""
+    api = kernelci.api.get_api(next(iter(get_api_config.values())))
+
+    def _add(node):
+        if node['name'] == 'bad':
+            raise requests.exceptions.HTTPError(response=_response({}, 422))
+        return dict(node, id=node['name'])
+
+    add = mocker.patch.object(api.node, 'add', side_effect=_add)
+    nodes = [{'name': name} for name in ('a', 'bad', 'c', 'd')]
+    added = api.node.add_many(nodes, return_exceptions=True)
+    assert add.call_count == 4
+    assert [node['id'] for node in added if isinstance(node, dict)] == \
+        ['a', 'c', 'd']
+    assert isinstance(added[1], requests.exceptions.HTTPError)
+    add.reset_mock()
+    with pytest.raises(requests.exceptions.HTTPError):
+        api.node.add_many(nodes)
+    assert add.call_count == 4
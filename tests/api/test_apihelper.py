@@ -7,8 +7,25 @@
 
 """ Test the APIHelper class """
 
+import json
+import queue
+import threading
+import time
+
+from cloudevents.http import CloudEvent
+import pytest
+import requests
+
+from kernelci.api.cache import NodeCache, SQLiteNodeCache
+from kernelci.api.events import EventFilter, EventMultiplexer
 from kernelci.api.helper import APIHelper
+from kernelci.api.writebehind import NodeUpdateQueue
+from kernelci.config.rules import RuleSet
+from kernelci.scheduler import SchedulerIndex
 import kernelci.api
+import kernelci.config.api
+import kernelci.config.job
+import kernelci.config.platform
 
 
 def test_apihelper():
@@ -95,3 +112,572 @@ def test_apihelper():
         "Reviewed-by: Alexandre Chartre \n"
         "Signed-off-by: Linus Torvalds "
     )
+
+
+def test_apihelper_node_cache(mocker):
+    """Test the node cache used when looking up ancestor nodes"""
+    parent = {
+        "id": "6332d8f51a45d41c279e7a01",
+        "parent": None,
+        "data": {"kernel_revision": {"tree": "mainline", "branch": "master"}},
+    }
+    node = {"id": "6332d92f1a45d41c279e7a06", "parent": parent["id"],
+            "data": {}}
+    configs = kernelci.config.load("tests/configs/api-configs.yaml")
+    api = kernelci.api.get_api(configs["api"]["docker-host"])
+    node_get = mocker.patch("kernelci.api.latest.LatestAPI.Node.get",
+                            return_value=parent)
+    cache = NodeCache(max_size=2, ttl=60)
+    apihelper = APIHelper(api, node_cache=cache)
+    rules = {"tree": ["mainline"], "arch": ["arm64"]}
+    for _ in range(3):
+        assert apihelper.should_create_node(rules, node)
+    assert node_get.call_count == 1
+    assert cache.stats() == {"hits": 5, "misses": 1}
+
+    mocker.patch("kernelci.api.latest.LatestAPI.Node.update",
+                 return_value=dict(parent, state="done"))
+    apihelper.update_node(dict(parent, state="done"))
+    assert apihelper.get_node(parent["id"])["state"] == "done"
+    assert node_get.call_count == 1
+
+    cache.put({"id": "a"})
+    cache.put({"id": "b"})
+    assert cache.get(parent["id"]) is None
+
+
+def test_sqlite_node_cache(tmp_path, mocker):
+    """Test the node cache stored in a SQLite database"""
+    path = str(tmp_path / "nodes.db")
+    cache = SQLiteNodeCache(path, max_size=2, ttl=60)
+    cache.put({"id": "a", "name": "checkout"})
+    shared = SQLiteNodeCache(path)
+    assert shared.get("a") == {"id": "a", "name": "checkout"}
+    cache.put({"id": "b"})
+    cache.put({"id": "c"})
+    assert cache.get("a") is None
+    cache.invalidate("b")
+    assert cache.get("b") is None
+    mocker.patch("time.time", return_value=time.time() + 61)
+    assert cache.get("c") is None
+    assert cache.stats() == {"hits": 0, "misses": 3}
+
+
+def test_apihelper_get_ancestors(mocker):
+    """Test resolving the chain of ancestors with a single query"""
+    checkout = {"id": "c0", "name": "checkout", "path": ["checkout"],
+                "parent": None, "treeid": "t1",
+                "data": {"kernel_revision": {"tree": "mainline",
+                                             "branch": "master"}}}
+    kbuild = {"id": "k0", "name": "kbuild-gcc", "parent": "c0",
+              "path": ["checkout", "kbuild-gcc"], "treeid": "t1",
+              "data": {"arch": "arm64"}}
+    node = {"id": "j0", "name": "baseline", "parent": "k0", "treeid": "t1",
+            "path": ["checkout", "kbuild-gcc", "baseline"], "data": {}}
+    configs = kernelci.config.load("tests/configs/api-configs.yaml")
+    api = kernelci.api.get_api(configs["api"]["docker-host"])
+    findfast = mocker.patch("kernelci.api.latest.LatestAPI.Node.findfast",
+                            return_value=[kbuild, checkout])
+    node_get = mocker.patch("kernelci.api.latest.LatestAPI.Node.get")
+    apihelper = APIHelper(api)
+    ancestors = apihelper.get_ancestors(node)
+    assert ancestors == [kbuild, checkout]
+    assert findfast.call_args.args[0] == {
+        "treeid": "t1", "name__re": "^(checkout|kbuild\\-gcc)$",
+    }
+    rules = {"tree": ["mainline"], "arch": ["arm64"]}
+    assert apihelper.should_create_node(rules, node, ancestors)
+    assert not apihelper.should_create_node({"arch": ["x86"]}, node,
+                                            ancestors)
+    assert node_get.call_count == 0
+
+    findfast.return_value = [kbuild]
+    node_get.return_value = checkout
+    assert apihelper.get_ancestors(node) == [kbuild, checkout]
+    assert node_get.call_count == 1
+
+    # Ancestors are only looked up when the input node has no answer
+    findfast.reset_mock()
+    job = kernelci.config.job.Job("baseline", "baseline.jinja2", kind="job",
+                                  rules={"arch": ["arm64"]})
+    mocker.patch("kernelci.api.latest.LatestAPI.Node.add",
+                 side_effect=lambda node: dict(node, id="j1"))
+    kbuild["data"]["kernel_revision"] = checkout["data"]["kernel_revision"]
+    assert apihelper.create_job_node(job, kbuild)["id"] == "j1"
+    assert not findfast.called
+    checkout["data"]["defconfig"] = "defconfig"
+    job = kernelci.config.job.Job("baseline", "baseline.jinja2", kind="job",
+                                  rules={"arch": ["arm64"],
+                                         "defconfig": ["defconfig"]})
+    findfast.return_value = [checkout]
+    assert apihelper.create_job_node(job, kbuild)["id"] == "j1"
+    assert findfast.call_count == 1
+
+
+def test_apihelper_create_job_nodes(mocker):
+    """Test creating job nodes for several platforms in one batch"""
+    kbuild = {
+        "id": "k0", "name": "kbuild-gcc", "parent": "c0", "treeid": "t1",
+        "path": ["checkout", "kbuild-gcc"],
+        "data": {
+            "arch": "x86_64",
+            "kernel_revision": {
+                "tree": "mainline", "branch": "master",
+                "version": {"version": 6, "patchlevel": 15},
+            },
+        },
+    }
+    job = kernelci.config.job.Job("baseline", "baseline.jinja2", kind="job")
+    platforms = [
+        kernelci.config.platform.Platform("qemu-x86"),
+        kernelci.config.platform.Platform("qemu-arm64",
+                                          rules={"arch": ["arm64"]}),
+        kernelci.config.platform.Platform("minnowboard"),
+    ]
+    configs = kernelci.config.load("tests/configs/api-configs.yaml")
+    api = kernelci.api.get_api(configs["api"]["docker-host"])
+    add_many = mocker.patch(
+        "kernelci.api.latest.LatestAPI.Node.add_many",
+        side_effect=lambda nodes, return_exceptions: [
+            dict(node, id=f"j{idx}") for idx, node in enumerate(nodes)
+        ]
+    )
+    findfast = mocker.patch("kernelci.api.latest.LatestAPI.Node.findfast",
+                            return_value=[{"id": "c0", "parent": None}])
+    apihelper = APIHelper(api)
+    nodes = apihelper.create_job_nodes(
+        job, kbuild, [(None, platform) for platform in platforms]
+    )
+    assert add_many.call_count == 1
+    # The rules are all answered by the input node
+    assert not findfast.called
+    assert [node and node["id"] for node in nodes] == ["j0", None, "j1"]
+    assert [node and node["data"]["platform"] for node in nodes] == [
+        "qemu-x86", None, "minnowboard"
+    ]
+    assert nodes[0]["path"] == ["checkout", "kbuild-gcc", "baseline"]
+
+    # The nodes created before a failure are passed with the error
+    error = requests.exceptions.HTTPError(response=mocker.Mock(
+        content=b'{"detail": "invalid"}'
+    ))
+    add_many.side_effect = lambda nodes, return_exceptions: [
+        dict(nodes[0], id="j0"), error
+    ]
+    with pytest.raises(RuntimeError) as exc_info:
+        apihelper.create_job_nodes(
+            job, kbuild, [(None, platform) for platform in platforms]
+        )
+    assert exc_info.value.args[0] == {"detail": "invalid"}
+    assert [node and node["id"] for node in exc_info.value.args[1]] == [
+        "j0", None, None
+    ]
+
+
+def test_apihelper_should_create_node_ruleset():
+    """Test that rules give the same results as dict and RuleSet objects"""
+    node = {
+        "id": "j0", "parent": None,
+        "data": {
+            "kernel_revision": {
+                "tree": "stable", "branch": "master",
+                "version": {"version": 6, "patchlevel": 6},
+            },
+            "fragments": ["kselftest", "lab-setup"],
+            "defconfig": "allnoconfig",
+        },
+    }
+    configs = kernelci.config.load("tests/configs/api-configs.yaml")
+    apihelper = APIHelper(kernelci.api.get_api(configs["api"]["docker-host"]))
+    cases = [
+        ({"tree": ["stable"]}, True),
+        ({"tree": ["linus:master", "stable"]}, True),
+        ({"tree": ["stable"], "branch": ["!stable:master"]}, False),
+        ({"tree": ["!stable:master"]}, False),
+        ({"tree": ["stable:master"], "branch": ["!master"]}, True),
+        ({"fragments": ["kselftest"]}, True),
+        ({"fragments": ["!lab-setup"]}, False),
+        ({"fragments": ["arm64-chromebook"]}, False),
+        ({"defconfig": ["!allnoconfig"]}, False),
+        ({"min_version": {"version": 6, "patchlevel": 7}}, False),
+        ({"max_version": {"version": 6, "patchlevel": 6}}, True),
+        ({"max_version": {"version": 6, "patchlevel": 1}}, False),
+        ({"min_version": None, "defconfig": ["allnoconfig"]}, True),
+    ]
+    for rules, expected in cases:
+        ruleset = RuleSet(rules)
+        assert apihelper.should_create_node(rules, node) is expected
+        assert apihelper.should_create_node(ruleset, node) is expected
+
+
+def test_scheduler_index():
+    """Test that the scheduler index only rules out rejected nodes"""
+    node = {
+        "id": "k0", "parent": None,
+        "data": {
+            "kernel_revision": {
+                "tree": "stable", "branch": "master",
+                "version": {"version": 6, "patchlevel": 6},
+            },
+            "fragments": ["kselftest", "lab-setup"],
+            "defconfig": "allnoconfig",
+        },
+    }
+    cases = [
+        ({"tree": ["stable"]}, True),
+        ({"tree": ["linus:master", "stable"]}, True),
+        ({"tree": ["!stable:master"]}, False),
+        ({"tree": ["mainline", "next"]}, False),
+        ({"branch": ["!master"]}, False),
+        ({"fragments": ["kselftest", "!arm64-chromebook"]}, True),
+        ({"fragments": ["!lab-setup"]}, False),
+        ({"fragments": ["arm64-chromebook"]}, False),
+        ({"defconfig": ["!allnoconfig"]}, False),
+        ({"arch": ["arm64"]}, True),
+        ({"min_version": {"version": 6, "patchlevel": 7}}, False),
+        ({"max_version": {"version": 6, "patchlevel": 6}}, True),
+    ]
+    index = SchedulerIndex(
+        (idx, (RuleSet(rules), None)) for idx, (rules, _) in enumerate(cases)
+    )
+    candidates = index.candidates(node)
+    configs = kernelci.config.load("tests/configs/api-configs.yaml")
+    apihelper = APIHelper(kernelci.api.get_api(configs["api"]["docker-host"]))
+    for idx, (rules, expected) in enumerate(cases):
+        assert apihelper.should_create_node(rules, node) is expected
+        if expected:
+            assert idx in candidates
+    # tree:branch combinations and missing fields aren't indexed
+    assert candidates == {0, 1, 2, 5, 9, 11}
+
+
+def test_apihelper_create_job_nodes_index(mocker):
+    """Test skipping job nodes ruled out by the scheduler index"""
+    kbuild = {
+        "id": "k0", "name": "kbuild-gcc", "parent": "c0", "treeid": "t1",
+        "path": ["checkout", "kbuild-gcc"],
+        "data": {
+            "arch": "x86_64",
+            "kernel_revision": {
+                "tree": "mainline", "branch": "master",
+                "version": {"version": 6, "patchlevel": 15},
+            },
+        },
+    }
+    job = kernelci.config.job.Job("baseline", "baseline.jinja2", kind="job")
+    platforms = {
+        "qemu-x86": kernelci.config.platform.Platform("qemu-x86"),
+        "qemu-arm64": kernelci.config.platform.Platform(
+            "qemu-arm64", rules={"arch": ["arm64"]}
+        ),
+    }
+    index = SchedulerIndex.from_configs({
+        "jobs": {"baseline": job}, "platforms": platforms,
+    })
+    assert index.candidates(kbuild) == {("baseline", "qemu-x86")}
+    configs = kernelci.config.load("tests/configs/api-configs.yaml")
+    api = kernelci.api.get_api(configs["api"]["docker-host"])
+    add = mocker.patch("kernelci.api.latest.LatestAPI.Node.add",
+                       side_effect=lambda node: dict(node, id="j0"))
+    apihelper = APIHelper(api, index=index)
+    should_create_node = mocker.spy(apihelper, "should_create_node")
+    assert apihelper.create_job_node(
+        job, kbuild, platform=platforms["qemu-arm64"]
+    ) is None
+    assert should_create_node.call_count == 0
+    node = apihelper.create_job_node(job, kbuild,
+                                     platform=platforms["qemu-x86"])
+    assert node["data"]["platform"] == "qemu-x86"
+    assert add.call_count == 1
+
+    # Candidates computed once per input node are used for each job
+    candidates = apihelper.get_index_candidates(kbuild)
+    index_candidates = mocker.spy(index, "candidates")
+    for platform in platforms.values():
+        apihelper.create_job_node(job, kbuild, platform=platform,
+                                  candidates=candidates)
+    assert index_candidates.call_count == 0
+    assert add.call_count == 2
+
+
+def test_event_filter():
+    """Test the compiled Pub/Sub event filters"""
+    filters = {
+        "op": "updated",
+        "state": ("done", "available"),
+        "data": {"arch": ("arm64", "x86_64"), "platform": "qemu"},
+    }
+    event_filter = EventFilter.compile(filters)
+    assert EventFilter.compile(dict(filters)) is event_filter
+    assert EventFilter.compile({}) is None
+    cases = [
+        ({"op": "updated", "state": "done"}, True),
+        ({"op": "created", "state": "done"}, False),
+        ({"state": "closing"}, False),
+        ({"state": ["done"]}, False),
+        ({"id": "1234"}, True),
+        ({"data": {"arch": "arm64", "platform": "qemu"}}, True),
+        ({"data": {"arch": "riscv"}}, False),
+        ({"data": {"platform": "rpi"}}, False),
+        ({"data": {"kernel_revision": {}}}, True),
+    ]
+    for event, expected in cases:
+        assert event_filter.match(event) is expected
+    unhashable = EventFilter.compile({"fragments": (["kselftest"], [])})
+    assert unhashable.match({"fragments": []})
+    assert not unhashable.match({"fragments": ["debug"]})
+    # Only the most recently used compiled filters are kept
+    for idx in range(EventFilter.MAX_CACHED):
+        EventFilter.compile({"id": str(idx)})
+        assert EventFilter.compile(dict(filters)) is event_filter
+    for idx in range(EventFilter.MAX_CACHED):
+        EventFilter.compile({"id": str(idx)})
+    assert EventFilter.compile(dict(filters)) is not event_filter
+
+
+def test_event_multiplexer(mocker):
+    """Test receiving events from several sources with a worker pool"""
+    api = kernelci.api.get_api(
+        kernelci.config.api.API('test', 'http://localhost:8001')
+    )
+    pending = {
+        1: [{'id': str(idx), 'state': 'done'} for idx in range(4)] +
+           [{'id': '4', 'state': 'running'}],
+        2: ['hello'],
+        'jobs': [{'job': idx} for idx in range(3)],
+    }
+
+    def _next(key):
+        if not pending[key]:
+            time.sleep(0.01)
+            return None
+        attributes = {'type': 'test', 'source': 'test'}
+        return CloudEvent(attributes=attributes, data=pending[key].pop(0))
+
+    def _pop_event(list_name):
+        event = _next(list_name)
+        if event is None:
+            raise requests.exceptions.ConnectionError()
+        return event
+
+    mocker.patch.object(api, 'subscribe', side_effect=[1, 2])
+    mocker.patch.object(api, 'receive_event',
+                        side_effect=lambda sub_id, block: _next(sub_id))
+    mocker.patch.object(api, 'pop_event', side_effect=_pop_event)
+    helper = APIHelper(api)
+    node_sub = helper.subscribe_filters({'state': 'done'})
+    other_sub = helper.subscribe_filters(channel='other')
+    received = queue.Queue()
+    mux = EventMultiplexer(helper, maxsize=2, retry_delay=0.01)
+    nodes = mux.add_subscription(node_sub)
+    assert mux.add_subscription(other_sub, received.put) is None
+    with mux:
+        jobs = mux.add_list('jobs')
+        assert received.get(timeout=5).data == 'hello'
+        time.sleep(0.1)
+        # Backpressure: only maxsize events are received until consumed
+        assert nodes.qsize() == 2 and len(pending[1]) == 3
+        assert [nodes.get(timeout=5).data['id'] for _ in range(4)] == [
+            '0', '1', '2', '3'
+        ]
+        assert [jobs.get(timeout=5).data['job'] for _ in range(3)] == [
+            0, 1, 2
+        ]
+    assert nodes.empty()
+    assert not mux.errors
+
+
+def test_event_multiplexer_blocking(mocker):
+    """Test that blocking sources don't starve the others or restart"""
+    api = kernelci.api.get_api(
+        kernelci.config.api.API('test', 'http://localhost:8001')
+    )
+    release = threading.Event()
+    calls = {}
+
+    def _pop_event(list_name):
+        calls[list_name] = calls.get(list_name, 0) + 1
+        if list_name != 'ready':
+            release.wait(5)
+        time.sleep(0.01)
+        return CloudEvent(attributes={'type': 'test', 'source': 'test'},
+                          data=list_name)
+
+    mocker.patch.object(api, 'pop_event', side_effect=_pop_event)
+    mux = EventMultiplexer(APIHelper(api), maxsize=1, retry_delay=0.01)
+    blocked = [mux.add_list(f'blocked-{idx}') for idx in range(8)]
+    ready = mux.add_list('ready')
+    with mux:
+        assert ready.get(timeout=5).data == 'ready'
+        mux.stop()
+        mux.start()
+        release.set()
+        # The events popped by the first run are delivered too
+        for idx, events in enumerate(blocked):
+            for _ in range(2):
+                assert events.get(timeout=5).data == f'blocked-{idx}'
+    threads = [thread for thread in threading.enumerate()
+               if thread.name.startswith('kci-events-')]
+    assert _wait_for(lambda: not any(thread.is_alive() for thread in threads))
+    # The threads from the first run stopped after their blocking call
+    assert all(2 <= calls[f'blocked-{idx}'] <= 3 for idx in range(8))
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_node_update_queue(tmp_path, mocker):
+    """Test the write-behind queue for node updates"""
+    api = kernelci.api.get_api(
+        kernelci.config.api.API('test', 'http://localhost:8001')
+    )
+    update = mocker.patch.object(
+        api.node, 'update', side_effect=requests.exceptions.ConnectionError
+    )
+    update_many = mocker.spy(api.node, 'update_many')
+    spool = tmp_path / 'updates.jsonl'
+    updates = NodeUpdateQueue(api, max_nodes=3, delay=60, retry_delay=0,
+                              spool_path=str(spool))
+    helper = APIHelper(api, update_queue=updates)
+    node = {'id': 'a', 'state': 'running'}
+    for state in ('running', 'closing', 'done'):
+        node['state'] = state
+        assert helper.update_node(node, noevent=state != 'closing') == node
+    helper.update_node({'id': 'b', 'state': 'done'})
+    assert updates.pending == 2
+    assert len(spool.read_text(encoding='utf-8').splitlines()) == 4
+    # API outage: the updates are kept in the queue and in the spool
+    assert not helper.flush_updates()
+    assert updates.pending == 2
+    assert update_many.call_count == 1
+    assert update.call_count == 2
+    assert len(spool.read_text(encoding='utf-8').splitlines()) == 2
+
+    # Restart: the updates are loaded from the spool but not counted
+    update.side_effect = None
+    with open(spool, 'a', encoding='utf-8') as spool_file:
+        spool_file.write(spool.read_text(encoding='utf-8').splitlines()[1])
+    updates = NodeUpdateQueue(api, max_nodes=3, delay=60,
+                              spool_path=str(spool))
+    assert updates.pending == 2
+    assert updates.stats()['updates'] == 0
+    assert updates.stats()['coalesced'] == 0
+    with updates:
+        updates.update({'id': 'c', 'state': 'done'})
+        # Flushed straight away as the queue is full
+        assert _wait_for(lambda: updates.pending == 0)
+    assert update_many.call_args.args == ([
+        {'id': 'a', 'state': 'done'},
+        {'id': 'b', 'state': 'done'},
+        {'id': 'c', 'state': 'done'},
+    ], False)
+    assert not spool.exists()
+    assert updates.stats() == {
+        'updates': 1, 'coalesced': 0, 'sent': 3, 'batches': 1
+    }
+
+    # Rejected updates are dropped, the others sent on time or on stop
+    update.side_effect = requests.exceptions.HTTPError(
+        response=mocker.Mock(status_code=422)
+    )
+    updates = NodeUpdateQueue(api, delay=0.05)
+    with updates:
+        updates.update({'id': 'd'})
+        assert _wait_for(lambda: updates.errors)
+        update.side_effect = None
+        updates.update({'id': 'e'}, noevent=True)
+    assert update.call_args.args == ({'id': 'e'}, True)
+    assert updates.pending == 0
+    assert [node['id'] for node, _ in updates.errors] == ['d']
+
+
+def test_node_update_queue_partial(mocker):
+    """Test that only the failed updates of a batch are retried or dropped"""
+    api = kernelci.api.get_api(
+        kernelci.config.api.API('test', 'http://localhost:8001')
+    )
+
+    def _update(node, _noevent):
+        status = {'b': 503, 'c': 422}.get(node['id'])
+        if status:
+            raise requests.exceptions.HTTPError(
+                response=mocker.Mock(status_code=status)
+            )
+        return node
+
+    update = mocker.patch.object(api.node, 'update', side_effect=_update)
+    updates = NodeUpdateQueue(api)
+    for node_id in 'abcd':
+        updates.update({'id': node_id})
+    assert not updates.flush()
+    assert sorted(call.args[0]['id'] for call in update.call_args_list) == \
+        ['a', 'b', 'c', 'd']
+    assert updates.pending == 1
+    assert [node['id'] for node, _ in updates.errors] == ['c']
+    update.side_effect = None
+    assert updates.flush()
+    assert update.call_args.args == ({'id': 'b'}, False)
+    assert updates.stats()['sent'] == 4
+
+
+def test_node_update_queue_exceptions(mocker):
+    """Test that unexpected exceptions don't lose updates or the thread"""
+    api = kernelci.api.get_api(
+        kernelci.config.api.API('test', 'http://localhost:8001')
+    )
+
+    def _update(node, _noevent):
+        if node['id'] == 'b':
+            raise KeyError('result')
+        return node
+
+    update = mocker.patch.object(api.node, 'update', side_effect=_update)
+    updates = NodeUpdateQueue(api, retry_delay=0)
+    for node_id in 'abc':
+        updates.update({'id': node_id})
+    assert updates.flush()
+    assert [node['id'] for node, _ in updates.errors] == ['b']
+    assert isinstance(updates.errors[0][1], KeyError)
+    assert updates.stats()['sent'] == 3
+
+    mocker.patch('traceback.print_exc')
+    update_many = mocker.patch.object(api.node, 'update_many',
+                                      side_effect=ValueError)
+    updates = NodeUpdateQueue(api, max_nodes=2, retry_delay=0.05)
+    with updates:
+        updates.update({'id': 'd'})
+        updates.update({'id': 'e'})
+        # Sent again after failing without stopping the thread
+        assert _wait_for(lambda: update_many.call_count >= 2)
+        update_many.side_effect = None
+        assert _wait_for(lambda: updates.pending == 0)
+    assert update_many.call_args.args == ([{'id': 'd'}, {'id': 'e'}], False)
+    with updates:
+        updates.update({'id': 'f'})
+    assert update.call_args.args == ({'id': 'f'}, False)
+
+
+def test_node_update_queue_noevent(tmp_path, mocker):
+    """Test that updates with non-boolean noevent values are sent"""
+    api = kernelci.api.get_api(
+        kernelci.config.api.API('test', 'http://localhost:8001')
+    )
+    update = mocker.patch.object(api.node, 'update')
+    update_many = mocker.patch.object(api.node, 'update_many')
+    spool = tmp_path / 'updates.jsonl'
+    spool.write_text(''.join(
+        json.dumps({'node': {'id': node_id}, 'noevent': noevent}) + '\n'
+        for node_id, noevent in (('a', 0), ('b', 1), ('c', None))
+    ), encoding='utf-8')
+    updates = NodeUpdateQueue(api, spool_path=str(spool))
+    updates.update({'id': 'd'}, noevent=0)
+    assert updates.flush()
+    assert update_many.call_args.args == ([{'id': 'a'}, {'id': 'c'},
+                                           {'id': 'd'}], False)
+    assert update.call_args.args == ({'id': 'b'}, True)
+    assert updates.stats()['sent'] == 4
+    assert not spool.exists()
@@ -0,0 +1,135 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Unit tests for the KernelCI API events"""
+
+import asyncio
+import queue
+import threading
+import time
+
+import pytest
+import requests
+
+import kernelci.api
+import kernelci.api.helper
+import kernelci.config.api
+
+
+def _get_stream_api(server):
+    config = kernelci.config.api.API('stream', server.url, retries=0,
+                                     batch_pop=True)
+    return kernelci.api.get_api(config)
+
+
+def test_event_stream(stream_server):
+    """Test receiving events with a single streaming connection"""
+    api = _get_stream_api(stream_server)
+    stream = api.subscribe_stream('node')
+    stream.subscribe()
+    for data in ('a', 'b', 'c'):
+        stream_server.publish(data)
+    events = iter(stream)
+    assert [next(events).data for _ in range(3)] == ['a', 'b', 'c']
+    assert stream.streaming
+    assert stream_server.requests == ['stream']
+    stream.close()
+    assert not stream_server.subs
+
+    async def _receive():
+        receiver = await stream.queue(maxsize=1)
+        while not stream_server.subs:
+            await asyncio.sleep(0.01)
+        stream_server.publish('d')
+        return (await receiver.get()).data
+
+    stream = api.subscribe_stream('node')
+    assert asyncio.run(_receive()) == 'd'
+    stream.close()
+
+
+def test_event_stream_reconnect(stream_server):
+    """Test that a dropped stream is reconnected and resubscribed"""
+    api = _get_stream_api(stream_server)
+    stream_server.drop_after = 2
+    with api.subscribe_stream('node') as stream:
+        stream.subscribe()
+        for data in range(5):
+            stream_server.publish(data)
+        events = iter(stream)
+        assert [next(events).data for _ in range(5)] == list(range(5))
+        assert stream.reconnects == 2
+        assert stream.sub_id == 1
+
+        def _publish():
+            while not stream_server.subs:
+                time.sleep(0.01)
+            stream_server.publish('new')
+
+        stream_server.subs.clear()
+        thread = threading.Thread(target=_publish)
+        thread.start()
+        assert next(events).data == 'new'
+        thread.join()
+        assert stream.sub_id == 2
+
+
+def test_event_stream_server_errors(stream_server):
+    """Test that a stream is reconnected after server errors"""
+    # Default retry strategy with 5xx errors retried by urllib3
+    api = kernelci.api.get_api(
+        kernelci.config.api.API('stream', stream_server.url)
+    )
+    stream_server.stream_errors = 2
+    with api.subscribe_stream('node') as stream:
+        stream.subscribe()
+        stream_server.publish('a')
+        start = time.monotonic()
+        assert next(iter(stream)).data == 'a'
+        assert time.monotonic() - start < 5
+        assert stream.streaming
+        assert stream.reconnects == 2
+        assert stream_server.requests == ['stream'] * 3
+
+
+def test_event_stream_fallback(stream_server):
+    """Test receiving events without the streaming endpoint"""
+    api = _get_stream_api(stream_server)
+    stream_server.streaming = False
+    with api.subscribe_stream('node') as stream:
+        stream.subscribe()
+        stream_server.publish('a')
+        assert next(iter(stream)).data == 'a'
+        assert not stream.streaming
+        assert stream_server.requests[0] == 'stream'
+        assert set(stream_server.requests[1:]) == {'listen'}
+
+
+def test_pop_events(stream_server):
+    """Test popping batches of events from a Redis list"""
+    api = _get_stream_api(stream_server)
+    helper = kernelci.api.helper.APIHelper(api)
+    jobs = stream_server.lists.setdefault('jobs', queue.Queue())
+    for idx in range(5):
+        jobs.put({'job': idx})
+    events = api.pop_events('jobs', max_items=3, timeout=1)
+    assert [event.data['job'] for event in events] == [0, 1, 2]
+    assert helper.pop_events_data('jobs', 3, 1) == [{'job': 3}, {'job': 4}]
+    assert not api.pop_events('jobs', timeout=0.1)
+    assert stream_server.requests == ['pop'] * 3
+    stream_server.batch_pop = False
+    jobs.put('single')
+    helper = kernelci.api.helper.APIHelper(kernelci.api.get_api(
+        kernelci.config.api.API('stream', stream_server.url, timeout=0.1,
+                                retries=5, backoff_factor=0)
+    ))
+    assert helper.pop_events_data('jobs', 3) == ['single']
+    with pytest.raises(ValueError):
+        helper.pop_events_data('jobs', 3, 0.1)
+    assert stream_server.requests == ['pop'] * 4
+    # A request without any response is not sent again
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        helper.pop_events_data('jobs', 3)
+    assert stream_server.requests == ['pop'] * 5
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        helper.pop_event_data('jobs')
+    assert stream_server.requests == ['pop'] * 6
@@ -15,9 +15,11 @@
 # For the test classes with only one test case...
 # pylint: disable=too-few-public-methods
 
+import pytest
 import yaml
 
 import kernelci.config
+import kernelci.config.rules
 import kernelci.legacy.config.build
 
 # -----------------------------------------------------------------------------
@@ -269,3 +271,67 @@ class TestSchedulerConfigs(ConfigTest):
                 kunit_job = entry
         assert kunit_job is not None
         assert kunit_job['runtime']['name'] == 'k8s-gke-eu-west4'
+
+    def test_scheduler_strategy(self):
+        """Test the runtime selection strategy of scheduler entries"""
+        ref_data, config = self._load_config('tests/configs/scheduler.yaml')
+        scheduler_config = self._reload(ref_data, config, 'scheduler')
+        entries = {entry['job']: entry for entry in scheduler_config}
+        arm64_runtime = entries['baseline-arm64']['runtime']
+        assert arm64_runtime['strategy'] == 'least-jobs'
+        assert arm64_runtime['weights'] == {'lab-collabora': 2}
+
+    def test_scheduler_rulesets(self):
+        """Test the rules compiled when loading the scheduler configs"""
+        config = kernelci.config.load('tests/configs/scheduler.yaml')
+        entries = {entry.job: entry for entry in config['scheduler']}
+        assert entries['kunit'].ruleset is None
+        ruleset = entries['baseline-x86'].ruleset
+        assert isinstance(ruleset, kernelci.config.rules.RuleSet)
+        assert ruleset.rules == entries['baseline-x86'].rules
+        (key, tree_rule), = ruleset.tree_branch
+        assert key == 'tree'
+        assert tree_rule.allow == {'mainline'}
+        assert tree_rule.deny == {'next'}
+
+
+class TestRuleSet:
+    """Tests for the compiled rules"""
+
+    def test_ruleset(self):
+        """Test compiling a rules dictionary into a RuleSet"""
+        rules = {
+            'min_version': {'version': 6, 'patchlevel': 1},
+            'tree': ['linus:master', 'stable', '!next'],
+            'branch': ['!stable:master'],
+            'fragments': ['kselftest', '!arm64-chromebook'],
+        }
+        ruleset = kernelci.config.rules.RuleSet.compile(rules)
+        assert kernelci.config.rules.RuleSet.compile(ruleset) is ruleset
+        assert kernelci.config.rules.RuleSet.compile(None) is None
+        tree_branch = dict(ruleset.tree_branch)
+        assert tree_branch['tree'].allow == {'stable'}
+        assert tree_branch['tree'].allow_combos == {('linus', 'master')}
+        assert tree_branch['tree'].deny == {'next'}
+        assert tree_branch['branch'].deny_combos == {('stable', 'master')}
+        checks = dict(ruleset.checks)
+        assert checks['min_version'].bound == (6, 1)
+        assert checks['fragments'].allow == {'kselftest'}
+        assert checks['fragments'].deny == {'arm64-chromebook'}
+        with pytest.raises(AttributeError):
+            ruleset._checks = ()
+        # Read-only mapping over the original rules
+        assert ruleset == rules
+        assert ruleset['tree'] == rules['tree']
+        assert ruleset.get('arch') is None
+        assert list(ruleset) == list(rules)
+        assert not kernelci.config.rules.RuleSet({})
+        with pytest.raises(TypeError):
+            ruleset['arch'] = ['arm64']
+
+    def test_ruleset_null_version(self):
+        """Test that null version rules are ignored"""
+        rules = {'min_version': None, 'max_version': {}, 'arch': ['arm64']}
+        ruleset = kernelci.config.rules.RuleSet.compile(rules)
+        assert [key for key, _ in ruleset.checks] == ['arch']
+        assert kernelci.config.rules.RuleSet.compile({'min_version': None})
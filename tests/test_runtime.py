@@ -12,7 +12,10 @@
 # implementation.
 # pylint: disable=protected-access
 
+import kubernetes
+
 import kernelci.config
+import kernelci.config.runtime
 import kernelci.runtime
 
 
@@ -66,3 +69,56 @@ def test_lava_priority_scale():
             spec_priority = int(priority)
             print(f"* {plan_name:12s} {lab_priority:3d} {spec_priority:3d}")
             assert lab_priority == spec_priority
+
+
+def test_kubernetes_get_load(mocker):
+    """Test getting the Kubernetes load without changing the context"""
+    config = kernelci.config.load('tests/configs/runtimes.yaml')
+    runtime_config = config['runtimes']['k8s-gke-eu-west4']
+    runtime = kernelci.runtime.get_runtime(runtime_config)
+    new_client = mocker.patch('kubernetes.config.new_client_from_config')
+    load_config = mocker.patch('kubernetes.config.load_kube_config')
+    core_v1 = mocker.patch('kubernetes.client.CoreV1Api')
+    pods = [mocker.Mock(status=mocker.Mock(phase=phase))
+            for phase in ('Pending', 'Running', 'Pending')]
+    core_v1.return_value.list_namespaced_pod.return_value.items = pods
+    assert runtime.get_load() == {'queued': 2}
+    assert runtime.get_load() == {'queued': 2}
+    new_client.assert_called_once_with(context=runtime_config.context)
+    core_v1.assert_called_with(new_client.return_value)
+    assert not load_config.called
+    # The client is created again with the new credentials after a 401
+    list_pods = core_v1.return_value.list_namespaced_pod
+    list_pods.side_effect = [
+        kubernetes.client.rest.ApiException(status=401),
+        list_pods.return_value,
+    ]
+    assert runtime.get_load() == {'queued': 2}
+    assert new_client.call_count == 2
+    list_pods.side_effect = None
+    assert runtime.get_load() == {'queued': 2}
+    assert new_client.call_count == 2
+
+
+def test_kubernetes_get_load_errors(mocker):
+    """Test that the Kubernetes contexts which can't be reached are skipped"""
+    runtime_config = kernelci.config.runtime.RuntimeKubernetes(
+        name='k8s', lab_type='kubernetes', context=['ctx-a', 'ctx-b']
+    )
+    runtime = kernelci.runtime.get_runtime(runtime_config)
+    failing, working = mocker.Mock(), mocker.Mock()
+    # Use the context names as clients to get each context's CoreV1Api
+    mocker.patch('kubernetes.config.new_client_from_config',
+                 side_effect=lambda context: context)
+    mocker.patch('kubernetes.client.CoreV1Api',
+                 side_effect={'ctx-a': failing, 'ctx-b': working}.get)
+    failing.list_namespaced_pod.side_effect = \
+        kubernetes.client.rest.ApiException(status=500)
+    working.list_namespaced_pod.return_value.items = [
+        mocker.Mock(status=mocker.Mock(phase='Pending'))
+    ]
+    assert runtime.get_load() == {'queued': 1}
+    assert failing.list_namespaced_pod.call_count == 3
+    working.list_namespaced_pod.side_effect = \
+        kubernetes.client.rest.ApiException(status=500)
+    assert runtime.get_load() is None
@@ -0,0 +1,142 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Unit tests for the KernelCI pipeline scheduler"""
+
+import types
+
+import pytest
+
+import kernelci.config
+from kernelci.config.job import Job
+from kernelci.config.platform import Platform
+from kernelci.config.runtime import RuntimeLAVA
+from kernelci.config.scheduler import SchedulerEntry
+from kernelci.scheduler import Scheduler
+
+
+def _scan(entries, event, channel):
+    """Reference implementation with a linear scan of all the entries"""
+    for entry in entries:
+        criteria = entry.event
+        if criteria.pop('channel', None) == channel and \
+           criteria.items() <= event.items():
+            yield entry
+
+
+def test_scheduler_get_configs():
+    """Test that indexed event matching is the same as a linear scan"""
+    configs = kernelci.config.load('tests/configs/scheduler.yaml')
+    entries = configs['scheduler'] + [
+        SchedulerEntry('tast', {'type': 'lava'}, {
+            'channel': 'node', 'kind': 'kbuild', 'state': 'done',
+        }),
+        SchedulerEntry('kselftest', {'type': 'lava'}, {
+            'channel': 'node', 'kind': 'kbuild', 'state': 'done',
+            'result': 'pass', 'data': {'arch': 'arm64'},
+        }),
+        SchedulerEntry('timeout', {'type': 'shell'}, {
+            'channel': 'node', 'state': 'available',
+        }),
+        SchedulerEntry('any', {'type': 'shell'}, {'channel': 'node'}),
+        SchedulerEntry('other', {'type': 'shell'}, {
+            'channel': 'test', 'name': 'kbuild-gcc-10-x86',
+        }),
+    ]
+    scheduler = Scheduler({
+        'scheduler': entries, 'jobs': {}, 'platforms': {},
+    }, {})
+    events = [
+        {'name': 'kbuild-gcc-10-x86', 'kind': 'kbuild', 'result': 'pass',
+         'state': 'done', 'data': {'arch': 'arm64'}},
+        {'name': 'kbuild-gcc-10-x86', 'kind': 'kbuild', 'result': 'fail',
+         'state': 'done'},
+        {'name': 'checkout', 'kind': 'checkout', 'state': 'available'},
+        {'name': 'checkout', 'event': 'node', 'result': 'pass'},
+        {'id': '1234'},
+    ]
+    for event in events:
+        for channel in ('node', 'test', None):
+            expected = list(_scan(entries, event, channel))
+            assert list(scheduler.get_configs(event, channel)) == expected
+    assert [entry.job for entry in scheduler.get_configs(events[0])] == [
+        'baseline-x86', 'tast', 'kselftest', 'any'
+    ]
+    assert not list(scheduler.get_configs(['not', 'a', 'dict']))
+
+
+def _get_lava_runtimes(names):
+    """Get some runtime stand-ins with LAVA configs"""
+    return {
+        name: types.SimpleNamespace(config=RuntimeLAVA(
+            name=name, lab_type='lava', url=f'https://{name}.example.org'
+        ))
+        for name in names
+    }
+
+
+def _get_scheduler(runtime_params, runtimes):
+    """Get a Scheduler with a single entry for a given runtime type"""
+    entry = SchedulerEntry('baseline', runtime_params, {
+        'channel': 'node', 'name': 'kbuild',
+    }, platforms=['qemu'])
+    return Scheduler({
+        'scheduler': [entry],
+        'jobs': {'baseline': Job('baseline', 'baseline.jinja2')},
+        'platforms': {'qemu': Platform('qemu')},
+    }, runtimes)
+
+
+def _select(scheduler, count, created=True):
+    """Get the names of the runtimes selected for some events"""
+    names = []
+    for _ in range(count):
+        for _, runtime, _, _ in scheduler.get_schedule({'name': 'kbuild'}):
+            if created:
+                scheduler.job_created(runtime)
+            names.append(runtime.config.name)
+    return names
+
+
+def test_scheduler_runtime_strategies():
+    """Test the runtime selection strategies"""
+    runtimes = _get_lava_runtimes(['lab-a', 'lab-b', 'lab-c'])
+    scheduler = _get_scheduler({
+        'type': 'lava', 'strategy': 'round-robin',
+        'weights': {'lab-a': 2, 'lab-c': 0},
+    }, runtimes)
+    assert _select(scheduler, 6) == ['lab-a', 'lab-b', 'lab-a'] * 2
+
+    scheduler = _get_scheduler({
+        'type': 'lava', 'strategy': 'least-jobs',
+    }, runtimes)
+    scheduler.load.report('lab-a', queued=3)
+    scheduler.load.report('lab-b', queued=1)
+    scheduler.load.report('lab-c', queued=5)
+    assert _select(scheduler, 2) == ['lab-b', 'lab-b']
+    assert scheduler.load.jobs('lab-b') == 3
+    # Jobs rejected by the rules are not counted
+    _select(scheduler, 1, created=False)
+    assert [scheduler.load.jobs(name) for name in runtimes] == [3, 3, 5]
+
+    scheduler = _get_scheduler({
+        'type': 'lava', 'strategy': 'latency',
+    }, runtimes)
+    scheduler.load.report('lab-a', latency=30.0)
+    scheduler.load.report('lab-b', latency=5.0)
+    scheduler.load.report('lab-c', latency=60.0)
+    assert _select(scheduler, 2) == ['lab-b', 'lab-b']
+
+    with pytest.raises(ValueError):
+        _get_scheduler({'type': 'lava', 'strategy': 'fastest'}, runtimes)
+
+
+def test_scheduler_update_load():
+    """Test updating the load counters reported by the runtimes"""
+    runtimes = _get_lava_runtimes(['lab-a', 'lab-b'])
+    runtimes['lab-a'].get_load = lambda: {'queued': 7, 'latency': 12.5}
+    runtimes['lab-b'].get_load = lambda: None
+    scheduler = _get_scheduler({'type': 'lava'}, runtimes)
+    scheduler.update_load()
+    assert scheduler.load.jobs('lab-a') == 7
+    assert scheduler.load.latency('lab-a') == 12.5
+    assert scheduler.load.latency('lab-b') is None